@@ -0,0 +1,56 @@
+"""
+Benchmark importing the session classes and constructing sessions.
+
+Imports are timed in a fresh interpreter, with and without paramiko
+loaded. Construction time and memory are measured for COUNT sessions,
+as built (the SSH client is created on open()) and with an SSH client
+created for each one, as sessions used to do.
+
+Usage: python benchmarks/bench_construct.py [count]
+"""
+import subprocess
+import sys
+import time
+import tracemalloc
+
+IMPORT = ('import sys, time; start = time.time(); import %s; '
+          'print("%%.1f %%s" %% ((time.time() - start) * 1000, "paramiko" in sys.modules))')
+
+
+def bench_import(module):
+    output = subprocess.check_output([sys.executable, '-c', IMPORT % module])
+    elapsed, loaded = output.decode().split()
+    print('import %-22s %8s ms  paramiko loaded: %s' % (module, elapsed, loaded))
+
+
+def eager(session):
+    session.client = session._new_client()
+    return session
+
+
+def bench_construct(name, count, factory):
+    from pss1830ssh.pss1830cli import PSS1830Cli
+    start = time.time()
+    sessions = [factory(PSS1830Cli('10.0.%d.%d' % (i // 256, i % 256), 22, 'admin', 'admin'))
+                for i in range(count)]
+    elapsed = time.time() - start
+    del sessions
+    tracemalloc.start()
+    sessions = [factory(PSS1830Cli('10.0.%d.%d' % (i // 256, i % 256), 22, 'admin', 'admin'))
+                for i in range(count)]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('%-8s %6d sessions %8.3f s %8.1f us each %8.0f bytes each' % (
+        name, len(sessions), elapsed, elapsed / count * 1e6, size / count))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    bench_import('pss1830ssh.pss1830cli')
+    bench_import('paramiko')
+    bench_construct('lazy', count, lambda session: session)
+    bench_construct('eager', count, eager)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Benchmark memory and throughput of concurrent large outputs.
+
+Several sessions read `show big` at once from a fake NE served by another
+process, so that only the client's memory is traced. Each consumer is
+either fast (drops the chunks) or slow (takes the time to write them at
+a given rate). Compares draining all that is ready on each read, the
+default read sizes, and a smaller SSH window, high-water mark and kept
+tail of the output.
+
+Usage: python benchmarks/bench_flow.py [sessions] [output_mb] [consumer_mb_s]
+"""
+import multiprocessing
+import sys
+import threading
+import time
+import tracemalloc
+
+from pss1830ssh.pss1830cli import PSS1830Cli
+from pss1830ssh.pss1830fake import FakeNE
+from pss1830ssh.pss1830metrics import Metrics
+
+CONFIGS = [
+    ('drain', dict(max_buffered=10**9)),
+    ('default', dict()),
+    ('256k bounds', dict(window_size=262144, max_buffered=262144, partial_size=262144)),
+]
+
+
+def serve(output_size, ports):
+    with FakeNE(output_size=output_size) as ne:
+        ports.put(ne.port)
+        while True:
+            time.sleep(60)
+
+
+def consume(cli, rate):
+    for chunk in cli.execute_raw('show big'):
+        if rate:
+            time.sleep(len(chunk) / rate)
+
+
+def measure(name, port, sessions, rate, settings):
+    metrics = Metrics()
+    clis = []
+    for _ in range(sessions):
+        cli = PSS1830Cli('127.0.0.1', port, 'admin', 'admin')
+        for key, value in settings.items():
+            setattr(cli, key, value)
+        cli.metrics = metrics
+        cli.open()
+        clis.append(cli)
+    tracemalloc.start()
+    start = time.time()
+    threads = [threading.Thread(target=consume, args=(cli, rate)) for cli in clis]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for cli in clis:
+        cli.close()
+    stalls = metrics.registry.counter(
+        'pss1830_command_stalls_total', host='127.0.0.1', command='show big').value
+    print('%-12s %8.3f s  peak %7.1f MB  %7.1f MB per session  %4d stalls' % (
+        name, elapsed, peak / 1e6, peak / 1e6 / sessions, stalls))
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    output_size = int(float(sys.argv[2]) * 10**6) if len(sys.argv) > 2 else 10 * 10**6
+    rates = [None, float(sys.argv[3]) * 10**6 if len(sys.argv) > 3 else 2 * 10**6]
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(output_size, ports))
+    server.daemon = True
+    server.start()
+    port = ports.get()
+    try:
+        for rate in rates:
+            print('%s consumers' % ('fast' if rate is None else '%.0f MB/s' % (rate / 1e6)))
+            for name, settings in CONFIGS:
+                measure(name, port, sessions, rate, settings)
+    finally:
+        server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark the streaming parsers over a large `show card inv *` output.
+
+Compares parse() fed with 64 KiB chunks against joining the whole output
+and running a regex over it, the way ad-hoc consumers do.
+
+Usage: python benchmarks/bench_parse.py [rows]
+"""
+import re
+import sys
+import time
+import tracemalloc
+
+from pss1830ssh.pss1830parse import parse
+
+HEADER = ('show card inv *\r\n'
+          'Location  Card Type  Part Number    Serial Number\r\n'
+          '--------  ---------  -------------  -------------\r\n')
+ROW = '%-8s  11STAR1    3KC12345BBBB   ZZ%010d\r\n'
+ROW_RE = re.compile(r'^(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\r?$', re.MULTILINE)
+
+
+def chunks(rows, size=65536):
+    """Generate the output in chunks, as execute() does."""
+    buf = HEADER
+    for index in range(rows):
+        buf += ROW % ('%d/%d' % (index // 32 + 1, index % 32 + 1), index)
+        if len(buf) >= size:
+            yield buf
+            buf = ''
+    yield buf + '\r\nNE1# '
+
+
+def run_streaming(rows):
+    return sum(1 for _ in parse('show card inv *', chunks(rows)))
+
+
+def run_joined(rows):
+    output = ''.join(chunks(rows))
+    return sum(1 for _ in ROW_RE.finditer(output)) - 1
+
+
+def measure(name, rows, func):
+    start = time.time()
+    records = func(rows)
+    elapsed = time.time() - start
+    tracemalloc.start()
+    func(rows)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('%-10s %9d records %8.3f s %10.0f records/s  peak %7.1f MB' % (
+        name, records, elapsed, records / elapsed, peak / 1e6))
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    measure('streaming', rows, run_streaming)
+    measure('joined', rows, run_joined)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Benchmark polling a fake NE several times, from scratch and with Poller.
+
+From scratch, every cycle logs in again and ships the whole output, as
+FleetRunner does. Poller keeps the sessions open and ships only the
+changed lines, which for a static output is nothing after the first
+cycle.
+
+Usage: python benchmarks/bench_poll.py [nes] [cycles] [latency_ms]
+"""
+import contextlib
+import sys
+import time
+
+from pss1830ssh.pss1830fake import FakeNE
+from pss1830ssh.pss1830fleet import FleetRunner, NE
+from pss1830ssh.pss1830poll import Poller
+
+COMMANDS = ['show card inv *', 'show version']
+
+
+def report(name, seconds, logins, shipped):
+    print('%-12s %8.3f s %6d logins %8d lines or records shipped' % (name, seconds, logins, shipped))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    cycles = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    latency = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else 0.005
+    with contextlib.ExitStack() as stack:
+        servers = [stack.enter_context(FakeNE(latency=latency, login_delay=latency * 10))
+                   for _ in range(count)]
+        nes = [NE('127.0.0.1', server.port, 'admin', 'admin') for server in servers]
+        runner = FleetRunner(workers=count, per_host=count, retries=0)
+        start = time.time()
+        shipped = 0
+        for _ in range(cycles):
+            for result in runner.run(nes, COMMANDS):
+                shipped += sum(output.count('\n') for _, output in result.outputs)
+        report('from scratch', time.time() - start, count * cycles, shipped)
+
+        poller = Poller(nes, COMMANDS, interval=0, spread=0, workers=count)
+        start = time.time()
+        shipped = 0
+        for change in poller.run(cycles=cycles):
+            shipped += len(change.added) + len(change.removed)
+        report('Poller', time.time() - start, poller.pool.misses, shipped)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark the receive path against a large synthetic output.
+
+Feeds a fake channel with SIZE bytes of `show`-like output followed by a
+prompt and compares the legacy 1024-byte string concatenation with the
+bytearray based receive path (text and raw). The legacy loop is
+quadratic, so it is capped at LEGACY_MAX bytes.
+
+Usage: python benchmarks/bench_recv.py [size_mb]
+"""
+import sys
+import time
+import tracemalloc
+
+from pss1830ssh.pss1830 import PSS1830
+
+PROMPT = 'bench#'
+LEGACY_MAX = 5 * 10**6
+LINE = b'1/1/1   11STAR1   3KC12345ABCD   BA   ZZ1234567890   Yes\r\n'
+
+
+class FakeChannel(object):
+    """Channel returning a fixed payload as fast as it is read."""
+
+    def __init__(self, size):
+        self.payload = LINE * (size // len(LINE)) + ('\r\n%s ' % PROMPT).encode()
+        self.offset = 0
+
+    def recv_ready(self):
+        return self.offset < len(self.payload)
+
+    def recv(self, nbytes):
+        data = self.payload[self.offset:self.offset + nbytes]
+        self.offset += len(data)
+        return data
+
+    def sendall(self, data):
+        pass
+
+
+def legacy_recv(channel):
+    """The receive loop as it was: 1024-byte reads into a str."""
+    data = ''
+    while channel.recv_ready():
+        new_data = channel.recv(1024)
+        if new_data:
+            data += new_data.decode('utf-8')
+    return data
+
+
+def make_session(size):
+    pss = PSS1830('localhost', 22, 'bench', 'bench')
+    pss.channel = FakeChannel(size)
+    pss.connected = True
+    pss.prompt = PROMPT
+    return pss
+
+
+def measure(name, size, func):
+    tracemalloc.start()
+    start = time.time()
+    nbytes = func(size)
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('%-8s %6.1f MB %8.3f s %8.1f MB/s  peak %7.1f MB' % (
+        name, nbytes / 1e6, elapsed, nbytes / elapsed / 1e6, peak / 1e6))
+
+
+def run_legacy(size):
+    return len(legacy_recv(FakeChannel(size)))
+
+
+def run_text(size):
+    return sum(len(d) for d in make_session(size).execute('show'))
+
+
+def run_raw(size):
+    return sum(len(d) for d in make_session(size).execute_raw('show'))
+
+
+def main():
+    size = int(float(sys.argv[1]) * 1e6) if len(sys.argv) > 1 else 50 * 10**6
+    print('payload: %.1f MB' % (size / 1e6))
+    measure('legacy', min(size, LEGACY_MAX), run_legacy)
+    measure('text', size, run_text)
+    measure('raw', size, run_raw)
+
+
+if __name__ == '__main__':
+    main()
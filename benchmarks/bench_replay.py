@@ -0,0 +1,66 @@
+"""
+Benchmark the receive path offline, replaying a captured session.
+
+Records a session running `show big` on a fake NE, then replays it as
+fast as possible, so that only the client's receiving, prompt matching,
+decoding and line splitting are measured, without SSH or the network.
+
+Usage: python benchmarks/bench_replay.py [output_mb] [runs]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from pss1830ssh.pss1830cli import PSS1830Cli
+from pss1830ssh.pss1830fake import FakeNE
+from pss1830ssh.pss1830parse import iter_lines
+from pss1830ssh.pss1830replay import Capture, ReplayClient
+
+COMMAND = 'show big'
+
+
+def raw(cli):
+    return sum(len(data) for data in cli.execute_raw(COMMAND))
+
+
+def text(cli):
+    return sum(len(data) for data in cli.execute(COMMAND))
+
+
+def lines(cli):
+    return sum(1 for _ in iter_lines(cli.execute(COMMAND)))
+
+
+def main():
+    output_size = int(float(sys.argv[1]) * 10**6) if len(sys.argv) > 1 else 20 * 10**6
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    path = os.path.join(tempfile.mkdtemp(), 'bench.cap.gz')
+    with FakeNE(output_size=output_size) as ne, Capture(path) as capture:
+        cli = PSS1830Cli('127.0.0.1', ne.port, 'admin', 'admin')
+        cli.capture = capture
+        cli.open()
+        start = time.time()
+        for _ in range(runs):
+            raw(cli)
+        live = (time.time() - start) / runs
+        cli.close()
+    print('%-6s %8.3f s %8.1f MB/s' % ('live', live, output_size / live / 1e6))
+    try:
+        for name, func in [('raw', raw), ('text', text), ('lines', lines)]:
+            cli = PSS1830Cli('127.0.0.1', 22, 'admin', 'admin')
+            cli.client = ReplayClient(path, speed=None)
+            cli.open()
+            start = time.time()
+            for _ in range(runs):
+                func(cli)
+            elapsed = (time.time() - start) / runs
+            cli.close()
+            print('%-6s %8.3f s %8.1f MB/s' % (name, elapsed, output_size / elapsed / 1e6))
+    finally:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+
+
+if __name__ == '__main__':
+    main()
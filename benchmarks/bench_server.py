@@ -0,0 +1,129 @@
+"""
+End-to-end benchmarks against the local fake NE (pss1830fake).
+
+Measures the CLI login latency, commands per second (one by one and with
+execute_many), the throughput of a large output, how FleetRunner
+scales with its number of workers, a sweep of the card slots of a shelf,
+one slot at a time and with sweep_slots(), and health checks on both ECs
+of every shelf, one EC at a time and with run_on_all_ecs(). latency is
+the network delay of the fake NE's output, so runs are comparable across
+machines and execute_many overlaps the round trips of its commands.
+
+Usage: python benchmarks/bench_server.py [latency_ms] [output_mb] [nes]
+"""
+import sys
+import time
+
+from pss1830ssh.pss1830cli import PSS1830Cli
+from pss1830ssh.pss1830fake import FakeNE
+from pss1830ssh.pss1830fleet import FleetRunner, NE
+from pss1830ssh.pss1830root import PSS1830Root
+
+COMMANDS = 200
+LOGINS = 10
+SLOTS = [slot for slot in range(2, 33) if slot != 18]
+SHELVES = [81] + list(range(1, 8))
+HEALTH_CHECKS = ['ps -ef', 'df', 'uptime']
+
+
+def report(name, count, elapsed, unit):
+    print('%-22s %8d %-8s %8.3f s %10.1f %s/s' % (name, count, unit, elapsed,
+                                                  count / elapsed, unit))
+
+
+def bench_login(ne):
+    start = time.time()
+    for _ in range(LOGINS):
+        cli = PSS1830Cli('127.0.0.1', ne.port, 'admin', 'admin')
+        cli.open()
+        cli.close()
+    elapsed = time.time() - start
+    print('%-22s %8.1f ms per login' % ('login', elapsed / LOGINS * 1000))
+
+
+def bench_commands(ne):
+    cli = PSS1830Cli('127.0.0.1', ne.port, 'admin', 'admin')
+    cli.open()
+    start = time.time()
+    for _ in range(COMMANDS):
+        list(cli.execute('show version'))
+    report('execute', COMMANDS, time.time() - start, 'commands')
+    start = time.time()
+    cli.execute_many(['show version'] * COMMANDS)
+    report('execute_many', COMMANDS, time.time() - start, 'commands')
+    cli.close()
+
+
+def bench_large_output(ne):
+    cli = PSS1830Cli('127.0.0.1', ne.port, 'admin', 'admin')
+    cli.open()
+    start = time.time()
+    size = sum(len(chunk) for chunk in cli.execute_raw('show big'))
+    elapsed = time.time() - start
+    cli.close()
+    print('%-22s %8.1f MB %11.3f s %10.1f MB/s' % ('large output', size / 1e6, elapsed,
+                                                   size / 1e6 / elapsed))
+
+
+def bench_fleet(ne, count):
+    nes = [NE('127.0.0.1', ne.port, 'admin', 'admin')] * count
+    for workers in (1, 2, 4, 8, 16):
+        runner = FleetRunner(workers=workers, per_host=workers, retries=0)
+        start = time.time()
+        failed = sum(1 for result in runner.run(nes, ['show version']) if not result.ok)
+        elapsed = time.time() - start
+        report('fleet workers=%d' % workers, count, elapsed, 'NEs')
+        if failed:
+            print('  %d failed' % failed)
+
+
+def bench_sweep(ne):
+    root = PSS1830Root('127.0.0.1', ne.port, 'root', 'root')
+    root.open()
+    start = time.time()
+    for slot in SLOTS:
+        root.run_on((2, slot), ['uptime'])
+    report('sweep one by one', len(SLOTS), time.time() - start, 'slots')
+    root.goto(81)
+    start = time.time()
+    failed = sum(1 for result in root.sweep_slots(2, SLOTS, ['uptime']) if result.error)
+    report('sweep_slots', len(SLOTS), time.time() - start, 'slots')
+    if failed:
+        print('  %d failed' % failed)
+    root.close()
+
+
+def bench_ecs(latency):
+    with FakeNE(latency=latency, shelves=SHELVES) as ne:
+        root = PSS1830Root('127.0.0.1', ne.port, 'root', 'root')
+        root.open()
+        start = time.time()
+        for shelf in SHELVES:
+            root.run_on((shelf,), HEALTH_CHECKS)
+            root.run_on((shelf, None, None, False), HEALTH_CHECKS)
+        report('ECs one by one', 2 * len(SHELVES), time.time() - start, 'ECs')
+        root.goto(81)
+        start = time.time()
+        results = root.run_on_all_ecs(HEALTH_CHECKS)
+        report('run_on_all_ecs', len(results), time.time() - start, 'ECs')
+        failed = sum(1 for result in results.values() if result.error)
+        if failed:
+            print('  %d failed' % failed)
+        root.close()
+
+
+def main():
+    latency = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.0
+    output_size = int(float(sys.argv[2]) * 10**6) if len(sys.argv) > 2 else 20 * 10**6
+    count = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+    with FakeNE(latency=latency, output_size=output_size) as ne:
+        bench_login(ne)
+        bench_commands(ne)
+        bench_large_output(ne)
+        bench_fleet(ne, count)
+        bench_sweep(ne)
+    bench_ecs(latency)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Benchmark ShardedRunner against FleetRunner on local fake NEs.
+
+One fake NE is served per core, each in its own process and on its own
+loopback address, so the servers do not share a GIL either. Every NE
+runs `show big`, which makes SSH decryption and prompt matching the
+bottleneck of the client.
+
+Usage: python benchmarks/bench_shard.py [nes] [output_kb] [workers]
+"""
+import multiprocessing
+import sys
+import time
+
+from pss1830ssh.pss1830fake import FakeNE
+from pss1830ssh.pss1830fleet import FleetRunner, NE
+from pss1830ssh.pss1830shard import ShardedRunner
+
+
+def serve(host, output_size, ports):
+    with FakeNE(host=host, output_size=output_size) as ne:
+        ports.put((host, ne.port))
+        while True:
+            time.sleep(60)
+
+
+def measure(name, runner, nes):
+    start = time.time()
+    failed = sum(1 for result in runner.run(nes, ['show big']) if not result.ok)
+    elapsed = time.time() - start
+    print('%-22s %6d NEs %8.3f s %8.1f NEs/s%s' % (
+        name, len(nes), elapsed, len(nes) / elapsed,
+        '  (%d failed)' % failed if failed else ''))
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    output_size = int(sys.argv[2]) * 1024 if len(sys.argv) > 2 else 1024
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    cores = multiprocessing.cpu_count()
+    ports = multiprocessing.Queue()
+    servers = []
+    for index in range(cores):
+        host = '127.0.0.%d' % (index + 1)
+        server = multiprocessing.Process(target=serve, args=(host, output_size, ports))
+        server.daemon = True
+        server.start()
+        servers.append((host, server))
+    addresses = sorted(ports.get() for _ in servers)
+    nes = [NE(*addresses[index % cores] + ('admin', 'admin')) for index in range(count)]
+    try:
+        measure('threads', FleetRunner(workers=workers, per_host=workers, retries=0), nes)
+        processes = 1
+        while processes <= cores:
+            measure('processes=%d' % processes,
+                    ShardedRunner(processes, workers=workers, per_host=workers, retries=0),
+                    nes)
+            processes *= 2
+    finally:
+        for _, server in servers:
+            server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark writing a large output to a file, joined or through a sink.
+
+The fake NE runs in another process, so that only the client's memory
+is traced. Compares joining execute() and writing the result with
+execute(sink=...), plain and gzip compressed.
+
+Usage: python benchmarks/bench_sink.py [output_mb]
+"""
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from pss1830ssh.pss1830cli import PSS1830Cli
+from pss1830ssh.pss1830fake import FakeNE
+
+
+def serve(output_size, ports):
+    with FakeNE(output_size=output_size) as ne:
+        ports.put(ne.port)
+        while True:
+            time.sleep(60)
+
+
+def joined(cli, path):
+    output = ''.join(cli.execute('show big'))
+    with open(path, 'w') as f:
+        f.write(output)
+
+
+def measure(name, cli, path, func):
+    tracemalloc.start()
+    start = time.time()
+    func(cli, path)
+    elapsed = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('%-10s %8.3f s  file %7.1f MB  peak %7.1f MB' % (
+        name, elapsed, os.path.getsize(path) / 1e6, peak / 1e6))
+
+
+def main():
+    output_size = int(float(sys.argv[1]) * 10**6) if len(sys.argv) > 1 else 100 * 10**6
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(output_size, ports))
+    server.daemon = True
+    server.start()
+    cli = PSS1830Cli('127.0.0.1', ports.get(), 'admin', 'admin')
+    cli.open()
+    directory = tempfile.mkdtemp()
+    try:
+        measure('joined', cli, os.path.join(directory, 'joined.txt'), joined)
+        measure('sink', cli, os.path.join(directory, 'sink.txt'),
+                lambda cli, path: cli.execute('show big', sink=path))
+        measure('sink gz', cli, os.path.join(directory, 'sink.txt.gz'),
+                lambda cli, path: cli.execute('show big', sink=path))
+    finally:
+        cli.close()
+        server.terminate()
+        for name in os.listdir(directory):
+            os.remove(os.path.join(directory, name))
+        os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
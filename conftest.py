@@ -0,0 +1,6 @@
+import sys
+
+collect_ignore = []
+if sys.version_info < (3, 6):
+    # async generators, also kept from pylint
+    collect_ignore.extend(['pss1830ssh/pss1830aio.py', 'tests/test_pss1830aio.py'])
@@ -4,26 +4,154 @@ Base classes for the pss1830ssh module
 Author: Trung Truong
 Company: Nokia NZ
 """
+import codecs
+import collections
 import time
 import re
+import select
+import socket
 import logging
-import paramiko
+
+
+def _paramiko():
+    """Import paramiko on first use, it is slow to import."""
+    import paramiko
+    return paramiko
 
 
 class PSSException(Exception):
     """Exception wrapper."""
     pass
 
+
+class CommandInterrupted(PSSException):
+    """A command was stopped before its prompt came back.
+
+    output is the end of what it printed, resynced whether the session
+    found its prompt again and can run more commands.
+    """
+
+    def __init__(self, message, command=None, output='', resynced=False):
+        super(CommandInterrupted, self).__init__(message)
+        self.command = command
+        self.output = output
+        self.resynced = resynced
+
+
+class CommandTimeout(CommandInterrupted):
+    """A command did not complete in time."""
+    pass
+
+
+class CommandCancelled(CommandInterrupted):
+    """A command was cancelled with cancel()."""
+    pass
+
+
+CommandResult = collections.namedtuple('CommandResult', ['command', 'output', 'error'])
+
+
+def compile_re(pattern):
+    """Compile a pattern, passing already compiled patterns through."""
+    if hasattr(pattern, 'search'):
+        return pattern
+    return re.compile(pattern, re.DOTALL)
+
+
+class _NullTimer(object):
+    """Stands in for Metrics.timed when no metrics are recorded."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+NULL_TIMER = _NullTimer()
+
+
+class PromptMatcher(object):
+    """Match a pattern against the tail of a stream of data.
+
+    Only the last ``tail_size`` characters are kept, so the cost of each
+    feed is bounded no matter how much data has gone through, and a
+    prompt split across two reads is still found.
+    """
+
+    def __init__(self, pattern, tail_size=1024):
+        self.pattern = compile_re(pattern)
+        self.tail_size = tail_size
+        self.tail = None
+
+    def feed(self, data):
+        """Add data (text or bytes) to the stream and search the tail."""
+        if self.tail is None or len(data) >= self.tail_size:
+            self.tail = data[-self.tail_size:]
+        else:
+            self.tail = (self.tail + data)[-self.tail_size:]
+        return self.pattern.search(self.tail)
+
 #pylint: disable=too-many-instance-attributes
-class PSS1830(object):
+class SessionSteps(object):
+    """Prompt and login logic free of I/O, shared by the blocking and
+    asyncio sessions.
+
+    The *_steps methods are generators yielding actions for the session
+    to carry out with its own I/O (see PSS1830._run_steps):
+        ('send', command)           nothing sent back
+        ('expect', regex)           the match, None if it did not come
+        ('cancel',) / ('close',)    nothing sent back
+        ('call', steps[, phase])    what the nested steps give, timed as phase
+        ('give', value)             the steps end with value
+    """
+
+    PROMPT_RE = None
+
+    def _get_prompt_steps(self, prompt_re=None):
+        self.logger.info('Getting prompt')
+        self.prompt = None
+        yield ('send', '')
+        match = yield ('expect', prompt_re or self.PROMPT_RE)
+        if match:
+            self.prompt = match.group().strip()
+        self.logger.info('Got prompt: %s', self.prompt)
+        yield ('give', self.prompt)
+
+    def _wait_banner_steps(self):
+        # if the prompt a new shell prints on its own came after the one
+        # _get_prompt() asks for, it would end the next command's output
+        match = yield ('expect', self.PROMPT_RE)
+        yield ('give', match)
+
+
+class PSS1830(SessionSteps):
     """Common class for 1830PSS SSH session to root and CLI.
     """
 
     TIMEOUT = 30
-    PROMPT_RE = None
+    ERROR_RE = None
+    INTERACTIVE_RE = None
     CTRL_C = '\x03'
+    ENCODING = 'utf-8'
 
-    sleep_interval = 0.25
+    # reads start at read_size and adapt to the consumer between
+    # min_read_size and max_buffered, the most read from the channel
+    # before the consumer gets it; the SSH window (window_size, paramiko's
+    # default if None) bounds what the NE sends meanwhile
+    read_size = 65536
+    min_read_size = 4096
+    max_buffered = 1048576
+    window_size = None
+    # a consumer holding a chunk longer than this is counted as a stall
+    stall_time = 0.5
+    partial_size = 1048576
+    resync_timeout = 5
+    # bounds the TCP connect, SSH banner and authentication, if set
+    connect_timeout = None
+    cache = None
+    metrics = None
+    transport_config = None
+    capture = None
 
     logger = logging.getLogger(__name__)
 
@@ -33,80 +161,324 @@ class PSS1830(object):
         self.username = username
         self.password = password
         self.connected = False
-        self.client = paramiko.SSHClient()
-        self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        # created on open(), so that idle sessions stay cheap
+        self.client = None
         self.channel = None
+        self._sent = 0
+        self._read_size = self.read_size
+        # reused by every read, replaced only when the read size outgrows it
+        self._buffer = None
+        # socket pair waking up a receive blocked in select, for cancel()
+        self._wake = None
+        self._reading = False
+        self._cancelled = False
+        self.decoder = codecs.getincrementaldecoder(self.ENCODING)('replace')
+        self.prompt_re = None
+        self.prompt_raw_re = None
+        self._prompt = None
         self.prompt = None
 
+    @property
+    def prompt(self):
+        """The NE's prompt as last detected."""
+        return self._prompt
+
+    @prompt.setter
+    def prompt(self, value):
+        self._prompt = value
+        if value:
+            self.prompt_re = re.compile(re.escape(value) + r'\s*$')
+            self.prompt_raw_re = re.compile(
+                re.escape(value.encode(self.ENCODING)) + br'\s*$')
+        else:
+            self.prompt_re = None
+            self.prompt_raw_re = None
+
     def open(self):
         """Open a SSH connection to a NE."""
         self.logger.info('Opening SSH connection')
         if self.connected:
             self.logger.info('SSH already opened')
             return
-        self.client.connect(self.host, self.port, self.username, self.password)
-        self.channel = self.client.invoke_shell()
+        with self._timed('connect'):
+            try:
+                self._connect()
+            except Exception:
+                # the transport may be up, e.g. when the authentication fails
+                if self.client is not None:
+                    self.client.close()
+                raise
         self.channel.settimeout(self.TIMEOUT)
+        self._read_size = min(self.read_size, self.max_buffered)
+        self.decoder.reset()
+        self._open_wake()
         self.connected = True
         self.logger.info('SSH connection opened')
 
+    def _connect(self):
+        if self.transport_config is not None:
+            self.client = self.transport_config.connect(
+                self.host, self.port, self.username, self.password, self.connect_timeout)
+        else:
+            if self.client is None:
+                self.client = self._new_client()
+            if self.connect_timeout is None:
+                self.client.connect(self.host, self.port, self.username, self.password)
+            else:
+                self.client.connect(self.host, self.port, self.username, self.password,
+                                    timeout=self.connect_timeout,
+                                    banner_timeout=self.connect_timeout,
+                                    auth_timeout=self.connect_timeout)
+        if self.capture is not None:
+            self.client = self.capture.wrap(self.client, self.host, self._secrets())
+        if self.window_size:
+            self.client.get_transport().default_window_size = self.window_size
+        self.channel = self.client.invoke_shell()
+
+    def _secrets(self):
+        """Get the credentials sent on the channel, kept out of captures."""
+        return [self.password]
+
+    def _open_wake(self):
+        if self._wake is None:
+            self._wake = socket.socketpair()
+            for sock in self._wake:
+                sock.setblocking(False)
+
+    @staticmethod
+    def _new_client():
+        paramiko = _paramiko()
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        return client
+
     def close(self):
         """Close the SSH connection."""
         self.logger.info('Closing SSH connection')
         if self.connected:
             self.connected = False
-            self.channel.close()
-            self.client.close()
+            try:
+                self.channel.close()
+            finally:
+                self.client.close()
+        self._close_wake()
         self.logger.info('SSH connection closed')
 
-    def execute(self, command):
-        """Excecute a command on the NE."""
+    def _close_wake(self):
+        if self._wake is not None:
+            for sock in self._wake:
+                sock.close()
+            self._wake = None
+
+    def execute(self, command, sink=None, timeout=None):
+        """Excecute a command on the NE.
+
+        With a cache set, cacheable commands are answered from it when
+        possible. With a sink (see pss1830sink), the output is written to
+        it as it arrives and the number of bytes written is returned.
+
+        Once the prompt is known, CommandTimeout is raised if it does not
+        come back within timeout seconds, or after TIMEOUT seconds without
+        data, and CommandCancelled if cancel() is called meanwhile. The
+        session is resynced first so that it can be used again.
+        """
         self.logger.info('Executing: %s', command)
         if not self.connected:
             raise PSSException('Not connected')
+        if sink is not None:
+            return self._execute_to_sink(command, sink, timeout)
+        if self.cache is not None:
+            return self._execute_cached(command, timeout)
         self._send(command)
-        return self._recv_all()
+        return self._recv_all(command, timeout)
+
+    def _execute_to_sink(self, command, sink, timeout=None):
+        from pss1830ssh.pss1830sink import open_sink
+        output, owned = open_sink(sink, self.host, command)
+        nbytes = 0
+        try:
+            self._send(command)
+            for data in self._recv_all_raw(command, timeout):
+                output.write(data)
+                nbytes += len(data)
+        finally:
+            if owned:
+                output.close()
+        return nbytes
+
+    def _execute_cached(self, command, timeout=None):
+        key = (self.host, self._cache_target(), command)
+        if self.cache.is_invalidating(command):
+            self.cache.invalidate(host=self.host)
+        elif self.cache.is_cacheable(command):
+            output = self.cache.get(key)
+            if output is not None:
+                self.logger.debug('Cache hit: %s', command)
+                return iter([output])
+            self._send(command)
+            return self._recv_to_cache(key, timeout)
+        self._send(command)
+        return self._recv_all(command, timeout)
+
+    def _recv_to_cache(self, key, timeout=None):
+        """Receive the output of a command, caching it if complete."""
+        chunks = []
+        for data in self._recv_all(key[2], timeout):
+            chunks.append(data)
+            yield data
+        output = ''.join(chunks)
+        if self._check_prompt(output):
+            self.cache.put(key, output)
+
+    def _cache_target(self):
+        """Where the session is, as part of the cache key."""
+        return None
+
+    def execute_raw(self, command, timeout=None):
+        """Execute a command on the NE and return the output as bytes."""
+        self.logger.info('Executing: %s', command)
+        if not self.connected:
+            raise PSSException('Not connected')
+        self._send(command)
+        return self._recv_all_raw(command, timeout)
+
+    def execute_many(self, commands, interactive=None):
+        """Execute several commands, sending them back to back.
+
+        The output is split into one CommandResult per command at the
+        prompts, in the order of the commands. Commands matching
+        interactive (a regex, or INTERACTIVE_RE by default) are run one at
+        a time instead, waiting for the prompt before sending the next.
+        """
+        if not self.connected:
+            raise PSSException('Not connected')
+        if not self.prompt:
+            raise PSSException('The prompt is unknown')
+        interactive = compile_re(interactive or self.INTERACTIVE_RE or '(?!)')
+        results = []
+        batch = []
+        for command in commands:
+            if interactive.search(command):
+                results.extend(self._execute_batch(batch))
+                results.extend(self._execute_batch([command]))
+                batch = []
+            else:
+                batch.append(command)
+        results.extend(self._execute_batch(batch))
+        return results
 
     def cancel(self):
-        """Send CTRL+C to cancel the current activity."""
+        """Cancel the current activity.
+
+        A command being received, possibly in another thread, stops with
+        CommandCancelled. Otherwise CTRL+C is sent.
+        """
+        if self._reading:
+            self._cancelled = True
+            if self._wake is not None:
+                self._wake[1].send(b'x')
+            return
         self._send(self.CTRL_C)
 
-    def _expect(self, expect):
+    def _resync(self):
+        """Interrupt what runs on the NE and find the prompt again.
+
+        Returns True if the prompt was found.
+        """
+        self.logger.warning('Resyncing the session')
+        prompt_re = self.prompt_re
+        try:
+            self._send(self.CTRL_C)
+            if self._expect(prompt_re, self.resync_timeout) is None:
+                return False
+            # the newline after CTRL+C prints one more prompt
+            while self._recv_raw() or self._wait_readable(time.time() + 0.2):
+                pass
+            return self._get_prompt(prompt_re) is not None
+        except (PSSException, socket.error, EOFError):
+            return False
+
+    def is_alive(self, timeout=5, probe=True):
+        """Check the session is usable.
+
+        A dead SSH transport is detected without any I/O. If probe, the
+        shell is also checked with a prompt round trip.
+        """
+        if not self.connected or not self.prompt_re:
+            return False
+        transport = self.client.get_transport()
+        if transport is None or not transport.is_active():
+            return False
+        if not probe:
+            return True
+        try:
+            self._send('')
+            return self._expect(self.prompt_re, timeout) is not None
+        except (PSSException, _paramiko().SSHException, socket.error, EOFError):
+            return False
+
+    def _expect(self, expect, timeout=None):
         """Expect a certain response from the NE."""
         self.logger.debug('waiting for: %s', expect)
-        for _ in range(int(self.TIMEOUT/self.sleep_interval)):
+        matcher = PromptMatcher(expect)
+        deadline = time.time() + (timeout or self.TIMEOUT)
+        while True:
             data = self._recv()
-            match = self._match(expect, data)
+            match = matcher.feed(data) if data else None
             if match:
                 self.logger.debug('received the expect')
                 return match
-            else:
-                time.sleep(self.sleep_interval)
-        return None
+            if not self._wait_readable(deadline):
+                return None
+
+    def _run_steps(self, steps, phase=None):
+        """Carry out the actions of steps (see SessionSteps)."""
+        with self._timed(phase) if phase else NULL_TIMER:
+            result = None
+            while True:
+                try:
+                    action = steps.send(result)
+                except StopIteration:
+                    return None
+                result = None
+                if action[0] == 'give':
+                    steps.close()
+                    return action[1]
+                elif action[0] == 'send':
+                    self._send(action[1])
+                elif action[0] == 'expect':
+                    result = self._expect(action[1])
+                elif action[0] == 'cancel':
+                    self.cancel()
+                elif action[0] == 'close':
+                    self.close()
+                elif action[0] == 'call':
+                    result = self._run_steps(action[1], action[2] if len(action) > 2 else None)
+
+    def _wait_banner(self):
+        """Wait for the prompt a new shell prints on its own."""
+        return self._run_steps(self._wait_banner_steps())
+
+    def _timed(self, phase):
+        """Time a phase of the session if metrics are recorded."""
+        if self.metrics is None:
+            return NULL_TIMER
+        return self.metrics.timed(phase, self.host)
 
     def _get_prompt(self, prompt_re=None):
         """Get the NE's prompt."""
-        self.logger.info('Getting prompt')
-        self.prompt = None
-        if not prompt_re:
-            prompt_re = self.PROMPT_RE
-        self._send('')
-        data = self._expect(prompt_re)
-        if data:
-            self.prompt = data.group().strip()
-        self.logger.info('Got prompt: %s', self.prompt)
-        return self.prompt
+        return self._run_steps(self._get_prompt_steps(prompt_re), 'prompt')
 
     def _check_prompt(self, data):
-        """Check if the data contains the prompt."""
-        return self._match(self.prompt, data)
+        """Check if the data ends with the prompt."""
+        return self._match(self.prompt_re, data)
 
     #pylint: disable=no-self-use
     def _match(self, match, data):
         """Search for a match from the data."""
         result = None
         if match and data:
-            result = re.search(match, data, re.DOTALL)
+            result = compile_re(match).search(data)
         return result
 
     def _send(self, command):
@@ -114,31 +486,224 @@ class PSS1830(object):
         if not self.connected:
             raise PSSException('Not connected')
         self.channel.sendall(command + '\n')
+        self._sent = time.time()
         self.logger.debug('sent: %s', command)
 
     def _recv(self):
         """Receive data from the NE."""
+        data = self.decoder.decode(self._recv_raw())
+        if data and self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('received: %s', data)
+        return data
+
+    def _recv_raw(self):
+        """Receive the bytes available from the NE, up to the read size.
+
+        Returns a memoryview of the session's read buffer, which is only
+        valid until the next read.
+        """
         if not self.connected:
             raise PSSException('Not connected')
-        data = ''
-        while self.channel.recv_ready():
-            new_data = self.channel.recv(1024)
+        if self._buffer is None or len(self._buffer) < self._read_size:
+            # views of the old buffer handed out stay valid
+            self._buffer = bytearray(self._read_size)
+        view = memoryview(self._buffer)
+        # paramiko channels only have recv, which returns a new bytes
+        recv_into = getattr(type(self.channel), 'recv_into', None)
+        filled = 0
+        while filled < self._read_size and self.channel.recv_ready():
+            if recv_into is not None:
+                filled += recv_into(self.channel, view[filled:self._read_size])
+                continue
+            new_data = self.channel.recv(self._read_size - filled)
             if new_data:
-                data += new_data
-        self.logger.debug('received: %s', data)
-        return data
+                if not isinstance(new_data, bytes):
+                    new_data = new_data.encode(self.ENCODING)
+                view[filled:filled + len(new_data)] = new_data
+                filled += len(new_data)
+        return view[:filled]
 
-    def _recv_all(self):
-        """Receive all available data from the NE."""
-        retries = 0
-        while retries < self.TIMEOUT/self.sleep_interval:
-            data = self._recv()
-            if data:
-                yield data
-                retries = 0
-                if self._check_prompt(data):
-                    break
-            else:
-                time.sleep(self.sleep_interval)
-                retries += 1
-        raise StopIteration()
+    def _adapt_read_size(self, nbytes, held):
+        """Adapt the read size to how long the consumer held the last chunk.
+
+        It doubles while reads fill it and the consumer keeps up, and
+        halves while the consumer stalls, leaving the data in the SSH
+        window so that the NE waits.
+        """
+        if held > self.stall_time:
+            self._read_size = max(self._read_size // 2, self.min_read_size)
+        elif nbytes >= self._read_size:
+            self._read_size = min(self._read_size * 2, self.max_buffered)
+
+    def _execute_batch(self, commands):
+        """Send commands at once and split the output at the prompts.
+
+        If a prompt does not come back, or cancel() is called, the
+        commands left get an error result and the session is resynced.
+        """
+        if not commands:
+            return []
+        self.logger.info('Executing %d commands', len(commands))
+        self._send('\n'.join(commands))
+        prompt = self.prompt.encode(self.ENCODING)
+        split_re = re.compile(re.escape(prompt) + br'[ \t]*')
+        outputs = []
+        # output not yet split, from the end of the last prompt found
+        buf = bytearray()
+        scan_from = 0
+        first = None
+        waits = 0
+        deadline = time.time() + self.TIMEOUT
+        self._cancelled = False
+        self._reading = True
+        try:
+            while len(outputs) < len(commands) and not self._cancelled:
+                new_data = self._recv_raw()
+                if not new_data:
+                    if self._wait_readable(deadline):
+                        waits += 1
+                    elif not self._cancelled:
+                        break
+                    continue
+                if first is None:
+                    first = time.time()
+                deadline = time.time() + self.TIMEOUT
+                buf += new_data
+                start = 0
+                match = split_re.search(buf, scan_from)
+                while match and len(outputs) < len(commands):
+                    outputs.append(buf[start:match.end()].decode(self.ENCODING, 'replace'))
+                    # commands after the first start when the previous ends
+                    self._batch_metrics(commands[len(outputs) - 1],
+                                        first if len(outputs) == 1 else None,
+                                        match.end() - start, waits)
+                    waits = 0
+                    start = match.end()
+                    match = split_re.search(buf, start)
+                # a prompt may be split across reads
+                del buf[:start]
+                scan_from = max(0, len(buf) - len(prompt))
+        finally:
+            self._reading = False
+        data = buf.decode(self.ENCODING, 'replace')
+        results = []
+        for command, output in zip(commands, outputs):
+            error = self._match(self.ERROR_RE, output)
+            results.append(CommandResult(command, output, error.group().strip() if error else None))
+        if len(outputs) < len(commands):
+            reason = 'Cancelled' if self._cancelled else 'Timed out waiting for the prompt'
+            self.logger.warning('%s: %s', reason, commands[len(outputs)])
+            self._resync()
+            for index, command in enumerate(commands[len(results):]):
+                results.append(CommandResult(command, data if index == 0 else '', reason))
+        return results
+
+    def _batch_metrics(self, command, first, nbytes, waits):
+        if self.metrics is not None:
+            self.metrics.command(self.host, command, first and first - self._sent,
+                                 time.time() - self._sent, nbytes, waits)
+
+    def _wait_readable(self, deadline):
+        """Block until the channel has data or the deadline passes.
+
+        Returns True if data is ready to be read, False on timeout.
+        """
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+        if self._wake is None:
+            readable, _, _ = select.select([self.channel], [], [], remaining)
+            return bool(readable)
+        readable, _, _ = select.select([self.channel, self._wake[0]], [], [], remaining)
+        if self._wake[0] in readable:
+            try:
+                self._wake[0].recv(4096)
+            except socket.error:
+                pass
+        return bool(readable)
+
+    def _interrupted(self, error, message, command, partial):
+        """Resync the session after a command was stopped, and make the error."""
+        self._reading = False
+        self.logger.warning(message)
+        return error(message, command, b''.join(partial), self._resync())
+
+    def _recv_all(self, command=None, timeout=None):
+        """Receive all available data from the NE as text."""
+        try:
+            for data in self._recv_all_raw(command, timeout):
+                data = self.decoder.decode(data)
+                if data:
+                    yield data
+        except CommandInterrupted as err:
+            err.output = err.output.decode(self.ENCODING, 'replace')
+            raise
+
+    def _recv_all_raw(self, command=None, timeout=None):
+        """Receive all available data from the NE as bytes.
+
+        Stops when the prompt is seen. If it is not seen within timeout
+        seconds, or no data arrives for TIMEOUT seconds, raises
+        CommandTimeout, or just stops if the prompt is not known yet.
+        The command, if given, is what the timings are recorded against.
+        """
+        matcher = None
+        if self.prompt_raw_re:
+            matcher = PromptMatcher(self.prompt_raw_re)
+        first = done = None
+        nbytes = waits = kept = peak = stalls = 0
+        stalled = 0.0
+        partial = collections.deque()
+        deadline = time.time() + self.TIMEOUT
+        end = time.time() + timeout if timeout else None
+        self._cancelled = False
+        self._reading = True
+        try:
+            while True:
+                if self._cancelled:
+                    raise self._interrupted(
+                        CommandCancelled, 'Cancelled: %s' % command, command, partial)
+                # the chunk is handed to the caller, who may keep it
+                data = self._recv_raw().tobytes()
+                if data:
+                    if first is None:
+                        first = time.time()
+                    nbytes += len(data)
+                    if matcher and matcher.feed(data):
+                        done = time.time()
+                    partial.append(data)
+                    kept += len(data)
+                    while kept - len(partial[0]) >= self.partial_size:
+                        kept -= len(partial.popleft())
+                    peak = max(peak, len(data))
+                    held = time.time()
+                    yield data
+                    held = time.time() - held
+                    if held > self.stall_time:
+                        stalls += 1
+                        stalled += held
+                    self._adapt_read_size(len(data), held)
+                    if done:
+                        return
+                    if end and time.time() > end:
+                        if matcher is None:
+                            return
+                        raise self._interrupted(
+                            CommandTimeout, 'Timed out: %s' % command, command, partial)
+                    deadline = time.time() + self.TIMEOUT
+                elif self._wait_readable(min(deadline, end) if end else deadline):
+                    waits += 1
+                elif self._cancelled:
+                    continue
+                elif matcher is None:
+                    return
+                else:
+                    raise self._interrupted(
+                        CommandTimeout, 'Timed out: %s' % command, command, partial)
+        finally:
+            self._reading = False
+            if self.metrics is not None and command is not None:
+                self.metrics.command(
+                    self.host, command, first and first - self._sent,
+                    done and done - self._sent, nbytes, waits)
+                self.metrics.flow(self.host, command, peak, stalls, stalled)
@@ -0,0 +1,260 @@
+"""
+Asyncio variants of the CLI and root sessions.
+
+Requires Python 3.6+ and asyncssh. The prompt, login and navigation steps
+are shared with the blocking classes, only the I/O is done here.
+
+How to use:
+    cli = AsyncPSS1830Cli('1.2.3.4', 22, 'admin', 'admin')
+    await cli.open()
+    async for data in cli.execute('show gen detail'):
+        print(data)
+    await cli.close()
+"""
+import asyncio
+import codecs
+import logging
+import time
+
+import asyncssh
+
+from pss1830ssh.pss1830 import PSS1830
+from pss1830ssh.pss1830 import PSSException
+from pss1830ssh.pss1830 import PromptMatcher
+from pss1830ssh.pss1830 import SessionSteps
+from pss1830ssh.pss1830cli import CliSteps
+from pss1830ssh.pss1830root import RootSteps
+
+
+class AsyncPSS1830(SessionSteps):
+    """Common class for asyncio 1830PSS SSH sessions to root and CLI."""
+
+    TIMEOUT = PSS1830.TIMEOUT
+    CTRL_C = PSS1830.CTRL_C
+    ENCODING = PSS1830.ENCODING
+
+    read_size = PSS1830.read_size
+
+    logger = logging.getLogger(__name__)
+
+    # same prompt handling as the blocking sessions
+    prompt = PSS1830.prompt
+
+    def __init__(self, host, port, username, password):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.connected = False
+        self.conn = None
+        self.stdin = None
+        self.stdout = None
+        self.decoder = codecs.getincrementaldecoder(self.ENCODING)('replace')
+        self.prompt_re = None
+        self.prompt_raw_re = None
+        self._prompt = None
+
+    async def open(self):
+        """Open a SSH connection to a NE."""
+        self.logger.info('Opening SSH connection')
+        if self.connected:
+            self.logger.info('SSH already opened')
+            return
+        self.conn, self.stdin, self.stdout = await self._connect()
+        self.decoder.reset()
+        self.connected = True
+        self.logger.info('SSH connection opened')
+
+    async def close(self):
+        """Close the SSH connection."""
+        self.logger.info('Closing SSH connection')
+        if self.connected:
+            self.connected = False
+            self.conn.close()
+            await self.conn.wait_closed()
+        self.logger.info('SSH connection closed')
+
+    def execute(self, command):
+        """Execute a command on the NE. The result is an async iterator."""
+        self.logger.info('Executing: %s', command)
+        if not self.connected:
+            raise PSSException('Not connected')
+        self._send(command)
+        return self._recv_all()
+
+    def execute_raw(self, command):
+        """Execute a command on the NE and iterate the output as bytes."""
+        self.logger.info('Executing: %s', command)
+        if not self.connected:
+            raise PSSException('Not connected')
+        self._send(command)
+        return self._recv_all_raw()
+
+    def cancel(self):
+        """Send CTRL+C to cancel the current activity."""
+        self._send(self.CTRL_C)
+
+    async def _connect(self):
+        """Connect and start a shell. Returns (connection, stdin, stdout)."""
+        conn = await asyncssh.connect(
+            self.host, self.port, username=self.username,
+            password=self.password, known_hosts=None)
+        stdin, stdout, _ = await conn.open_session(
+            term_type='vt100', encoding=None)
+        return conn, stdin, stdout
+
+    async def _expect(self, expect):
+        """Expect a certain response from the NE."""
+        self.logger.debug('waiting for: %s', expect)
+        matcher = PromptMatcher(expect)
+        deadline = time.time() + self.TIMEOUT
+        while True:
+            data = self.decoder.decode(await self._recv_raw(deadline))
+            match = matcher.feed(data) if data else None
+            if match:
+                self.logger.debug('received the expect')
+                return match
+            if time.time() >= deadline:
+                return None
+
+    async def _run_steps(self, steps):
+        """Carry out the actions of steps (see SessionSteps)."""
+        result = None
+        while True:
+            try:
+                action = steps.send(result)
+            except StopIteration:
+                return None
+            result = None
+            if action[0] == 'give':
+                steps.close()
+                return action[1]
+            elif action[0] == 'send':
+                self._send(action[1])
+            elif action[0] == 'expect':
+                result = await self._expect(action[1])
+            elif action[0] == 'cancel':
+                self.cancel()
+            elif action[0] == 'close':
+                await self.close()
+            elif action[0] == 'call':
+                result = await self._run_steps(action[1])
+
+    async def _wait_banner(self):
+        return await self._run_steps(self._wait_banner_steps())
+
+    async def _get_prompt(self, prompt_re=None):
+        """Get the NE's prompt."""
+        return await self._run_steps(self._get_prompt_steps(prompt_re))
+
+    def _send(self, command):
+        """Send a command to the NE."""
+        if not self.connected:
+            raise PSSException('Not connected')
+        self.stdin.write((command + '\n').encode(self.ENCODING))
+        self.logger.debug('sent: %s', command)
+
+    async def _recv_raw(self, deadline):
+        """Receive bytes from the NE, waiting until the deadline at most."""
+        if not self.connected:
+            raise PSSException('Not connected')
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return b''
+        try:
+            data = await asyncio.wait_for(
+                self.stdout.read(self.read_size), remaining)
+        except asyncio.TimeoutError:
+            return b''
+        if not data:
+            raise PSSException('Connection closed by the NE')
+        return data
+
+    async def _recv_all(self):
+        """Receive all available data from the NE as text."""
+        async for data in self._recv_all_raw():
+            data = self.decoder.decode(data)
+            if data:
+                yield data
+
+    async def _recv_all_raw(self):
+        """Receive all available data from the NE as bytes.
+
+        Stops when the prompt is seen or no data arrives for TIMEOUT seconds.
+        """
+        matcher = None
+        if self.prompt_raw_re:
+            matcher = PromptMatcher(self.prompt_raw_re)
+        while True:
+            data = await self._recv_raw(time.time() + self.TIMEOUT)
+            if not data:
+                return
+            yield data
+            if matcher and matcher.feed(data):
+                return
+
+
+class AsyncPSS1830Cli(CliSteps, AsyncPSS1830):
+    """Asyncio CLI session to a 1830-PSS NE."""
+
+    def __init__(self, host, port, username, password):
+        super(AsyncPSS1830Cli, self).__init__(host, port, 'cli', 'cli')
+        self.cli_user = username
+        self.cli_pass = password
+
+    async def close(self):
+        if self.connected:
+            self._send('logout')
+        await super(AsyncPSS1830Cli, self).close()
+
+    async def open(self):
+        await super(AsyncPSS1830Cli, self).open()
+        await self._run_steps(self._login_steps())
+        await self._paging_disable()
+
+    async def _paging_disable(self):
+        async for _ in self.execute('paging status disable'):
+            pass
+
+
+class AsyncPSS1830Root(RootSteps, AsyncPSS1830):
+    """Asyncio root shell session to a 1830-PSS NE, navigating like PSS1830Root."""
+
+    def __init__(self, host, port, username, password):
+        super(AsyncPSS1830Root, self).__init__(host, port, username, password)
+        self._init_position()
+
+    async def open(self):
+        await super(AsyncPSS1830Root, self).open()
+        await self._run_steps(self._open_steps())
+
+    async def close(self):
+        if self.connected:
+            self._send('exit')
+        await super(AsyncPSS1830Root, self).close()
+
+    async def goto(self, shelf, slot=None, ec=None, act=True):
+        """Move to a shelf EC or a slot like PSS1830Root.goto."""
+        await self._run_steps(self._goto_steps(shelf, slot, ec, act))
+
+    async def login_to_slot(self, shelf, slot):
+        """Telnet to a card/slot."""
+        return await self._run_steps(self._login_to_slot_steps(shelf, slot))
+
+    async def logout_from_slot(self):
+        await self._run_steps(self._logout_from_slot_steps())
+
+    async def login_to_shelf(self, shelf, ec=None, act=True):
+        """Telnet to a slave shelf."""
+        await self._run_steps(self._login_to_shelf_steps(shelf, ec, act))
+
+    async def logout_from_shelf(self):
+        """Logout from a slave shelf."""
+        await self._run_steps(self._logout_from_shelf_steps())
+
+    async def login_to_stdby(self):
+        """Login to Standby EC."""
+        await self._run_steps(self._login_to_stdby_steps())
+
+    async def logout_from_stdby(self):
+        await self._run_steps(self._logout_from_stdby_steps())
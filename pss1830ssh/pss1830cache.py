@@ -0,0 +1,95 @@
+"""
+Result cache for idempotent show commands.
+
+How to use:
+    cache = ResultCache(ttl=30, ttls=[(r'^show version', 3600)])
+    cli.cache = cache
+    ''.join(cli.execute('show version')) # sent to the NE
+    ''.join(cli.execute('show version')) # served from the cache
+    print(cache.hits, cache.misses)
+"""
+import collections
+import threading
+import time
+
+from pss1830ssh.pss1830 import compile_re
+
+
+class ResultCache(object):
+    """LRU cache of command outputs keyed by (host, target, command).
+
+    Only commands matching cacheable are cached, for the ttl of the first
+    pattern in ttls they match, or the default ttl. Commands matching
+    invalidating drop all the entries of their host. At most max_entries
+    outputs are kept, the least recently used being dropped first.
+    """
+
+    def __init__(self, max_entries=1000, ttl=60, ttls=None,
+                 cacheable=r'^\s*show\s', invalidating=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.ttls = [(compile_re(pattern), value) for pattern, value in ttls or []]
+        self.cacheable = compile_re(cacheable)
+        self.invalidating = compile_re(invalidating) if invalidating else None
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_cacheable(self, command):
+        return bool(self.cacheable.search(command))
+
+    def is_invalidating(self, command):
+        return bool(self.invalidating and self.invalidating.search(command))
+
+    def ttl_for(self, command):
+        for pattern, value in self.ttls:
+            if pattern.search(command):
+                return value
+        return self.ttl
+
+    def get(self, key):
+        """Get a cached output, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.pop(key)
+            self._entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, output):
+        """Cache the output of a command. key is (host, target, command)."""
+        expires = time.time() + self.ttl_for(key[2])
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (output, expires)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, host=None, target=None, command=None):
+        """Drop the entries matching all the given parts of the key.
+
+        command may be a string or a regex. With no argument, drop all.
+        """
+        command_re = compile_re(command) if command else None
+        with self._lock:
+            for key in list(self._entries):
+                if host is not None and key[0] != host:
+                    continue
+                if target is not None and key[1] != target:
+                    continue
+                if command_re and not command_re.search(key[2]):
+                    continue
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
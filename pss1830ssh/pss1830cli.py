@@ -1,10 +1,42 @@
 """
 Abstraction for a CLI interface of a NE
 """
+import re
 from pss1830ssh.pss1830 import PSS1830
 from pss1830ssh.pss1830 import PSSException
+from pss1830ssh.pss1830 import SessionSteps
 
-class PSS1830Cli(PSS1830):
+
+class CliSteps(SessionSteps):
+    """CLI login logic free of I/O, see SessionSteps."""
+
+    PROMPT_RE = re.compile(r'\n[\w-]+# $')
+    AUTH_EXPECTS = (
+        re.compile(r'\nUsername:'),
+        re.compile(r'\nPassword:'),
+        re.compile(r'\nDo you.*(Y/N)?', re.DOTALL))
+
+    def _login_steps(self):
+        yield ('call', self._authenticate_steps(), 'auth')
+        if not (yield ('call', self._get_prompt_steps(), 'prompt')):
+            raise PSSException('Failed to get the prompt')
+
+    def _authenticate_steps(self):
+        self.logger.debug('Authenticating CLI')
+        responses = (self.cli_user, self.cli_pass, 'Y')
+        for expect, response in zip(self.AUTH_EXPECTS, responses):
+            if (yield ('expect', expect)):
+                yield ('send', response)
+            else:
+                yield ('close',)
+                raise PSSException(
+                    'Failed to login. Expected: "%s" but not received: '
+                    % expect.pattern.encode('unicode_escape'))
+        yield ('call', self._wait_banner_steps())
+        self.logger.debug('Authenticated CLI')
+
+
+class PSS1830Cli(CliSteps, PSS1830):
     """Represent a CLI session to a 1830-PSS NE
     How to use:
         cli = PSS1830Cli('1.2.3.4', 22, 'admin', 'admin') # create an instance
@@ -15,7 +47,7 @@ class PSS1830Cli(PSS1830):
         cli.close() # close the CLI
     """
 
-    PROMPT_RE = '\n[\w-]+# $'
+    ERROR_RE = re.compile(r'^\s*Error:.*$', re.MULTILINE)
 
     def __init__(self, host, port, username, password):
         super(PSS1830Cli, self).__init__(host, port, 'cli', 'cli')
@@ -23,33 +55,19 @@ class PSS1830Cli(PSS1830):
         self.cli_pass = password
 
     def close(self):
-        self._send('logout')
-        super(PSS1830Cli, self).close()
+        try:
+            if self.connected:
+                self._send('logout')
+        finally:
+            super(PSS1830Cli, self).close()
 
     def open(self):
         super(PSS1830Cli, self).open()
-        self._authenticate()
-        self._get_prompt()
-        if not self.prompt:
-            raise PSSException('Failed to get the prompt')
+        self._run_steps(self._login_steps())
         self._paging_disable()
 
-    def _authenticate(self):
-        self.logger.debug('Authenticating CLI')
-        for expect, response in [
-                ('\nUsername:', self.cli_user),
-                ('\nPassword:', self.cli_pass),
-                ('\nDo you.*(Y/N)?', 'Y')]:
-            if self._expect(expect):
-                self._send(response)
-            else:
-                self.close()
-                raise PSSException(
-                    'Failed to login. Expected: "%s" but not received: '
-                    % expect.encode('unicode_escape'))
-        self._recv()
-        self.connected = True
-        self.logger.debug('Authenticated CLI')
+    def _secrets(self):
+        return [self.cli_pass]
 
     def _paging_disable(self):
         list(self.execute('paging status disable'))
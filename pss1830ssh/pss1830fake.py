@@ -0,0 +1,436 @@
+"""
+A fake 1830-PSS NE served over SSH on the local machine.
+
+It emulates the CLI login dialog and a few show commands, the root shell
+of the master EC with telnet hops to shelf ECs and slots, and SFTP. The
+network latency and the size of the large outputs are configurable, so
+it can be used to test scripts and to benchmark the library.
+
+How to use:
+    with FakeNE(latency=0.05) as ne:
+        cli = PSS1830Cli('127.0.0.1', ne.port, 'admin', 'admin')
+        cli.open()
+"""
+import logging
+import os
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+import paramiko
+
+TELNET_RE = re.compile(r'^telnet\s+100\.0\.(\d+)\.(\d+)$')
+LINE = '%-8s  11STAR1    3KC12345BBBB   ZZ%010d\r\n'
+
+
+class FakeNE(object):
+    """SSH server emulating a 1830-PSS NE.
+
+    users are the SSH logins ('cli' gives the CLI, any other the root
+    shell), cli_users the CLI logins. latency is the network delay of
+    the shell output: it reaches the client latency seconds after it is
+    written, without holding up the commands that follow, so commands
+    sent back to back overlap their round trips like on a real link.
+    login_delay is added before each telnet login prompt. 'show big' on
+    the CLI and 'cat big' on the root shell return output_size bytes.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, host='127.0.0.1', port=0, name='NE1', users=None, cli_users=None,
+                 shelves=(81, 2, 3), slots=range(2, 33), active_ec=None, ec_type='EC1830',
+                 latency=0.0, login_delay=0.0, output_size=1048576, sftp_root=None):
+        self.host = host
+        self.port = port
+        self.name = name
+        self.users = users or {'cli': 'cli', 'root': 'root'}
+        self.cli_users = cli_users or {'admin': 'admin'}
+        self.shelves = list(shelves)
+        self.slots = list(slots)
+        self.active_ec = dict((shelf, 18 if shelf == 81 else 1) for shelf in self.shelves)
+        self.active_ec.update(active_ec or {})
+        self.ec_type = ec_type
+        self.latency = latency
+        self.login_delay = login_delay
+        self.output_size = output_size
+        self._own_sftp_root = sftp_root is None
+        self.sftp_root = sftp_root or tempfile.mkdtemp(prefix='fakene-')
+        self.host_key = paramiko.ECDSAKey.generate()
+        self.connections = 0
+        self._sock = None
+        self._transports = []
+        self._running = False
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen(128)
+        self.port = self._sock.getsockname()[1]
+        self._running = True
+        self._thread(self._accept_loop)
+        return self
+
+    def stop(self):
+        self._running = False
+        if self._sock:
+            self._sock.close()
+        for transport in list(self._transports):
+            transport.close()
+        if self._own_sftp_root:
+            shutil.rmtree(self.sftp_root, ignore_errors=True)
+
+    @staticmethod
+    def _thread(target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                sock, _ = self._sock.accept()
+            except (socket.error, OSError):
+                return
+            self.connections += 1
+            self._thread(self._serve, sock)
+
+    def _serve(self, sock):
+        transport = paramiko.Transport(sock)
+        self._transports.append(transport)
+        transport.add_server_key(self.host_key)
+        transport.set_subsystem_handler('sftp', paramiko.SFTPServer, _SFTPServer, self.sftp_root)
+        try:
+            transport.start_server(server=_Server(self))
+        except (paramiko.SSHException, EOFError, socket.error):
+            return
+        # Channels close when garbage collected, hold them until the end
+        channels = []
+        while transport.is_active():
+            channel = transport.accept(1)
+            if channel is not None:
+                channels.append(channel)
+        self._transports.remove(transport)
+
+    def shell(self, channel):
+        user = channel.get_transport().get_username()
+        shell = CliShell(self, channel) if user == 'cli' else RootShell(self, channel, user)
+        try:
+            try:
+                shell.run()
+            finally:
+                shell.flush()
+            channel.close()
+        except (EOFError, socket.error, OSError):
+            pass
+
+
+class _Server(paramiko.ServerInterface):
+
+    def __init__(self, ne):
+        self.ne = ne
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if self.ne.users.get(username) == password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, *args):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        FakeNE._thread(self.ne.shell, channel)
+        return True
+
+
+class Shell(object):
+    """Line oriented shell on a channel."""
+
+    def __init__(self, ne, channel):
+        self.ne = ne
+        self.channel = channel
+        self.buf = b''
+        # output on its way to the client, as (due time, data)
+        self._delayed = None
+        self._delivery = None
+
+    def readline(self):
+        while b'\n' not in self.buf:
+            data = self.channel.recv(4096)
+            if not data:
+                raise EOFError()
+            self.buf += data
+        line, _, self.buf = self.buf.partition(b'\n')
+        return line.decode('utf-8', 'replace').rstrip('\r').replace('\x03', '')
+
+    def sleep(self, seconds):
+        """Sleep like a command would, unless interrupted with CTRL+C."""
+        end = time.time() + seconds
+        while time.time() < end:
+            if self.channel.recv_ready():
+                self.buf += self.channel.recv(4096)
+                if b'\x03' in self.buf:
+                    self.buf = self.buf[self.buf.index(b'\x03') + 1:]
+                    return '^C'
+            time.sleep(0.01)
+        return ''
+
+    def write(self, text):
+        self.send(text.encode('utf-8'))
+
+    def send(self, data):
+        """Send data to the client, after the network latency."""
+        if not self.ne.latency:
+            self.channel.sendall(data)
+            return
+        if self._delayed is None:
+            self._delayed = queue.Queue()
+            self._delivery = FakeNE._thread(self._deliver)
+        self._delayed.put((time.time() + self.ne.latency, data))
+
+    def flush(self):
+        """Wait until the output on its way has been delivered."""
+        if self._delivery is not None:
+            self._delayed.put(None)
+            self._delivery.join()
+
+    def _deliver(self):
+        while True:
+            item = self._delayed.get()
+            if item is None:
+                return
+            due, data = item
+            if due > time.time():
+                time.sleep(due - time.time())
+            try:
+                self.channel.sendall(data)
+            except (EOFError, socket.error, OSError):
+                pass
+
+    def big_output(self):
+        rows = self.ne.output_size // len(LINE % ('1/1', 0))
+        return '\r\n' + ''.join(LINE % ('%d/%d' % (i // 32 + 1, i % 32 + 1), i)
+                                for i in range(rows))
+
+    def run(self):
+        raise NotImplementedError()
+
+
+class CliShell(Shell):
+    """The 1830-PSS CLI."""
+
+    def run(self):
+        self.write('\r\nWelcome to %s\r\nUsername: ' % self.ne.name)
+        username = self.readline().strip()
+        self.write('\r\nPassword: ')
+        password = self.readline().strip()
+        if self.ne.cli_users.get(username) != password:
+            self.write('\r\nLogin incorrect\r\n')
+            return
+        self.write('\r\nDo you acknowledge (Y/N)? ')
+        if self.readline().strip().upper() != 'Y':
+            return
+        prompt = '\r\n%s# ' % self.ne.name
+        self.write(prompt)
+        while True:
+            command = self.readline().strip()
+            if command == 'logout':
+                return
+            self.write(command + self.respond(command) + prompt)
+
+    def respond(self, command):
+        if command in ('', 'paging status disable'):
+            return ''
+        if command == 'show version':
+            return ('\r\nSoftware\r\n  Version : 1830PSS-10.0.2\r\n'
+                    '  Built   : Mon Jan 1 12:30:00 2018\r\n'
+                    'Hardware\r\n  Shelf Type : PSS-32')
+        if command == 'show card inv *':
+            rows = ['Location  Card Type  Part Number    Serial Number',
+                    '--------  ---------  -------------  -------------']
+            for shelf in self.ne.shelves:
+                for slot in self.ne.slots:
+                    rows.append('%-8s  11STAR1    3KC12345BBBB   ZZ%08d%02d'
+                                % ('%d/%d' % (shelf, slot), shelf, slot))
+            return '\r\n' + '\r\n'.join(rows) + '\r\n'
+        if command == 'show big':
+            return self.big_output()
+        return '\r\nError: Invalid command'
+
+
+class RootShell(Shell):
+    """The root shell of the master EC, with telnet hops."""
+
+    def __init__(self, ne, channel, username):
+        super(RootShell, self).__init__(ne, channel)
+        self.username = username
+        shelf = 81
+        self.prompts = [self.ec_prompt(shelf, ne.active_ec[shelf], telnet=False)]
+
+    def ec_prompt(self, shelf, ec, telnet=True):
+        state = 'ACT' if self.ne.active_ec.get(shelf) == ec else 'STDBY'
+        if self.ne.ec_type == '32EC2':
+            return 'root@32EC2-%s-%s-%s:~# ' % (shelf, ec, state)
+        return 'root@EC1830-%s-%s-%s:/root%s# ' % (shelf, ec, state, '\r\n' if telnet else '')
+
+    def run(self):
+        self.write('Welcome\r\n' + self.prompts[-1])
+        while self.prompts:
+            command = self.readline().strip()
+            match = TELNET_RE.match(command)
+            if match:
+                self.telnet(command, int(match.group(1)), int(match.group(2)))
+            elif command == 'exit':
+                self.prompts.pop()
+                if self.prompts:
+                    self.write(command + '\r\n' + self.prompts[-1])
+            else:
+                # echoed as typed, before the command runs
+                self.send(command.encode('utf-8'))
+                self.write(self.respond(command) + '\r\n' + self.prompts[-1])
+
+    def telnet(self, command, shelf, card):
+        if shelf not in self.ne.shelves or (card not in (1, 18) and card not in self.ne.slots):
+            self.write(command + '\r\ntelnet: Unable to connect to remote host: '
+                       'No route to host\r\n' + self.prompts[-1])
+            return
+        if self.ne.login_delay:
+            time.sleep(self.ne.login_delay)
+        self.write(command + '\r\nTrying 100.0.%s.%s...\r\n\r\nlogin: ' % (shelf, card))
+        username = self.readline().strip()
+        if card in (1, 18):
+            self.write(username + '\r\nPassword: ')
+            if self.readline().strip() != self.ne.users.get(username):
+                self.write('\r\nLogin incorrect\r\n' + self.prompts[-1])
+                return
+            self.prompts.append(self.ec_prompt(shelf, card))
+            self.write('\r\nWelcome to MontaVista(R) Linux(R)\r\n' + self.prompts[-1])
+        else:
+            self.prompts.append('root@slot-%s-%s:~# ' % (shelf, card))
+            self.write(username + '\r\n' + self.prompts[-1])
+
+    def respond(self, command):
+        where = self.prompts[-1].split(':')[0]
+        if command == '':
+            return ''
+        if command in ('uptime', 'ps -ef', 'df', 'hostname'):
+            return '\r\n%s output on %s' % (command, where)
+        if command == 'cat big':
+            return self.big_output()
+        if command == 'cat /proc/net/arp':
+            return self.arp()
+        if command.startswith('sleep '):
+            return self.sleep(float(command.split()[1]))
+        return '\r\nsh: %s: command not found' % command.split()[0]
+
+    def arp(self):
+        lines = ['IP address       HW type     Flags       HW address            Mask     Device']
+        for shelf in self.ne.shelves:
+            for ec in (1, 18):
+                lines.append('%-16s 0x1         0x2         00:00:00:%02x:%02x:00     *        eth1'
+                             % ('100.0.%s.%s' % (shelf, ec), shelf, ec))
+        return '\r\n' + '\r\n'.join(lines)
+
+
+class _SFTPHandle(paramiko.SFTPHandle):
+
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as err:
+            return paramiko.SFTPServer.convert_errno(err.errno)
+
+    def chattr(self, attr):
+        return paramiko.SFTP_OK
+
+
+class _SFTPServer(paramiko.SFTPServerInterface):
+    """SFTP over a local directory."""
+
+    def __init__(self, server, root, *args, **kwargs):
+        super(_SFTPServer, self).__init__(server, *args, **kwargs)
+        self.root = root
+
+    def _path(self, path):
+        return os.path.join(self.root, self.canonicalize(path).lstrip('/'))
+
+    def _call(self, func, *args):
+        try:
+            func(*args)
+        except OSError as err:
+            return paramiko.SFTPServer.convert_errno(err.errno)
+        return paramiko.SFTP_OK
+
+    def list_folder(self, path):
+        path = self._path(path)
+        try:
+            return [paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(path, f)), f)
+                    for f in os.listdir(path)]
+        except OSError as err:
+            return paramiko.SFTPServer.convert_errno(err.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._path(path)))
+        except OSError as err:
+            return paramiko.SFTPServer.convert_errno(err.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        path = self._path(path)
+        try:
+            fd = os.open(path, flags | getattr(os, 'O_BINARY', 0), 0o644)
+        except OSError as err:
+            return paramiko.SFTPServer.convert_errno(err.errno)
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+        handle = _SFTPHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = os.fdopen(fd, mode)
+        return handle
+
+    def remove(self, path):
+        return self._call(os.remove, self._path(path))
+
+    def rename(self, oldpath, newpath):
+        return self._call(os.rename, self._path(oldpath), self._path(newpath))
+
+    posix_rename = rename
+
+    def mkdir(self, path, attr):
+        return self._call(os.mkdir, self._path(path))
+
+    def rmdir(self, path):
+        return self._call(os.rmdir, self._path(path))
+
+    def chattr(self, path, attr):
+        if attr.st_mtime is not None:
+            return self._call(os.utime, self._path(path), (attr.st_atime, attr.st_mtime))
+        return paramiko.SFTP_OK
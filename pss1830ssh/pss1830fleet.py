@@ -0,0 +1,234 @@
+"""
+Run a set of commands across many NEs with bounded concurrency.
+
+How to use:
+    runner = FleetRunner(workers=20)
+    nes = [NE('10.0.0.1', 22, 'admin', 'admin'), NE('10.0.0.2', 22, 'admin', 'admin')]
+    for result in runner.run(nes, ['show version', 'show card inv *']):
+        print(result.host, result.error or result.outputs)
+
+or from the shell:
+    pss1830-fleet inventory.txt commands.txt --workers 20
+"""
+import argparse
+import collections
+import logging
+import sys
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from pss1830ssh.pss1830 import PSSException
+from pss1830ssh.pss1830cli import PSS1830Cli
+from pss1830ssh.pss1830root import PSS1830Root
+
+
+NE = collections.namedtuple('NE', ['host', 'port', 'username', 'password'])
+
+
+class FleetResult(object):
+    """Outcome of running the commands on one NE."""
+
+    def __init__(self, ne):
+        self.ne = ne
+        self.outputs = []
+        self.error = None
+        self.attempts = 0
+        self.elapsed = 0.0
+
+    @property
+    def host(self):
+        return self.ne.host
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        return '<FleetResult %s ok=%s attempts=%s>' % (self.host, self.ok, self.attempts)
+
+
+class FleetRunner(object):
+    """Run commands on a list of NEs using a pool of worker threads.
+
+    workers bounds the number of sessions open at once, per_host the number
+    open to the same NE: an NE waits for its host to be free before it is
+    handed to a worker, so it does not hold one meanwhile. Each NE gets
+    timeout seconds for its login and all its commands and is retried up to retries times, with exponential backoff, when a
+    PSSException is raised, unless the backoff would end past its timeout.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, session_class=PSS1830Cli, workers=10, per_host=1,
+                 timeout=300, retries=2, backoff=1.0, metrics=None):
+        self.session_class = session_class
+        self.workers = workers
+        self.per_host = per_host
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.metrics = metrics
+
+    def run(self, nes, commands):
+        """Run the commands on every NE, yielding results as they finish."""
+        jobs = queue.Queue()
+        results = queue.Queue()
+        nes = list(nes)
+        # NEs whose host already has per_host sessions, per host
+        waiting = collections.defaultdict(collections.deque)
+        running = collections.Counter()
+        for ne in nes:
+            if running[ne.host] < self.per_host:
+                running[ne.host] += 1
+                jobs.put(ne)
+            else:
+                waiting[ne.host].append(ne)
+        threads = []
+        for _ in range(min(self.workers, len(nes))):
+            thread = threading.Thread(target=self._worker, args=(jobs, results, commands))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        try:
+            for _ in nes:
+                result = results.get()
+                if waiting[result.host]:
+                    jobs.put(waiting[result.host].popleft())
+                else:
+                    running[result.host] -= 1
+                yield result
+        finally:
+            # stopped early, the NEs not started are dropped
+            while True:
+                try:
+                    jobs.get_nowait()
+                except queue.Empty:
+                    break
+            for _ in threads:
+                jobs.put(None)
+            for thread in threads:
+                thread.join()
+
+    def _worker(self, jobs, results, commands):
+        while True:
+            ne = jobs.get()
+            if ne is None:
+                return
+            results.put(self.run_one(ne, commands))
+
+    def run_one(self, ne, commands):
+        """Run the commands on a single NE, with retries."""
+        result = FleetResult(ne)
+        start = time.time()
+        while True:
+            result.attempts += 1
+            try:
+                result.outputs = self._execute(ne, commands, start + self.timeout)
+                result.error = None
+                break
+            except PSSException as err:
+                result.error = err
+                delay = self.backoff * 2 ** (result.attempts - 1)
+                if result.attempts > self.retries or time.time() + delay >= start + self.timeout:
+                    break
+                if self.metrics is not None:
+                    self.metrics.count('retries', ne.host)
+                self.logger.info('%s failed (%s), retrying in %.1fs', ne.host, err, delay)
+                time.sleep(delay)
+            except Exception as err: #pylint: disable=broad-except
+                result.error = err
+                break
+        result.elapsed = time.time() - start
+        return result
+
+    def _execute(self, ne, commands, deadline):
+        session = self.session_class(ne.host, ne.port, ne.username, ne.password)
+        if self.metrics is not None:
+            session.metrics = self.metrics
+        session.TIMEOUT = min(session.TIMEOUT, max(deadline - time.time(), 1))
+        session.connect_timeout = max(deadline - time.time(), 1)
+        try:
+            # an open failing after the connect leaves it to close
+            session.open()
+            outputs = []
+            for command in commands:
+                if time.time() > deadline:
+                    raise PSSException('Timed out after %ss' % self.timeout)
+                output = session.execute(command, timeout=deadline - time.time())
+                outputs.append((command, ''.join(output)))
+            return outputs
+        finally:
+            try:
+                session.close()
+            except Exception: #pylint: disable=broad-except
+                self.logger.debug('Error closing %s', ne.host, exc_info=True)
+
+
+def load_inventory(path, port=22, username=None, password=None):
+    """Load NEs from a file with lines of: host [port [username password]]"""
+    nes = []
+    with open(path) as inventory:
+        for line in inventory:
+            fields = line.split('#', 1)[0].split()
+            if not fields:
+                continue
+            nes.append(NE(
+                fields[0],
+                int(fields[1]) if len(fields) > 1 else port,
+                fields[2] if len(fields) > 2 else username,
+                fields[3] if len(fields) > 3 else password))
+    return nes
+
+
+def load_commands(path):
+    """Load commands from a file, one per line."""
+    with open(path) as commands:
+        return [line.rstrip('\r\n') for line in commands
+                if line.strip() and not line.startswith('#')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Run commands across many 1830-PSS NEs.')
+    parser.add_argument('inventory', help='file of: host [port [username password]]')
+    parser.add_argument('commands', help='file of commands, one per line')
+    parser.add_argument('--port', type=int, default=22)
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='admin')
+    parser.add_argument('--root', action='store_true', help='use the root shell instead of the CLI')
+    parser.add_argument('--workers', type=int, default=10)
+    parser.add_argument('--per-host', type=int, default=1)
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--retries', type=int, default=2)
+    parser.add_argument('--processes', type=int, default=1,
+                        help='worker processes, each running --workers sessions')
+    args = parser.parse_args(argv)
+
+    kwargs = dict(session_class=PSS1830Root if args.root else PSS1830Cli,
+                  workers=args.workers, per_host=args.per_host,
+                  timeout=args.timeout, retries=args.retries)
+    if args.processes > 1:
+        from pss1830ssh.pss1830shard import ShardedRunner
+        runner = ShardedRunner(processes=args.processes, **kwargs)
+    else:
+        runner = FleetRunner(**kwargs)
+    nes = load_inventory(args.inventory, args.port, args.username, args.password)
+    failed = 0
+    for result in runner.run(nes, load_commands(args.commands)):
+        if not result.ok:
+            failed += 1
+            sys.stderr.write('%s: FAILED after %s attempts: %s\n'
+                             % (result.host, result.attempts, result.error))
+            continue
+        for command, output in result.outputs:
+            sys.stdout.write('=== %s: %s ===\n%s\n' % (result.host, command, output))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""
+Timing instrumentation for sessions, exported as histograms.
+
+Sessions record nothing unless given a Metrics object:
+    metrics = Metrics()
+    cli = PSS1830Cli('10.0.0.1', 22, 'admin', 'admin')
+    cli.metrics = metrics
+    ...
+    print(metrics.registry.to_prometheus())
+
+Any object with the same methods as Metrics can be plugged in instead.
+"""
+import contextlib
+import json
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BYTES_BUCKETS = (1024, 16384, 131072, 1048576, 8388608, 67108864)
+
+
+class Histogram(object):
+    """Cumulative histogram with fixed buckets."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[index] += 1
+
+
+class Counter(object):
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, value=1):
+        with self._lock:
+            self.value += value
+
+
+class Registry(object):
+    """In-process store of labelled histograms and counters."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, buckets=DEFAULT_BUCKETS, **labels):
+        return self._get(name, labels, lambda: Histogram(buckets))
+
+    def counter(self, name, **labels):
+        return self._get(name, labels, Counter)
+
+    def _get(self, name, labels, factory):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            metric = self._metrics.get(key)
+            if metric is None:
+                metric = self._metrics[key] = factory()
+        return metric
+
+    def to_prometheus(self):
+        """Dump all metrics in the Prometheus text format."""
+        lines = []
+        typed = set()
+        for (name, labels), metric in sorted(self._metrics.items()):
+            if name not in typed:
+                typed.add(name)
+                kind = 'histogram' if isinstance(metric, Histogram) else 'counter'
+                lines.append('# TYPE %s %s' % (name, kind))
+            if isinstance(metric, Counter):
+                lines.append('%s%s %s' % (name, _labels(labels), metric.value))
+                continue
+            for bound, count in zip(metric.buckets, metric.counts):
+                lines.append('%s_bucket%s %s' % (name, _labels(labels + (('le', bound),)), count))
+            lines.append('%s_bucket%s %s' % (name, _labels(labels + (('le', '+Inf'),)), metric.count))
+            lines.append('%s_sum%s %s' % (name, _labels(labels), metric.sum))
+            lines.append('%s_count%s %s' % (name, _labels(labels), metric.count))
+        return '\n'.join(lines) + '\n'
+
+    def to_json(self):
+        """Dump all metrics as JSON."""
+        result = {}
+        for (name, labels), metric in sorted(self._metrics.items()):
+            entry = {'labels': dict(labels)}
+            if isinstance(metric, Counter):
+                entry['value'] = metric.value
+            else:
+                entry.update(count=metric.count, sum=metric.sum,
+                             buckets=dict(zip([str(b) for b in metric.buckets], metric.counts)))
+            result.setdefault(name, []).append(entry)
+        return json.dumps(result, sort_keys=True)
+
+
+def _labels(labels):
+    return '{%s}' % ','.join('%s="%s"' % (key, _escape(value)) for key, value in labels)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def command_verb(command, words=3):
+    """The leading words of a command, without its arguments.
+
+    e.g. 'show card inv 1/2' gives 'show card inv' and 'cat /proc/net/arp'
+    gives 'cat', so that the command labels stay few.
+    """
+    verb = []
+    for word in command.split()[:words]:
+        if not word.isalpha():
+            break
+        verb.append(word)
+    return ' '.join(verb) or 'other'
+
+
+class Metrics(object):
+    """Record session phases and command timings into a Registry.
+
+    Commands are labelled by their verb (see command_verb), or as they
+    were sent if full_commands, which makes a series per distinct command.
+    """
+
+    def __init__(self, registry=None, full_commands=False):
+        self.registry = registry or Registry()
+        self.full_commands = full_commands
+
+    @contextlib.contextmanager
+    def timed(self, phase, host):
+        """Time a phase of a session: connect, auth, prompt, telnet..."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.phase(phase, host, time.time() - start)
+
+    def phase(self, phase, host, seconds):
+        self.registry.histogram('pss1830_phase_seconds', phase=phase, host=host).observe(seconds)
+
+    def command(self, host, command, ttfb, ttp, nbytes, waits):
+        """Record a command: time to first byte, time to prompt, bytes, waits.
+
+        ttp is None if the prompt was not seen.
+        """
+        labels = self._command_labels(host, command)
+        if ttfb is not None:
+            self.registry.histogram('pss1830_command_ttfb_seconds', **labels).observe(ttfb)
+        if ttp is not None:
+            self.registry.histogram('pss1830_command_seconds', **labels).observe(ttp)
+        else:
+            self.registry.counter('pss1830_command_incomplete_total', **labels).inc()
+        self.registry.histogram('pss1830_command_bytes', BYTES_BUCKETS, **labels).observe(nbytes)
+        self.registry.counter('pss1830_command_waits_total', **labels).inc(waits)
+
+    def flow(self, host, command, peak, stalls, stalled):
+        """Record a command's largest chunk buffered and its consumer stalls."""
+        labels = self._command_labels(host, command)
+        self.registry.histogram(
+            'pss1830_command_buffered_bytes', BYTES_BUCKETS, **labels).observe(peak)
+        self.registry.counter('pss1830_command_stalls_total', **labels).inc(stalls)
+        self.registry.counter('pss1830_command_stall_seconds_total', **labels).inc(stalled)
+
+    def _command_labels(self, host, command):
+        return dict(host=host, command=command if self.full_commands else command_verb(command))
+
+    def count(self, name, host, value=1):
+        """Count an event for a host, e.g. retries."""
+        self.registry.counter('pss1830_%s_total' % name, host=host).inc(value)
@@ -0,0 +1,140 @@
+"""
+Streaming parsers turning CLI show outputs into records.
+
+Parsers consume the chunks yielded by execute() and yield each record as
+soon as its line is complete, so memory does not grow with the output.
+Commands are mapped to parsers in a table; add more with register().
+
+How to use:
+    for row in parse('show card inv *', cli.execute('show card inv *')):
+        print(row.values['Location'], row.values['Serial Number'])
+"""
+import collections
+import re
+
+Row = collections.namedtuple('Row', ['table', 'values'])
+Field = collections.namedtuple('Field', ['section', 'key', 'value'])
+
+PROMPT_LINE_RE = re.compile(r'^[\w-]+#\s*$')
+SEPARATOR_RE = re.compile(r'^\s*-{2,}[-\s]*$')
+BORDER_RE = re.compile(r'^\s*={3,}\s*$')
+
+
+def iter_lines(chunks):
+    """Split a stream of text chunks into lines, without line endings."""
+    partial = ''
+    for chunk in chunks:
+        lines = (partial + chunk).split('\n')
+        partial = lines.pop()
+        for line in lines:
+            yield line.rstrip('\r')
+    if partial:
+        yield partial.rstrip('\r')
+
+
+class TableParser(object):
+    """Parse fixed-width tables: a header line, a dashed line, then rows.
+
+    Column boundaries come from the dashed line, so column names may have
+    spaces in them. A blank or border line ends the table.
+    """
+
+    def __init__(self, name, header_re):
+        self.name = name
+        self.header_re = re.compile(header_re)
+
+    def parse(self, lines):
+        header = None
+        columns = names = spans = None
+        for line in lines:
+            if columns is None:
+                if header is not None and SEPARATOR_RE.match(line):
+                    columns = self._columns(header, line)
+                    names = [name for name, _ in columns]
+                    spans = [span for _, span in columns]
+                else:
+                    header = line if self.header_re.search(line) else None
+            elif self._is_end(line):
+                header = columns = None
+            else:
+                yield Row(self.name, collections.OrderedDict(
+                    zip(names, [line[span].strip() for span in spans])))
+
+    @staticmethod
+    def _columns(header, separator):
+        spans = [m.span() for m in re.finditer(r'-+', separator)]
+        columns = []
+        for index, (start, end) in enumerate(spans):
+            end = spans[index + 1][0] if index + 1 < len(spans) else None
+            columns.append((header[start:end].strip(), slice(start, end)))
+        return columns
+
+    @staticmethod
+    def _is_end(line):
+        stripped = line.strip()
+        return (not stripped or stripped[0] == '='
+                or (stripped[-1] == '#' and PROMPT_LINE_RE.match(stripped)))
+
+
+class KeyValueParser(object):
+    """Parse 'key : value' lines, grouped in sections.
+
+    A line without a separator that is not blank starts a new section.
+    """
+
+    def __init__(self, separator=':'):
+        self.split_re = re.compile(r'^\s*([^%s]+?)\s*%s\s*(.*?)\s*$' % (separator, separator))
+
+    def parse(self, lines):
+        section = None
+        for line in lines:
+            if not line.strip() or BORDER_RE.match(line) or SEPARATOR_RE.match(line):
+                continue
+            if PROMPT_LINE_RE.match(line):
+                continue
+            match = self.split_re.match(line)
+            if match and match.group(2):
+                yield Field(section, match.group(1), match.group(2))
+            else:
+                section = line.strip().rstrip(':')
+
+
+PARSERS = []
+
+
+def register(command_re, parser):
+    """Map the commands matching command_re to a parser. Latest wins."""
+    PARSERS.insert(0, (re.compile(command_re), parser))
+
+
+def get_parser(command):
+    """Get the parser for a command, or None."""
+    for command_re, parser in PARSERS:
+        if command_re.search(command):
+            return parser
+    return None
+
+
+def parse(command, chunks):
+    """Parse the output chunks of a command, yielding records."""
+    parser = get_parser(command)
+    if parser is None:
+        raise ValueError('No parser for: %s' % command)
+    return parser.parse(_skip_echo(command, iter_lines(chunks)))
+
+
+def _skip_echo(command, lines):
+    echo = True
+    for line in lines:
+        if echo and line.strip():
+            echo = False
+            if command in line:
+                continue
+        yield line
+
+
+register(r'^show\s+version', KeyValueParser())
+register(r'^show\s+gen(eral)?\s+detail', KeyValueParser())
+register(r'^show\s+card\s+inv', TableParser('card inventory', r'^\s*Location\b'))
+register(r'^show\s+shelf\s+inv', TableParser('shelf inventory', r'^\s*(Shelf|Location)\b'))
+register(r'^show\s+card\s*$', TableParser('card', r'^\s*Location\b'))
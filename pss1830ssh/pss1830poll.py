@@ -0,0 +1,190 @@
+"""
+Poll commands on many NEs periodically, reporting only what changed.
+
+Each NE is polled every interval seconds, with its polls spread over the
+interval and jittered so that NEs do not all log in at once, and at most
+rate polls are started per second. Sessions are kept open between
+cycles in a SessionPool. The output of each command is compared with the
+one of the previous cycle, as records when pss1830parse has a parser for
+the command and as lines otherwise, and only the differences are yielded.
+
+How to use:
+    poller = Poller(nes, ['show card inv *'], interval=300, rate=5)
+    for change in poller.run():
+        print(change.host, change.command, change.added, change.removed)
+
+Call stop() from another thread to end run().
+"""
+import collections
+import heapq
+import logging
+import random
+import threading
+import time
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from pss1830ssh.pss1830 import PSSException
+from pss1830ssh.pss1830cli import PSS1830Cli
+from pss1830ssh.pss1830parse import get_parser, iter_lines, parse
+from pss1830ssh.pss1830pool import SessionPool
+
+
+Change = collections.namedtuple('Change', ['host', 'command', 'added', 'removed', 'error'])
+
+
+def diff(previous, current, key=None):
+    """Get the (added, removed) items of current against previous, in order.
+
+    Items are compared by key(item), the item itself by default. Repeated
+    items are counted, so a line appearing once more is added.
+    """
+    key = key or (lambda item: item)
+    old = collections.Counter(key(item) for item in previous)
+    new = collections.Counter(key(item) for item in current)
+    added = []
+    for item in current:
+        if old[key(item)] > 0:
+            old[key(item)] -= 1
+        else:
+            added.append(item)
+    removed = []
+    for item in previous:
+        if new[key(item)] > 0:
+            new[key(item)] -= 1
+        else:
+            removed.append(item)
+    return added, removed
+
+
+def _records(command, output):
+    if get_parser(command) is None:
+        return list(iter_lines([output]))
+    return list(parse(command, [output]))
+
+
+def _record_key(record):
+    if isinstance(record, tuple) and isinstance(record[-1], dict):
+        return record[:-1] + (tuple(sorted(record[-1].items())),)
+    return record
+
+
+class Poller(object):
+    """Poll commands on a list of NEs, yielding the changes of each cycle.
+
+    interval is the time between two polls of an NE, varied by up to
+    jitter times interval either way. The first polls are spread over
+    spread seconds, the interval by default. rate bounds the polls
+    started per second across all NEs and workers the polls running at
+    once. The first poll of an NE yields its whole output as added,
+    unless initial is False.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, nes, commands, interval=300, jitter=0.1, spread=None, rate=None,
+                 workers=10, session_class=PSS1830Cli, pool=None, initial=True, seed=None):
+        self.nes = list(nes)
+        self.commands = list(commands)
+        self.interval = interval
+        self.jitter = jitter
+        self.spread = interval if spread is None else spread
+        self.rate = rate
+        self.workers = workers
+        self.initial = initial
+        self.pool = pool or SessionPool(session_class, max_idle=len(self.nes),
+                                        ttl=max(600, 10 * interval),
+                                        idle_timeout=2 * interval + 60)
+        self._owns_pool = pool is None
+        self._random = random.Random(seed)
+        self._previous = {}
+        self._stopped = threading.Event()
+
+    def stop(self):
+        """Make run() return once the running polls are done."""
+        self._stopped.set()
+
+    def run(self, cycles=None):
+        """Poll until stopped, or cycles times per NE, yielding Changes."""
+        self._stopped.clear()
+        jobs = queue.Queue()
+        results = queue.Queue()
+        threads = []
+        for _ in range(min(self.workers, len(self.nes))):
+            thread = threading.Thread(target=self._worker, args=(jobs, results))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        now = time.time()
+        due = [(now + self._random.uniform(0, self.spread), index)
+               for index in range(len(self.nes))]
+        heapq.heapify(due)
+        polls = [0] * len(self.nes)
+        running = 0
+        next_start = now
+        try:
+            while running or (due and not self._stopped.is_set()):
+                now = time.time()
+                wait = 1.0
+                if due and not self._stopped.is_set():
+                    start = max(due[0][0], next_start)
+                    if start <= now:
+                        _, index = heapq.heappop(due)
+                        jobs.put(index)
+                        running += 1
+                        polls[index] += 1
+                        if self.rate:
+                            # no burst to catch up after an idle time
+                            next_start = max(next_start, now) + 1.0 / self.rate
+                        continue
+                    wait = min(start - now, wait)
+                try:
+                    index, changes = results.get(timeout=wait)
+                except queue.Empty:
+                    continue
+                running -= 1
+                for change in changes:
+                    yield change
+                if cycles is None or polls[index] < cycles:
+                    delay = self.interval * (1 + self._random.uniform(-self.jitter, self.jitter))
+                    heapq.heappush(due, (time.time() + delay, index))
+        finally:
+            for _ in threads:
+                jobs.put(None)
+            if self._owns_pool:
+                self.pool.close()
+
+    def _worker(self, jobs, results):
+        while True:
+            index = jobs.get()
+            if index is None:
+                return
+            results.put((index, self.poll(self.nes[index])))
+
+    def poll(self, ne):
+        """Poll the commands on one NE, getting the list of Changes."""
+        try:
+            with self.pool.session(ne.host, ne.port, ne.username, ne.password) as session:
+                outputs = [(command, ''.join(session.execute(command)))
+                           for command in self.commands]
+        except PSSException as err:
+            self.logger.info('Polling %s failed: %s', ne.host, err)
+            return [Change(ne.host, None, [], [], err)]
+        except Exception as err: #pylint: disable=broad-except
+            self.logger.exception('Polling %s failed', ne.host)
+            return [Change(ne.host, None, [], [], err)]
+        changes = []
+        for command, output in outputs:
+            records = _records(command, output)
+            key = (ne.host, ne.port, command)
+            previous = self._previous.get(key)
+            self._previous[key] = records
+            if previous is None and not self.initial:
+                continue
+            added, removed = diff(previous or [], records, _record_key)
+            if added or removed:
+                changes.append(Change(ne.host, command, added, removed, None))
+        return changes
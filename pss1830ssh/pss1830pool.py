@@ -0,0 +1,173 @@
+"""
+Pool of authenticated sessions kept alive per NE.
+
+How to use:
+    pool = SessionPool(PSS1830Cli, ttl=600, idle_timeout=120)
+    with pool.session('10.0.0.1', 22, 'admin', 'admin') as cli:
+        result = ''.join(cli.execute('show version'))
+    pool.close()
+"""
+import collections
+import contextlib
+import hashlib
+import logging
+import threading
+import time
+
+from pss1830ssh.pss1830cli import PSS1830Cli
+
+
+class _Entry(object):
+    """A pooled session and its bookkeeping."""
+
+    def __init__(self, key, session):
+        self.key = key
+        self.session = session
+        self.created = time.time()
+        self.last_used = self.created
+
+
+class SessionPool(object):
+    """Keep opened sessions per NE so they can be reused.
+
+    Idle sessions are health checked with a prompt round trip when they have
+    been idle longer than check_after seconds, closed once older than ttl or
+    idle longer than idle_timeout, and the least recently used ones are closed
+    when more than max_idle are kept.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, session_class=PSS1830Cli, max_idle=100, ttl=600,
+                 idle_timeout=120, check_after=5):
+        self.session_class = session_class
+        self.max_idle = max_idle
+        self.ttl = ttl
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._idle = collections.OrderedDict()
+        self._in_use = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def session(self, host, port, username, password, session_class=None):
+        """Context manager handing out an opened session.
+
+        The session goes back to the pool on exit, or is closed if the
+        block did not complete.
+        """
+        session = self.acquire(host, port, username, password, session_class)
+        healthy = False
+        try:
+            yield session
+            healthy = True
+        finally:
+            if healthy:
+                self.release(session)
+            else:
+                self.discard(session)
+
+    def acquire(self, host, port, username, password, session_class=None):
+        """Get an opened session, reusing an idle one if possible.
+
+        Sessions are only reused with the credentials they were opened with.
+        """
+        session_class = session_class or self.session_class
+        key = (session_class, host, port, username, _digest(password))
+        while True:
+            entry = self._pop_idle(key)
+            if entry is None:
+                break
+            if self._usable(entry):
+                self.hits += 1
+                return self._use(entry)
+            self._close(entry)
+        self.misses += 1
+        session = session_class(host, port, username, password)
+        opened = False
+        try:
+            session.open()
+            opened = True
+        finally:
+            if not opened:
+                # the transport may be up though the open failed
+                self._close_session(session, host)
+        return self._use(_Entry(key, session))
+
+    def release(self, session):
+        """Return a session to the pool."""
+        with self._lock:
+            entry = self._in_use.pop(id(session))
+            entry.last_used = time.time()
+            self._idle[id(session)] = entry
+            evicted = []
+            while len(self._idle) > self.max_idle:
+                evicted.append(self._idle.popitem(last=False)[1])
+        for entry in evicted:
+            self._close(entry)
+
+    def discard(self, session):
+        """Close a session handed out by the pool instead of returning it."""
+        with self._lock:
+            entry = self._in_use.pop(id(session))
+        self._close(entry)
+
+    def evict_expired(self):
+        """Close the idle sessions past their TTL or idle timeout."""
+        with self._lock:
+            expired = [entry for entry in self._idle.values() if self._expired(entry)]
+            for entry in expired:
+                del self._idle[id(entry.session)]
+        for entry in expired:
+            self._close(entry)
+
+    def close(self):
+        """Close all idle sessions."""
+        with self._lock:
+            entries = list(self._idle.values())
+            self._idle.clear()
+        for entry in entries:
+            self._close(entry)
+
+    def _pop_idle(self, key):
+        with self._lock:
+            for session_id in reversed(self._idle):
+                if self._idle[session_id].key == key:
+                    return self._idle.pop(session_id)
+        return None
+
+    def _use(self, entry):
+        with self._lock:
+            self._in_use[id(entry.session)] = entry
+        return entry.session
+
+    def _expired(self, entry):
+        now = time.time()
+        return (now - entry.created > self.ttl
+                or now - entry.last_used > self.idle_timeout)
+
+    def _usable(self, entry):
+        if self._expired(entry):
+            return False
+        if time.time() - entry.last_used > self.check_after:
+            return entry.session.is_alive()
+        return entry.session.connected
+
+    def _close(self, entry):
+        self.evictions += 1
+        self.logger.debug('Closing pooled session to %s', entry.key[1])
+        self._close_session(entry.session, entry.key[1])
+
+    def _close_session(self, session, host):
+        try:
+            session.close()
+        except Exception: #pylint: disable=broad-except
+            self.logger.debug('Error closing session to %s', host, exc_info=True)
+
+
+def _digest(password):
+    """Hash a password to key sessions without keeping it in the clear."""
+    return hashlib.sha256((password or '').encode('utf-8')).hexdigest()
@@ -0,0 +1,314 @@
+"""
+Record sessions to a file and replay them without an NE.
+
+How to use:
+    capture = Capture('/tmp/ne1.cap.gz')
+    cli = PSS1830Cli('10.0.0.1', 22, 'admin', 'admin')
+    cli.capture = capture # or PSS1830.capture for every session
+    cli.open()
+    cli.execute('show card inv *')
+    cli.close()
+    capture.close()
+
+    cli = PSS1830Cli('10.0.0.1', 22, 'admin', 'admin')
+    cli.client = ReplayClient('/tmp/ne1.cap.gz', speed=None) # as fast as possible
+    cli.open()
+    cli.execute('show card inv *')
+
+A capture has one line per event: the seconds since the capture started,
+the channel number, the event (o: opened, s: sent, r: received, c:
+closed) and its data, backslash escaped. It is compressed as its
+extension says (see pss1830sink.open_file). What is sent after a password
+prompt, or equal to a credential of the session, is recorded as
+<redacted>, so captures can be shared.
+
+On replay, the data received after the nth command sent is only given
+once the session has sent n commands, as long after it as when recorded
+divided by speed. Channels are replayed in the order they were opened,
+so sessions must open them in the same order as when recorded.
+"""
+import bz2
+import codecs
+import gzip
+import itertools
+import os
+import re
+import threading
+import time
+
+from pss1830ssh.pss1830 import PSSException
+from pss1830ssh.pss1830sink import EXTENSIONS, open_file
+
+REDACTED = b'<redacted>'
+PASSWORD_PROMPT_RE = re.compile(br'password:\s*$', re.IGNORECASE)
+
+
+def open_capture(path):
+    """Open a capture file for reading, decompressed as its extension says."""
+    compression = EXTENSIONS.get(os.path.splitext(path)[1])
+    if compression is None:
+        return open(path, 'rb')
+    if compression == 'gz':
+        return gzip.open(path, 'rb')
+    if compression == 'bz2':
+        return bz2.BZ2File(path, 'rb')
+    if compression == 'xz':
+        import lzma
+        return lzma.open(path, 'rb')
+    try:
+        import zstandard
+    except ImportError:
+        raise PSSException('zst compression requires the zstandard package')
+    return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'))
+
+
+def load(path, host=None):
+    """Load a capture as a list of channels, each a list of (time, event, data).
+
+    With host, only the channels opened to host are loaded.
+    """
+    channels = {}
+    with open_capture(path) as capture:
+        for line in capture:
+            stamp, number, event, data = line.rstrip(b'\r\n').split(b' ', 3)
+            data = codecs.escape_decode(data)[0]
+            if event == b'o':
+                if host is not None and data.decode('utf-8') != host:
+                    continue
+                channels[int(number)] = []
+            if int(number) in channels:
+                channels[int(number)].append((float(stamp), event.decode('ascii'), data))
+    return [channels[number] for number in sorted(channels)]
+
+
+class Capture(object):
+    """Record what sessions send and receive to a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open_file(path)
+        self._start = time.time()
+        self._numbers = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def wrap(self, client, host, secrets=()):
+        """Get client recording the channels it opens.
+
+        secrets are redacted when sent.
+        """
+        if isinstance(client, _RecordingClient):
+            return client
+        return _RecordingClient(client, self, host, secrets)
+
+    def opened(self, host):
+        """Record a new channel to host, getting its number."""
+        with self._lock:
+            number = next(self._numbers)
+        self.record(number, 'o', host)
+        return number
+
+    def record(self, number, event, data):
+        """Record an event of channel number."""
+        if not isinstance(data, bytes):
+            data = data.encode('utf-8')
+        line = b'%.6f %d %s %s\n' % (
+            time.time() - self._start, number, event.encode('ascii'), codecs.escape_encode(data)[0])
+        with self._lock:
+            if self._file is not None:
+                self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class _RecordingClient(object):
+    """SSH client wrapper recording its shells."""
+
+    def __init__(self, client, capture, host, secrets=()):
+        self._client = client
+        self._capture = capture
+        self._host = host
+        self._secrets = secrets
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def invoke_shell(self):
+        channel = self._client.invoke_shell()
+        return _RecordingChannel(
+            channel, self._capture, self._capture.opened(self._host), self._secrets)
+
+
+class _RecordingChannel(object):
+    """Channel wrapper recording what is sent and received."""
+
+    def __init__(self, channel, capture, number, secrets=()):
+        self._channel = channel
+        self._capture = capture
+        self._number = number
+        self._secrets = set(_encode(secret) for secret in secrets if secret)
+        self._tail = b''
+
+    def __getattr__(self, name):
+        return getattr(self._channel, name)
+
+    def sendall(self, data):
+        self._capture.record(self._number, 's', self._redact(_encode(data)))
+        self._tail = b''
+        return self._channel.sendall(data)
+
+    def recv(self, size):
+        data = self._channel.recv(size)
+        if data:
+            self._capture.record(self._number, 'r', data)
+            self._tail = (self._tail + data)[-64:]
+        return data
+
+    def _redact(self, data):
+        line = data.rstrip(b'\r\n')
+        if line and (line in self._secrets or PASSWORD_PROMPT_RE.search(self._tail)):
+            return REDACTED + data[len(line):]
+        return data
+
+    def close(self):
+        self._capture.record(self._number, 'c', '')
+        return self._channel.close()
+
+
+def _encode(data):
+    return data if isinstance(data, bytes) else data.encode('utf-8')
+
+
+class ReplayClient(object):
+    """Stand-in for paramiko's SSHClient replaying a capture.
+
+    speed scales the recorded delays, None replays as fast as possible.
+    With host, only the channels opened to host are replayed.
+    """
+
+    def __init__(self, path, speed=1.0, host=None):
+        self.speed = speed
+        self._channels = load(path, host)
+        self._opened = []
+        self._active = False
+
+    def connect(self, *args, **kwargs): #pylint: disable=unused-argument
+        self._active = True
+
+    def get_transport(self):
+        return self
+
+    def is_active(self):
+        return self._active
+
+    def invoke_shell(self):
+        if len(self._opened) >= len(self._channels):
+            raise PSSException('No more channels in the capture')
+        channel = ReplayChannel(self._channels[len(self._opened)], self.speed)
+        self._opened.append(channel)
+        return channel
+
+    def open_sftp(self):
+        raise PSSException('SFTP is not replayed')
+
+    def close(self):
+        self._active = False
+        for channel in self._opened:
+            channel.close()
+
+
+class ReplayChannel(object):
+    """Channel giving the data of a recorded channel.
+
+    Its fileno() is a pipe readable while data is ready, so that it can
+    be used with select like a paramiko channel.
+    """
+
+    def __init__(self, records, speed=1.0):
+        self.speed = speed
+        self.sent = []
+        self.closed = False
+        self._records = records
+        self._buffer = bytearray()
+        self._pipe = os.pipe()
+        self._readable = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._play)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def fileno(self):
+        return self._pipe[0]
+
+    def settimeout(self, timeout):
+        pass
+
+    def sendall(self, data):
+        with self._cond:
+            self.sent.append(data)
+            self._cond.notify_all()
+
+    def recv_ready(self):
+        with self._cond:
+            return bool(self._buffer)
+
+    def recv(self, size):
+        with self._cond:
+            data = bytes(self._buffer[:size])
+            self._consumed(len(data))
+        return data
+
+    def recv_into(self, buf):
+        """Read into a writable buffer, returns the number of bytes read."""
+        with self._cond:
+            size = min(len(buf), len(self._buffer))
+            buf[:size] = self._buffer[:size]
+            self._consumed(size)
+        return size
+
+    def _consumed(self, size):
+        del self._buffer[:size]
+        if not self._buffer and self._readable:
+            os.read(self._pipe[0], 1)
+            self._readable = False
+
+    def close(self):
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        for fd in self._pipe:
+            os.close(fd)
+
+    def _play(self):
+        sends = 0
+        started, recorded = time.time(), self._records[0][0] if self._records else 0
+        for stamp, event, data in self._records:
+            with self._cond:
+                if event == 's':
+                    sends += 1
+                    while len(self.sent) < sends and not self.closed:
+                        self._cond.wait()
+                    started, recorded = time.time(), stamp
+                elif event == 'r':
+                    due = started + (stamp - recorded) / self.speed if self.speed else 0
+                    while time.time() < due and not self.closed:
+                        self._cond.wait(due - time.time())
+                    if not self.closed:
+                        self._buffer += data
+                        if not self._readable:
+                            os.write(self._pipe[1], b'x')
+                            self._readable = True
+                if self.closed:
+                    return
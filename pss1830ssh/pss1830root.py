@@ -1,130 +1,463 @@
 """
 Abstraction for NE root shell 
 """
-import os
+import collections
+import re
+import threading
 import time
 from pss1830ssh.pss1830 import PSS1830
 from pss1830ssh.pss1830 import PSSException
+from pss1830ssh.pss1830 import SessionSteps
+from pss1830ssh.pss1830sftp import Transfer
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+MASTER_SHELF = 81
+
+# A shelf EC (slot is None) or a card to run root commands on
+Target = collections.namedtuple('Target', ['shelf', 'slot', 'ec', 'act'])
+Target.__new__.__defaults__ = (None, None, True)
+
+EC_PROMPT_RE = re.compile(r'root@(?:EC1830|32EC2)-(\d+)-(\d+)-(ACT|STDBY)')
+
+TargetResult = collections.namedtuple(
+    'TargetResult', ['target', 'outputs', 'error', 'elapsed'])
 
 
 def get_ec_ip(shelf, ec):
     return '100.0.{shelf}.{ec}'.format(shelf=shelf, ec=ec)
 
-class PSS1830Root(PSS1830):
-    """Wrapper for PSS root mode."""
+def get_other_ec(ec):
+    """Get the mate of an EC on the same shelf."""
+    return 1 if ec == 18 else 18
 
-    PROMPT_RE = '(root@EC1830-\d+-\d+-ACT:/root[\r\n]*# $)|'\
-                '(root@32EC2-\d+-\d+-ACT:[~\r\n]*# $)|'\
-                '(root@EC1830-\d+-\d+-STDBY:/root[\r\n]*# $)|'\
-                '(root@32EC2-\d+-\d+-STDBY:[~\r\n]*# $)'
-    telnet_prompt_re = '.*# $'
-    on_master = True
-    slot_ip = '100.0.{shelf}.{slot}'
+def get_stdby_ec(prompt):
+    """Get the standby EC of a shelf from the active EC's prompt."""
+    return get_other_ec(int(prompt.split('-')[2]))
 
-    def open(self):
-        super(PSS1830Root, self).open()
-        self._recv()
-        self._get_prompt()
+def parse_ec_prompt(prompt):
+    """Get (shelf, ec, act) from an EC's prompt, or None for other prompts."""
+    match = EC_PROMPT_RE.search(prompt or '')
+    if not match:
+        return None
+    return int(match.group(1)), int(match.group(2)), match.group(3) == 'ACT'
 
-    def close(self):
-        self._send('exit')
-        super(PSS1830Root, self).close()
+class RootSteps(SessionSteps):
+    """Root shell navigation free of I/O, see SessionSteps.
+
+    Keeps the position of the session as the telnet hops from the master
+    active EC.
+    """
+
+    PROMPT_RE = re.compile(r'(root@EC1830-\d+-\d+-ACT:/root[\r\n]*# $)|'
+                           r'(root@32EC2-\d+-\d+-ACT:[~\r\n]*# $)|'
+                           r'(root@EC1830-\d+-\d+-STDBY:/root[\r\n]*# $)|'
+                           r'(root@32EC2-\d+-\d+-STDBY:[~\r\n]*# $)')
+    telnet_prompt_re = re.compile(r'[^\r\n]*# $')
+    LOGIN_RE = re.compile(r'login:')
+    PASSWORD_RE = re.compile(r'Password:')
+    TELNET_AUTH_RE = re.compile(
+        r'(?P<password>%s)|%s' % (PASSWORD_RE.pattern, telnet_prompt_re.pattern), re.DOTALL)
+    slot_ip = '100.0.{shelf}.{slot}'
+
+    def _init_position(self):
+        # telnet hops from the master active EC, as Targets with the EC resolved
+        self.position = []
+        # active EC per shelf as last seen
+        self.active_ec = {}
+        self.telnets = 0
 
     def is_on_master(self):
-        return self.on_master
+        for hop in reversed(self.position):
+            if hop.slot is None:
+                return hop.shelf == MASTER_SHELF
+        return True
 
     def is_on_active(self):
         """Check if it is currently on active EC."""
         return 'ACT' in self.prompt
 
-    def _exit(self):
-        self._send('exit')
-        self._get_prompt()
+    def _on_way_to(self, target):
+        """Check if the current hop leads to the target."""
+        hop = self.position[-1]
+        if target.slot:
+            return hop.slot is None or hop == Target(target.shelf, target.slot)
+        return (hop.slot is None and hop.shelf == target.shelf
+                and hop.act == target.act and target.ec in (None, hop.ec))
 
-    def _telnet(self, ip):
+    def _is_home(self, target):
+        """Check if the target is the master active EC."""
+        return (target.shelf == MASTER_SHELF and target.act
+                and target.ec in (None, self.active_ec.get(MASTER_SHELF)))
+
+    def _learn_active_ec(self):
+        """Update the active EC cache from the current prompt."""
+        state = parse_ec_prompt(self.prompt)
+        if state:
+            shelf, ec, act = state
+            self.active_ec[shelf] = ec if act else get_other_ec(ec)
+        return state
+
+    def _open_steps(self):
+        yield ('call', self._wait_banner_steps())
+        yield ('call', self._get_prompt_steps(), 'prompt')
+        self.position = []
+        self._learn_active_ec()
+
+    def _goto_steps(self, shelf, slot=None, ec=None, act=True):
+        target = Target(shelf, slot, ec, act)
+        while self.position and not self._on_way_to(target):
+            yield ('call', self._exit_steps())
+        if slot:
+            if not self.position or self.position[-1] != Target(shelf, slot):
+                yield ('call', self._login_to_slot_steps(shelf, slot))
+        elif not self.position and not self._is_home(target):
+            yield ('call', self._login_to_shelf_steps(shelf, ec, act))
+
+    def _exit_steps(self):
+        yield ('send', 'exit')
+        if self.position:
+            self.position.pop()
+        # the outer shell prints its prompt, which would otherwise end
+        # the output of the next command
+        yield ('expect', self.telnet_prompt_re)
+        yield ('call', self._get_prompt_steps(), 'prompt')
+
+    def _telnet_steps(self, ip):
         self.logger.debug('telnet %s', ip)
-        self._send('telnet %s' % ip)
-        if self._expect('login:'):            
-            self._send(self.username)
-            time.sleep(1)
-            data = self._recv()
-            if self._match('Password:', data):
-                self._send(self.password)
+        self.telnets += 1
+        yield ('send', 'telnet %s' % ip)
+        if (yield ('expect', self.LOGIN_RE)):
+            yield ('send', self.username)
+            match = yield ('expect', self.TELNET_AUTH_RE)
+            if match and match.group('password'):
+                yield ('send', self.password)
+                # wait for the shell's own prompt, which would otherwise
+                # end the output of the next command
+                match = yield ('expect', self.telnet_prompt_re)
+            if match:
                 self.logger.debug('telnet %s succeeded', ip)
-                return True
-            elif self._match(self.telnet_prompt_re, data):
-                self.logger.debug('telnet %s succeeded', ip)
-                return True
-        self.cancel()
+                yield ('give', True)
+        yield ('cancel',)
         self.logger.debug('telnet %s failed', ip)
-        return False
-    
-    def login_to_slot(self, shelf, slot):
-        """Telnet to a card/slot."""
+        yield ('give', False)
+
+    def _login_to_slot_steps(self, shelf, slot):
         self.logger.debug('Logging in slot: %s/%s', shelf, slot)
-        if self._telnet(self.slot_ip.format(shelf=shelf, slot=slot)):
-            if self._get_prompt(self.telnet_prompt_re):
+        if (yield ('call', self._telnet_steps(self.slot_ip.format(shelf=shelf, slot=slot)),
+                   'telnet')):
+            if (yield ('call', self._get_prompt_steps(self.telnet_prompt_re), 'prompt')):
+                self.position.append(Target(shelf, slot))
                 self.logger.debug('Logged in slot: %s/%s', shelf, slot)
-                return True
+                yield ('give', True)
         raise PSSException('Failed to login to slot: %s/%s' % (shelf, slot))
 
-    def logout_from_slot(self):
-        if not self.is_on_active():
+    def _logout_from_slot_steps(self):
+        if self.position and self.position[-1].slot:
             self.logger.debug('Logging out slot')
-            self._exit()
+            yield ('call', self._exit_steps())
 
-    def login_to_shelf(self, shelf, ec=None, act=True):
-        """Telnet to a slave shelf."""
-        self.logger.debug('Logging in shelf: %s (ec=%s, act=%s)' % (shelf, ec, act))
-        ec_cards = [ec] if ec else [1, 18]
-        login_ok = False
+    def _login_to_shelf_steps(self, shelf, ec=None, act=True):
+        self.logger.debug('Logging in shelf: %s (ec=%s, act=%s)', shelf, ec, act)
+        if ec:
+            ec_cards = [ec]
+        elif shelf in self.active_ec:
+            first = self.active_ec[shelf] if act else get_other_ec(self.active_ec[shelf])
+            ec_cards = [first, get_other_ec(first)]
+        else:
+            ec_cards = [1, 18]
         for e in ec_cards:
-            if self._telnet(get_ec_ip(shelf, e)):
-                if self._get_prompt() and self.is_on_active() == act:
-                    self.on_master = shelf == 81
-                    login_ok = True
-                    break
-                elif self.prompt:
-                    self._exit()
-                else:
-                    self.cancel()
-        if not login_ok:
-            raise PSSException('Failed to login to shelf (shelf=%s, ec=%s)' % (shelf, e))
+            if (yield ('call', self._telnet_steps(get_ec_ip(shelf, e)), 'telnet')):
+                if (yield ('call', self._get_prompt_steps(), 'prompt')):
+                    self.position.append(Target(shelf, None, e, self.is_on_active()))
+                    self._learn_active_ec()
+                    if self.is_on_active() == act:
+                        yield ('give', None)
+                    yield ('call', self._exit_steps())
+                    continue
+                yield ('cancel',)
+            self.active_ec.pop(shelf, None)
+        raise PSSException('Failed to login to shelf (shelf=%s, ec=%s)' % (shelf, e))
 
-    def logout_from_shelf(self):
-        """Logout from a slave shelf."""
+    def _logout_from_shelf_steps(self):
         self.logger.debug('Logging out shelf')
         if not self.is_on_master():
-            self._exit()
+            while not self.is_on_master():
+                yield ('call', self._exit_steps())
             if not self.prompt:
                 raise PSSException('Logout from an EC failed. Failed to get the prompt')
-    
-    def login_to_stdby(self):
-        """Login to Standby EC."""
+
+    def _login_to_stdby_steps(self):
         if self.is_on_active() and self.is_on_master():
             self.logger.debug('Logging in standby EC')
-            act_ec = int(self.prompt.split('-')[2])
-            stdby_ec = 1 if act_ec == 18 else 18
-            self.login_to_shelf(shelf=81, ec=stdby_ec, act=False)
+            yield ('call', self._login_to_shelf_steps(
+                MASTER_SHELF, get_stdby_ec(self.prompt), False))
 
-    def logout_from_stdby(self):
+    def _logout_from_stdby_steps(self):
         if not self.is_on_active():
             self.logger.debug('Logging out standby EC')
-            self._exit()
+            yield ('call', self._exit_steps())
+
+
+class PSS1830Root(RootSteps, PSS1830):
+    """Wrapper for PSS root mode."""
+
+    ERROR_RE = re.compile(r'^.*(command not found|No such file or directory).*$', re.MULTILINE)
+    INTERACTIVE_RE = re.compile(r'^\s*(telnet|ssh|vi|top|less|more)\b')
+    # the ARP table of the master active EC lists the shelves it talks to
+    SHELVES_COMMAND = 'cat /proc/net/arp'
+    SHELF_IP_RE = re.compile(r'^100\.0\.(\d+)\.\d+\s', re.MULTILINE)
+    parent = None
+    # settings a spawned shell gets from the session spawning it
+    SPAWN_SETTINGS = ('TIMEOUT', 'read_size', 'min_read_size', 'max_buffered', 'window_size',
+                      'stall_time', 'partial_size', 'resync_timeout', 'cache', 'metrics',
+                      'capture', 'slot_ip')
+
+    def __init__(self, host, port, username, password):
+        super(PSS1830Root, self).__init__(host, port, username, password)
+        self._init_position()
+
+    def open(self):
+        super(PSS1830Root, self).open()
+        self._run_steps(self._open_steps())
+
+    def close(self):
+        if self.parent:
+            self.logger.info('Closing shell')
+            try:
+                if self.connected:
+                    self._send('exit')
+            finally:
+                self.connected = False
+                try:
+                    self.channel.close()
+                finally:
+                    self._close_wake()
+            return
+        try:
+            if self.connected:
+                self._send('exit')
+        finally:
+            super(PSS1830Root, self).close()
+
+    def spawn(self):
+        """Open another root shell on the same SSH transport.
 
-    def get_file(self, remotepath, localpath, callback=None, recursive=True):
+        The new shell starts on the master shelf's active EC and can be
+        moved around independently. Closing it leaves this session open.
+        """
+        if not self.connected:
+            raise PSSException('Not connected')
+        shell = self.__class__(self.host, self.port, self.username, self.password)
+        for name in self.SPAWN_SETTINGS:
+            setattr(shell, name, getattr(self, name))
+        shell.parent = self
+        shell.client = self.client
+        shell.channel = self.client.invoke_shell()
+        shell.channel.settimeout(self.TIMEOUT)
+        shell._read_size = min(shell.read_size, shell.max_buffered)
+        shell._open_wake()
+        shell.connected = True
+        shell.active_ec = self.active_ec
+        shell._wait_banner()
+        if not shell._get_prompt():
+            shell.close()
+            raise PSSException('Failed to get the prompt on a new shell')
+        return shell
+
+    def run_parallel(self, targets, commands, max_shells=8):
+        """Run commands on several targets at once, one shell per worker.
+
+        Yields a TargetResult for each target as soon as it is done. A
+        failure on one target does not affect the others. A worker that
+        cannot open its shell, e.g. as the NE limits the sessions per
+        connection, leaves its target to the others.
+        """
+        jobs = queue.Queue()
+        results = queue.Queue()
+        targets = [Target(**t) if isinstance(t, dict) else t for t in targets]
+        for target in targets:
+            jobs.put(target)
+        workers = []
+        for _ in range(min(max_shells, len(targets))):
+            worker = threading.Thread(target=self._shell_worker, args=(jobs, results, commands))
+            worker.daemon = True
+            worker.start()
+            workers.append(worker)
+        pending = collections.Counter(targets)
+        error = None
+        try:
+            while sum(pending.values()):
+                try:
+                    result = results.get(timeout=1)
+                except queue.Empty:
+                    if any(worker.is_alive() for worker in workers) or not results.empty():
+                        continue
+                    # no worker left, the targets never run fail
+                    for target in list(pending.elements()):
+                        yield TargetResult(
+                            target, [], error or PSSException('No shell left for %s' % (target,)), 0)
+                    return
+                if result.target is None: # a shell could not be spawned
+                    error = result.error
+                    continue
+                pending[result.target] -= 1
+                yield result
+        finally:
+            # the targets not started are dropped if iterating stopped early
+            while True:
+                try:
+                    jobs.get_nowait()
+                except queue.Empty:
+                    break
+            # workers wait for targets given back until all are done
+            for worker in workers:
+                jobs.put(None)
+            for worker in workers:
+                worker.join()
+
+    def sweep_slots(self, shelf, slots, commands, max_shells=8):
+        """Run commands on several slots of a shelf at once.
+
+        Each slot is reached from a shell of its own, up to max_shells,
+        below the NE's limit of sessions per connection. Yields a
+        TargetResult per slot as soon as it is done.
+        """
+        targets = [Target(shelf, slot) for slot in slots]
+        return self.run_parallel(targets, commands, max_shells)
+
+    def discover_shelves(self):
+        """Get the shelves of the NE, the master shelf first."""
+        self.goto(MASTER_SHELF)
+        output = ''.join(self.execute(self.SHELVES_COMMAND))
+        shelves = set(int(shelf) for shelf in self.SHELF_IP_RE.findall(output))
+        shelves.discard(MASTER_SHELF)
+        return [MASTER_SHELF] + sorted(shelves)
+
+    def run_on_all_ecs(self, commands, include_standby=True, shelves=None, max_shells=8):
+        """Run commands on the active and standby EC of every shelf at once.
+
+        shelves are discovered if not given. Returns an OrderedDict of
+        TargetResult per EC, keyed by Target with the EC resolved when
+        known. A failure on one EC does not affect the others.
+        """
+        if shelves is None:
+            shelves = self.discover_shelves()
+        targets = [Target(shelf, act=act) for shelf in shelves
+                   for act in ((True, False) if include_standby else (True,))]
+        results = dict((result.target, result)
+                       for result in self.run_parallel(targets, commands, max_shells))
+        ecs = collections.OrderedDict()
+        for target in targets:
+            result = results[target]
+            # spawned shells share active_ec, so it knows every shelf reached
+            active = self.active_ec.get(target.shelf)
+            if active is not None:
+                target = target._replace(ec=active if target.act else get_other_ec(active))
+                result = result._replace(target=target)
+            ecs[target] = result
+        return ecs
+
+    def _shell_worker(self, jobs, results, commands):
+        shell = None
+        try:
+            while True:
+                target = jobs.get()
+                if target is None:
+                    break
+                if shell is None:
+                    try:
+                        shell = self.spawn()
+                    except Exception as err: #pylint: disable=broad-except
+                        self.logger.debug('Failed to spawn a shell: %s', err)
+                        jobs.put(target)
+                        results.put(TargetResult(None, [], err, 0))
+                        break
+                start = time.time()
+                try:
+                    results.put(TargetResult(
+                        target, shell.run_on(target, commands), None, time.time() - start))
+                except Exception as err: #pylint: disable=broad-except
+                    self.logger.debug('%s failed: %s', target, err)
+                    results.put(TargetResult(target, [], err, time.time() - start))
+                    self._close_shell(shell)
+                    shell = None
+        finally:
+            self._close_shell(shell)
+
+    def _close_shell(self, shell):
+        """Close a spawned shell, which may be broken."""
+        if shell is None:
+            return
+        try:
+            shell.close()
+        except Exception: #pylint: disable=broad-except
+            self.logger.debug('Error closing a shell', exc_info=True)
+
+    def run_on(self, target, commands):
+        """Go to a target and run the commands.
+
+        Returns a list of (command, output).
+        """
+        self.goto(*target)
+        return [(command, ''.join(self.execute(command))) for command in commands]
+
+    def goto(self, shelf, slot=None, ec=None, act=True):
+        """Move to a shelf EC or a slot with the fewest exits and telnets.
+
+        Slots are reached from the EC the session is on, ECs from the
+        master active EC.
+        """
+        self._run_steps(self._goto_steps(shelf, slot, ec, act))
+
+    def _cache_target(self):
+        return tuple(self.position)
+
+    def _exit(self):
+        self._run_steps(self._exit_steps())
+
+    def _telnet(self, ip):
+        return self._run_steps(self._telnet_steps(ip), 'telnet')
+
+    def login_to_slot(self, shelf, slot):
+        """Telnet to a card/slot."""
+        return self._run_steps(self._login_to_slot_steps(shelf, slot))
+
+    def logout_from_slot(self):
+        self._run_steps(self._logout_from_slot_steps())
+
+    def login_to_shelf(self, shelf, ec=None, act=True):
+        """Telnet to a slave shelf.
+
+        Without ec, the EC last seen in the wanted state is tried first.
+        """
+        self._run_steps(self._login_to_shelf_steps(shelf, ec, act))
+
+    def logout_from_shelf(self):
+        """Logout from a slave shelf."""
+        self._run_steps(self._logout_from_shelf_steps())
+
+    def login_to_stdby(self):
+        """Login to Standby EC."""
+        self._run_steps(self._login_to_stdby_steps())
+
+    def logout_from_stdby(self):
+        self._run_steps(self._logout_from_stdby_steps())
+
+    def get_file(self, remotepath, localpath, callback=None, recursive=True, workers=4):
         """Get files from the NE to the local machine
+
+        remotepath can be a file or a directory, walked recursively if
+        recursive. Unchanged files are skipped and partial ones resumed.
+        callback(done, total) gets the bytes transferred across all files.
         """
-        self.logger.debug('Openning SFTP')
-        scp = self.client.open_sftp()
-        if recursive:
-            scp.chdir(remotepath)
-            for fname in scp.listdir():
-                remote = os.path.join(remotepath, fname)
-                local = os.path.join(localpath, fname)
-                self.logger.debug('Transferring: %s to %s' % (remote, local))
-                scp.get(remote, local, callback)
-        else:
-            self.logger.debug('Transferring: %s to %s' % (remotepath, localpath))
-            scp.get(remotepath, localpath, callback)
-        scp.close()
+        self.logger.debug('Transferring: %s to %s', remotepath, localpath)
+        return Transfer(self.client, workers, callback).get(remotepath, localpath, recursive)
+
+    def put_file(self, localpath, remotepath, callback=None, recursive=True, workers=4):
+        """Put files from the local machine on the NE, like get_file."""
+        self.logger.debug('Transferring: %s to %s', localpath, remotepath)
+        return Transfer(self.client, workers, callback).put(localpath, remotepath, recursive)
@@ -0,0 +1,260 @@
+"""
+Parallel, resumable SFTP transfers over an opened SSH session.
+
+How to use:
+    transfer = Transfer(root.client, workers=4, callback=print)
+    transfer.get('/var/log', '/tmp/ne1/log') # recursive
+    transfer.put('/tmp/patch', '/root/patch')
+"""
+import logging
+import os
+import posixpath
+import re
+import stat
+import threading
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from pss1830ssh.pss1830 import PSSException
+
+PART_SUFFIX = '.part'
+
+
+class FileTransfer(object):
+    """One file to transfer, with its size and modification time."""
+
+    def __init__(self, source, dest, size, mtime):
+        self.source = source
+        self.dest = dest
+        self.size = size
+        self.mtime = mtime
+        self.error = None
+        self.skipped = False
+
+    def __repr__(self):
+        return '<FileTransfer %s -> %s>' % (self.source, self.dest)
+
+
+class Transfer(object):
+    """Transfer files and directory trees with several SFTP channels.
+
+    Files whose size and mtime match at the destination are skipped. Files
+    are written to a .part file first, so an interrupted transfer resumes
+    from where it stopped. The .part file is named after the source's size
+    and mtime, so it is discarded rather than resumed if the source has
+    changed since. callback(done, total) is called with the bytes
+    transferred across all files.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, client, workers=4, callback=None, block_size=32768):
+        self.client = client
+        self.workers = workers
+        self.callback = callback
+        self.block_size = block_size
+        self.done = 0
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def get(self, remotepath, localpath, recursive=True):
+        """Get a file, or a directory tree if recursive, from the NE."""
+        sftp = self.client.open_sftp()
+        try:
+            files = self._walk_remote(sftp, remotepath, localpath, recursive)
+        finally:
+            sftp.close()
+        return self._run(files, self._get_one)
+
+    def put(self, localpath, remotepath, recursive=True):
+        """Put a file, or a directory tree if recursive, on the NE."""
+        files = self._walk_local(localpath, remotepath, recursive)
+        sftp = self.client.open_sftp()
+        try:
+            for dirname in sorted(set(posixpath.dirname(f.dest) for f in files)):
+                self._makedirs_remote(sftp, dirname)
+        finally:
+            sftp.close()
+        return self._run(files, self._put_one)
+
+    def _walk_remote(self, sftp, remotepath, localpath, recursive):
+        attr = sftp.stat(remotepath)
+        if not stat.S_ISDIR(attr.st_mode):
+            return [FileTransfer(remotepath, localpath, attr.st_size, attr.st_mtime)]
+        files = []
+        for attr in sftp.listdir_attr(remotepath):
+            remote = posixpath.join(remotepath, attr.filename)
+            local = os.path.join(localpath, attr.filename)
+            if stat.S_ISDIR(attr.st_mode):
+                if recursive:
+                    files.extend(self._walk_remote(sftp, remote, local, recursive))
+            else:
+                files.append(FileTransfer(remote, local, attr.st_size, attr.st_mtime))
+        return files
+
+    def _walk_local(self, localpath, remotepath, recursive):
+        if not os.path.isdir(localpath):
+            info = os.stat(localpath)
+            return [FileTransfer(localpath, remotepath, info.st_size, int(info.st_mtime))]
+        files = []
+        for fname in sorted(os.listdir(localpath)):
+            local = os.path.join(localpath, fname)
+            remote = posixpath.join(remotepath, fname)
+            if os.path.isdir(local):
+                if recursive:
+                    files.extend(self._walk_local(local, remote, recursive))
+            else:
+                info = os.stat(local)
+                files.append(FileTransfer(local, remote, info.st_size, int(info.st_mtime)))
+        return files
+
+    @staticmethod
+    def _makedirs_remote(sftp, dirname):
+        parts = []
+        while dirname not in ('', '/'):
+            try:
+                sftp.stat(dirname)
+                break
+            except IOError:
+                parts.append(dirname)
+                dirname = posixpath.dirname(dirname)
+        for path in reversed(parts):
+            sftp.mkdir(path)
+
+    def _run(self, files, transfer_one):
+        """Transfer files with a pool of workers, each with its own channel."""
+        self.done = 0
+        self.total = sum(f.size for f in files)
+        jobs = queue.Queue()
+        for item in files:
+            jobs.put(item)
+        threads = []
+        for _ in range(min(self.workers, len(files))):
+            jobs.put(None)
+            thread = threading.Thread(target=self._worker, args=(jobs, transfer_one))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        failed = [f for f in files if f.error]
+        if failed:
+            raise PSSException('Failed to transfer %d of %d files: %s' % (
+                len(failed), len(files),
+                ', '.join('%s (%s)' % (f.source, f.error) for f in failed)))
+        return files
+
+    def _worker(self, jobs, transfer_one):
+        sftp = None
+        try:
+            while True:
+                item = jobs.get()
+                if item is None:
+                    return
+                try:
+                    if sftp is None:
+                        sftp = self.client.open_sftp()
+                    transfer_one(sftp, item)
+                except Exception as err: #pylint: disable=broad-except
+                    self.logger.debug('Transferring %s failed: %s', item.source, err)
+                    item.error = err
+        finally:
+            if sftp:
+                sftp.close()
+
+    def _progress(self, nbytes):
+        with self._lock:
+            self.done += nbytes
+            done, total = self.done, self.total
+        if self.callback:
+            self.callback(done, total)
+
+    @staticmethod
+    def _part(path, item):
+        """Get the .part file of path for the source of item."""
+        return '%s.%d-%d%s' % (path, item.size, int(item.mtime), PART_SUFFIX)
+
+    @staticmethod
+    def _stale_parts(basename, item, names):
+        """Get the .part files of basename among names left by other sources."""
+        part_re = re.compile(r'%s(\.\d+-\d+)?%s$' % (re.escape(basename), re.escape(PART_SUFFIX)))
+        current = Transfer._part(basename, item)
+        return [name for name in names if part_re.match(name) and name != current]
+
+    def _get_one(self, sftp, item):
+        if os.path.exists(item.dest):
+            info = os.stat(item.dest)
+            if info.st_size == item.size and int(info.st_mtime) == int(item.mtime):
+                item.skipped = True
+                self._progress(item.size)
+                return
+        dirname = os.path.dirname(item.dest)
+        if dirname and not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                if not os.path.isdir(dirname):
+                    raise
+        part = self._part(item.dest, item)
+        if os.path.exists(part):
+            offset = os.path.getsize(part)
+        else:
+            offset = 0
+            names = os.listdir(dirname or os.curdir)
+            for name in self._stale_parts(os.path.basename(item.dest), item, names):
+                os.remove(os.path.join(dirname, name))
+        if offset > item.size:
+            offset = 0
+        self.logger.debug('Transferring: %s to %s from %d', item.source, item.dest, offset)
+        self._progress(offset)
+        with sftp.open(item.source, 'rb') as source:
+            source.seek(offset)
+            # prefetches from the offset up to the given end of the file
+            source.prefetch(item.size)
+            with open(part, 'ab' if offset else 'wb') as dest:
+                self._copy(source, dest)
+        os.utime(part, (item.mtime, item.mtime))
+        if os.path.exists(item.dest):
+            os.remove(item.dest)
+        os.rename(part, item.dest)
+
+    def _put_one(self, sftp, item):
+        try:
+            attr = sftp.stat(item.dest)
+            if attr.st_size == item.size and int(attr.st_mtime) == item.mtime:
+                item.skipped = True
+                self._progress(item.size)
+                return
+        except IOError:
+            pass
+        part = self._part(item.dest, item)
+        try:
+            offset = sftp.stat(part).st_size
+        except IOError:
+            offset = 0
+            dirname = posixpath.dirname(item.dest)
+            names = sftp.listdir(dirname or '.')
+            for name in self._stale_parts(posixpath.basename(item.dest), item, names):
+                sftp.remove(posixpath.join(dirname, name))
+        if offset > item.size:
+            offset = 0
+        self.logger.debug('Transferring: %s to %s from %d', item.source, item.dest, offset)
+        self._progress(offset)
+        with open(item.source, 'rb') as source:
+            source.seek(offset)
+            with sftp.open(part, 'ab' if offset else 'wb') as dest:
+                dest.set_pipelined(True)
+                self._copy(source, dest)
+        sftp.utime(part, (item.mtime, item.mtime))
+        sftp.posix_rename(part, item.dest)
+
+    def _copy(self, source, dest):
+        while True:
+            data = source.read(self.block_size)
+            if not data:
+                return
+            dest.write(data)
+            self._progress(len(data))
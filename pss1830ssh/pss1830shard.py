@@ -0,0 +1,123 @@
+"""
+Run fleet jobs across several processes, for when one CPU is not enough.
+
+SSH crypto, prompt matching and parsing all hold the GIL, so a single
+FleetRunner tops out at one core. ShardedRunner splits the NEs across
+worker processes, each running its own FleetRunner, and streams the
+results back to the calling process.
+
+How to use:
+    runner = ShardedRunner(processes=4, workers=20)
+    for result in runner.run(nes, ['show version']):
+        print(result.host, result.error or result.outputs)
+
+or from the shell:
+    pss1830-fleet inventory.txt commands.txt --processes 4 --workers 20
+"""
+import collections
+import logging
+import multiprocessing
+import pickle
+import zlib
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from pss1830ssh.pss1830 import PSSException
+from pss1830ssh.pss1830cli import PSS1830Cli
+from pss1830ssh.pss1830fleet import FleetResult, FleetRunner
+
+
+class ShardedRunner(object):
+    """Run commands on a list of NEs using a pool of worker processes.
+
+    NEs are split into one shard per process by host, so that per_host
+    still holds. Each process runs a FleetRunner with the other
+    arguments. Results are yielded by the calling process only, as they
+    finish; if a process dies, its unfinished NEs fail.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, processes=None, session_class=PSS1830Cli, workers=10, per_host=1,
+                 timeout=300, retries=2, backoff=1.0):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.runner_args = dict(session_class=session_class, workers=workers,
+                                per_host=per_host, timeout=timeout, retries=retries,
+                                backoff=backoff)
+
+    def shard(self, nes):
+        """Split the NEs into one list per process."""
+        shards = [[] for _ in range(self.processes)]
+        for ne in nes:
+            shards[zlib.crc32(ne.host.encode()) % self.processes].append(ne)
+        return shards
+
+    def run(self, nes, commands):
+        """Run the commands on every NE, yielding results as they finish."""
+        results = multiprocessing.Queue()
+        workers = {}
+        pending = {}
+        dead = set()
+        for index, shard in enumerate(self.shard(nes)):
+            if not shard:
+                continue
+            process = multiprocessing.Process(
+                target=_shard_worker, args=(index, self.runner_args, shard, commands, results))
+            process.daemon = True
+            process.start()
+            workers[index] = process
+            pending[index] = collections.Counter(shard)
+        try:
+            while workers:
+                try:
+                    index, result = results.get(timeout=1)
+                except queue.Empty:
+                    for failed in self._reap(workers, pending, dead):
+                        yield failed
+                    continue
+                if result is None:
+                    workers.pop(index).join()
+                    continue
+                pending[index][result.ne] -= 1
+                yield result
+        finally:
+            for process in workers.values():
+                process.terminate()
+
+    def _reap(self, workers, pending, dead):
+        """Fail the NEs of the processes that died before finishing.
+
+        A process is reaped when still found dead after a timeout, so that
+        the results it sent before exiting are received first.
+        """
+        for index, process in list(workers.items()):
+            if process.is_alive():
+                continue
+            if index not in dead:
+                dead.add(index)
+                continue
+            del workers[index]
+            self.logger.warning('Shard %s exited with code %s', index, process.exitcode)
+            for ne in pending.pop(index).elements():
+                result = FleetResult(ne)
+                result.error = PSSException(
+                    'Worker process exited with code %s' % process.exitcode)
+                yield result
+
+
+def _shard_worker(index, runner_args, nes, commands, results):
+    for result in FleetRunner(**runner_args).run(nes, commands):
+        results.put((index, _portable(result)))
+    results.put((index, None))
+
+
+def _portable(result):
+    """Make sure a result can be sent to another process."""
+    try:
+        pickle.loads(pickle.dumps(result.error))
+    except Exception: #pylint: disable=broad-except
+        result.error = PSSException('%s: %s' % (type(result.error).__name__, result.error))
+    return result
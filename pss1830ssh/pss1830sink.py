@@ -0,0 +1,111 @@
+"""
+Sinks writing command outputs as they arrive, optionally compressed.
+
+How to use:
+    cli.execute('show card inv *', sink='/tmp/inv.txt.gz') # a path
+    with open('/tmp/inv.txt', 'wb') as f:
+        cli.execute('show card inv *', sink=f) # a binary file object
+    cli.execute('show card inv *', sink=chunks.append) # a callback
+    layout = SinkLayout('/var/dumps', compression='gz', keep=7)
+    cli.execute('show card inv *', sink=layout) # /var/dumps/<host>/<command>/<time>.txt.gz
+
+Sinks get the output as bytes, in the chunks read from the NE, so the
+memory used does not depend on the size of the output.
+"""
+import bz2
+import gzip
+import os
+import re
+import threading
+import time
+
+from pss1830ssh.pss1830 import PSSException
+
+try:
+    STRING_TYPES = (str, unicode) #pylint: disable=undefined-variable
+except NameError:
+    STRING_TYPES = (str,)
+
+EXTENSIONS = {'.gz': 'gz', '.bz2': 'bz2', '.xz': 'xz', '.zst': 'zst'}
+
+
+def open_file(path, compression=None):
+    """Open a file for writing, compressed as its extension says.
+
+    compression ('gz', 'bz2', 'xz' or 'zst') overrides the extension.
+    """
+    if compression is None:
+        compression = EXTENSIONS.get(os.path.splitext(path)[1])
+    if compression is None:
+        return open(path, 'wb')
+    if compression == 'gz':
+        return gzip.open(path, 'wb', compresslevel=6)
+    if compression == 'bz2':
+        return bz2.BZ2File(path, 'wb')
+    if compression == 'xz':
+        import lzma
+        return lzma.open(path, 'wb')
+    if compression == 'zst':
+        try:
+            import zstandard
+        except ImportError:
+            raise PSSException('zst compression requires the zstandard package')
+        return zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+    raise PSSException('Unknown compression: %s' % compression)
+
+
+class SinkLayout(object):
+    """Write each output to its own file under root/<host>/<command>/.
+
+    Files are named after the time of the command and compressed with
+    compression. Only the keep most recent files of a host and command
+    are kept, the older ones being removed.
+    """
+
+    def __init__(self, root, compression='gz', keep=None):
+        self.root = root
+        self.compression = compression
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    def path_for(self, host, command):
+        name = re.sub(r'[^\w.-]+', '_', command.strip()).strip('_') or '_'
+        directory = os.path.join(self.root, re.sub(r'[^\w.-]+', '_', str(host)), name)
+        stamp = time.strftime('%Y%m%dT%H%M%S') + '.%06d' % (time.time() % 1 * 1e6)
+        suffix = '.txt.%s' % self.compression if self.compression else '.txt'
+        return os.path.join(directory, stamp + suffix)
+
+    def open(self, host, command):
+        """Open the file for a new output of command on host."""
+        path = self.path_for(host, command)
+        directory = os.path.dirname(path)
+        with self._lock:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            if self.keep:
+                for old in sorted(os.listdir(directory))[:-self.keep + 1 or None]:
+                    os.remove(os.path.join(directory, old))
+        return open_file(path, self.compression)
+
+
+class _Callback(object):
+    """File-like wrapper of a callback."""
+
+    def __init__(self, callback):
+        self.write = callback
+
+    def close(self):
+        pass
+
+
+def open_sink(sink, host, command):
+    """Get a (file-like, owned) pair for a sink, owned if it must be closed."""
+    if isinstance(sink, SinkLayout):
+        return sink.open(host, command), True
+    if isinstance(sink, STRING_TYPES):
+        return open_file(sink), True
+    if hasattr(sink, 'write'):
+        return sink, False
+    if callable(sink):
+        return _Callback(sink), False
+    raise PSSException('Not a sink: %r' % (sink,))
@@ -0,0 +1,156 @@
+"""
+Shared SSH transport settings: known hosts, algorithms and keepalives.
+
+Sessions connect with paramiko's defaults unless given a TransportConfig:
+    config = TransportConfig(known_hosts='~/.pss1830_known_hosts', compress=True)
+    PSS1830.transport_config = config # for all sessions
+    cli = PSS1830Cli('10.0.0.1', 22, 'admin', 'admin')
+    cli.transport_config = config # or for one session
+"""
+import logging
+import os
+import socket
+import threading
+
+from pss1830ssh.pss1830 import _paramiko
+
+DEFAULT_KEX = ('curve25519-sha256@libssh.org', 'ecdh-sha2-nistp256')
+DEFAULT_CIPHERS = ('aes128-gcm@openssh.com', 'aes128-ctr')
+
+
+class TransportConfig(object):
+    """How sessions open their SSH transport.
+
+    Host keys are checked against the known_hosts file, loaded once and
+    shared by all the sessions using this config. Unknown hosts are added
+    to it, or rejected if strict. kex and ciphers are tried first, before
+    paramiko's other algorithms. Before paramiko 3.2 they can only be set
+    once connected, so the keys are renegotiated with them. keepalive is the interval of SSH
+    keepalives; TCP keepalives detect a dead peer after about
+    tcp_keepidle + tcp_keepintvl * tcp_keepcnt seconds.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, known_hosts=None, strict=False, kex=DEFAULT_KEX,
+                 ciphers=DEFAULT_CIPHERS, disabled_algorithms=None, compress=False,
+                 keepalive=15, tcp_keepalive=True, tcp_keepidle=10, tcp_keepintvl=5,
+                 tcp_keepcnt=3, connect_timeout=10, look_for_keys=False):
+        self.known_hosts = os.path.expanduser(known_hosts) if known_hosts else None
+        self.strict = strict
+        self.kex = tuple(kex or ())
+        self.ciphers = tuple(ciphers or ())
+        self.disabled_algorithms = disabled_algorithms
+        self.compress = compress
+        self.keepalive = keepalive
+        self.tcp_keepalive = tcp_keepalive
+        self.tcp_keepidle = tcp_keepidle
+        self.tcp_keepintvl = tcp_keepintvl
+        self.tcp_keepcnt = tcp_keepcnt
+        self.connect_timeout = connect_timeout
+        self.look_for_keys = look_for_keys
+        self._host_keys = None
+        self._lock = threading.Lock()
+
+    @property
+    def host_keys(self):
+        """The known host keys, loaded from known_hosts on first use."""
+        with self._lock:
+            if self._host_keys is None:
+                self._host_keys = _paramiko().HostKeys()
+                if self.known_hosts and os.path.exists(self.known_hosts):
+                    self._host_keys.load(self.known_hosts)
+            return self._host_keys
+
+    def add_host_key(self, name, key):
+        """Trust a host key, saving it to known_hosts."""
+        host_keys = self.host_keys
+        with self._lock:
+            host_keys.add(name, key.get_name(), key)
+            if self.known_hosts:
+                host_keys.save(self.known_hosts)
+
+    def connect(self, host, port, username, password, timeout=None):
+        """Open an SSH client to a NE.
+
+        timeout, if given, lowers connect_timeout for this connection.
+        """
+        if timeout is None or timeout > self.connect_timeout:
+            timeout = self.connect_timeout
+        paramiko = _paramiko()
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(_KnownHostsPolicy(self))
+        name = host if port == 22 else '[%s]:%s' % (host, port)
+        for key in (self.host_keys.lookup(name) or {}).values():
+            client.get_host_keys().add(name, key.get_name(), key)
+        sock = self._socket(host, port, timeout)
+        kwargs = dict(sock=sock, timeout=timeout, compress=self.compress,
+                      banner_timeout=timeout, auth_timeout=timeout,
+                      allow_agent=self.look_for_keys, look_for_keys=self.look_for_keys,
+                      disabled_algorithms=self.disabled_algorithms)
+        factory = 'transport_factory' in paramiko.SSHClient.connect.__code__.co_varnames
+        if factory:
+            kwargs['transport_factory'] = self._transport
+        try:
+            client.connect(host, port, username, password, **kwargs)
+            if not factory and (self.kex or self.ciphers):
+                self._renegotiate(client.get_transport(), host)
+        except Exception:
+            client.close()
+            sock.close()
+            raise
+        if self.keepalive:
+            client.get_transport().set_keepalive(self.keepalive)
+        return client
+
+    def _socket(self, host, port, timeout):
+        sock = socket.create_connection((host, port), timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.tcp_keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+            for option, value in (('TCP_KEEPIDLE', self.tcp_keepidle),
+                                  ('TCP_KEEPINTVL', self.tcp_keepintvl),
+                                  ('TCP_KEEPCNT', self.tcp_keepcnt),
+                                  ('TCP_USER_TIMEOUT', 1000 * (self.tcp_keepidle +
+                                                               self.tcp_keepintvl *
+                                                               self.tcp_keepcnt))):
+                if hasattr(socket, option):
+                    sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+        return sock
+
+    def _transport(self, sock, **kwargs):
+        transport = _paramiko().Transport(sock, **kwargs)
+        self._prefer(transport)
+        return transport
+
+    def _prefer(self, transport):
+        options = transport.get_security_options()
+        options.kex = _preferred(self.kex, options.kex)
+        options.ciphers = _preferred(self.ciphers, options.ciphers)
+
+    def _renegotiate(self, transport, host):
+        """Apply kex and ciphers to a transport already connected."""
+        self._prefer(transport)
+        try:
+            transport.renegotiate_keys()
+        except _paramiko().SSHException as err:
+            self.logger.warning('%s: kex and ciphers not applied, keeping the '
+                                'negotiated algorithms: %s', host, err)
+
+
+def _preferred(preferred, available):
+    """Order the available algorithms with the preferred ones first."""
+    first = [name for name in preferred if name in available]
+    return tuple(first + [name for name in available if name not in first])
+
+
+class _KnownHostsPolicy(object):
+    """Add unknown host keys to a TransportConfig, or reject them if strict."""
+
+    def __init__(self, config):
+        self.config = config
+
+    def missing_host_key(self, client, hostname, key):
+        if self.config.strict:
+            raise _paramiko().SSHException('Unknown host key for %s' % hostname)
+        self.config.add_host_key(hostname, key)
@@ -24,5 +24,14 @@ setuptools.setup(
     ],
     install_requires=[
         'paramiko==2.7.0'
-    ]
+    ],
+    extras_require={
+        'async': ['asyncssh; python_version >= "3.6"'],
+        'zstd': ['zstandard']
+    },
+    entry_points={
+        'console_scripts': [
+            'pss1830-fleet=pss1830ssh.pss1830fleet:main'
+        ]
+    }
 )
\ No newline at end of file
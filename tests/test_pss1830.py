@@ -1,4 +1,6 @@
 import socket
+import time
+
 import pytest
 
 import pss1830ssh.pss1830 as pss1830
@@ -8,6 +10,11 @@ PORT = 2345
 USER = 'test'
 PASS = 'test123'
 
+@pytest.fixture(autouse=True)
+def no_wait(mocker):
+    # the mocked channel never becomes readable while waiting
+    mocker.patch('select.select', return_value=([], [], []))
+
 @pytest.fixture(name="notconnected")
 def create_mocked_pss(mocker):
     pss = pss1830.PSS1830(HOST, PORT, USER, PASS)
@@ -33,6 +40,29 @@ def test_open(notconnected):
     client.connect.assert_called_once_with(HOST, PORT, USER, PASS)
     client.invoke_shell.assert_called_once()
 
+def test_open_failure_closes_client(notconnected):
+    pss, client, _ = notconnected
+    client.invoke_shell.side_effect = Exception('Channel refused')
+    with pytest.raises(Exception, match=r'Channel refused'):
+        pss.open()
+    client.close.assert_called_once()
+    assert pss.connected is False
+
+def test_client_created_on_open(mocker):
+    pss = pss1830.PSS1830(HOST, PORT, USER, PASS)
+    assert pss.client is None
+    new_client = mocker.patch.object(pss1830.PSS1830, '_new_client')
+    pss.open()
+    assert pss.client is new_client.return_value
+    pss.client.connect.assert_called_once_with(HOST, PORT, USER, PASS)
+
+def test_connect_timeout(notconnected):
+    pss, client, _ = notconnected
+    pss.connect_timeout = 5
+    pss.open()
+    client.connect.assert_called_once_with(HOST, PORT, USER, PASS, timeout=5,
+                                           banner_timeout=5, auth_timeout=5)
+
 def test_close(connected):
     pss, channel = connected
     assert pss.connected
@@ -44,7 +74,7 @@ def test_close(connected):
 def test_execute(connected):
     pss, channel = connected
     data = ['data1', 'data2']
-    channel.recv_ready.side_effect = [True if d else False for d in data + ['']]
+    channel.recv_ready.side_effect = [True if d else False for d in data + ['', '']]
     channel.recv.side_effect = data
     rcv_data = list(pss.execute('hello'))
     assert rcv_data == [''.join(data)]
@@ -53,3 +83,220 @@ def test_execute_not_connected(notconnected):
     pss, _, _ = notconnected
     with pytest.raises(pss1830.PSSException, match=r'Not connected'):
         pss.execute('hello')
+
+def test_execute_wakes_on_data(connected, mocker):
+    pss, channel = connected
+    pss.prompt = 'prompt#'
+    wait = mocker.patch('select.select', return_value=([channel], [], []))
+    channel.recv_ready.side_effect = [False, True, False]
+    channel.recv.side_effect = ['output\r\nprompt# ']
+    assert list(pss.execute('hello')) == ['output\r\nprompt# ']
+    wait.assert_called_once()
+
+def test_execute_prompt_split_across_reads(connected, mocker):
+    pss, channel = connected
+    pss.prompt = 'prompt#'
+    mocker.patch('select.select', return_value=([channel], [], []))
+    channel.recv_ready.side_effect = [True, False, True, False]
+    channel.recv.side_effect = ['output\r\nprom', 'pt# ']
+    assert list(pss.execute('hello')) == ['output\r\nprom', 'pt# ']
+
+def test_prompt_matcher_only_keeps_tail():
+    matcher = pss1830.PromptMatcher(r'\nprompt# $', tail_size=16)
+    assert matcher.feed('x' * 4096) is None
+    assert len(matcher.tail) == 16
+    assert matcher.feed('\nprompt# ')
+
+def test_execute_raw(connected, mocker):
+    pss, channel = connected
+    pss.prompt = 'prompt#'
+    mocker.patch('select.select', return_value=([channel], [], []))
+    channel.recv_ready.side_effect = [True, False, True, False]
+    channel.recv.side_effect = [b'output\r\nprom', b'pt# ']
+    assert b''.join(pss.execute_raw('hello')) == b'output\r\nprompt# '
+
+def test_execute_multibyte_split_across_reads(connected, mocker):
+    pss, channel = connected
+    pss.prompt = 'prompt#'
+    mocker.patch('select.select', return_value=([channel], [], []))
+    data = u'\u00b0C\r\nprompt# '.encode('utf-8')
+    channel.recv_ready.side_effect = [True, False, True, False]
+    channel.recv.side_effect = [data[:1], data[1:]]
+    assert list(pss.execute('hello')) == [u'\u00b0C\r\nprompt# ']
+
+def test_is_alive(connected, mocker):
+    pss, channel = connected
+    pss.prompt = 'prompt#'
+    channel.recv_ready.side_effect = [True, False]
+    channel.recv.side_effect = ['\r\nprompt# ']
+    assert pss.is_alive()
+    channel.sendall.assert_called_with('\n')
+
+def test_is_alive_dead_channel(connected):
+    pss, channel = connected
+    pss.prompt = 'prompt#'
+    channel.sendall.side_effect = socket.error('Socket is closed')
+    assert not pss.is_alive()
+
+def test_cancel_when_idle(connected):
+    pss, channel = connected
+    pss.cancel()
+    channel.sendall.assert_called_once_with('\x03\n')
+
+def test_timeout_resyncs(connected):
+    pss, channel = connected
+    pss.prompt = 'prompt#'
+    channel.recv_ready.side_effect = [True, False, False, True, False, False, True, False]
+    channel.recv.side_effect = ['hanging', '^C\r\nprompt# ', '\r\nprompt# ']
+    with pytest.raises(pss1830.CommandTimeout) as err:
+        list(pss.execute('hang', timeout=1))
+    assert err.value.output == 'hanging'
+    assert err.value.resynced
+    assert pss.prompt == 'prompt#'
+
+def test_is_alive_dead_transport(connected):
+    pss, channel = connected
+    pss.prompt = 'prompt#'
+    pss.client.get_transport.return_value.is_active.return_value = False
+    assert not pss.is_alive()
+    channel.sendall.assert_not_called()
+
+def test_execute_many(connected, mocker):
+    pss, channel = connected
+    pss.prompt = 'prompt#'
+    mocker.patch('select.select', return_value=([channel], [], []))
+    channel.recv_ready.side_effect = [True, False, True, False]
+    channel.recv.side_effect = ['a\r\nA\r\nprompt# b\r\nB\r\npro',
+                                'mpt# c\r\nError: bad\r\nprompt# ']
+    results = pss.execute_many(['a', 'b', 'c'])
+    channel.sendall.assert_called_once_with('a\nb\nc\n')
+    assert [r.command for r in results] == ['a', 'b', 'c']
+    assert results[0].output == 'a\r\nA\r\nprompt# '
+    assert results[1].output == 'b\r\nB\r\nprompt# '
+    assert results[2].output == 'c\r\nError: bad\r\nprompt# '
+    assert results[0].error is None
+
+def test_execute_many_interactive_lock_step(connected, mocker):
+    pss, channel = connected
+    pss.prompt = 'prompt#'
+    mocker.patch('select.select', return_value=([channel], [], []))
+    channel.recv_ready.side_effect = [True, False, True, False, True, False]
+    channel.recv.side_effect = ['a\r\nprompt# ', 'top\r\nprompt# ', 'b\r\nprompt# ']
+    results = pss.execute_many(['a', 'top', 'b'], interactive=r'^top')
+    assert [c[0][0] for c in channel.sendall.call_args_list] == ['a\n', 'top\n', 'b\n']
+    assert [r.output for r in results] == ['a\r\nprompt# ', 'top\r\nprompt# ', 'b\r\nprompt# ']
+
+def test_execute_many_timeout(connected):
+    pss, channel = connected
+    pss.prompt = 'prompt#'
+    channel.recv_ready.side_effect = [True, False, False, True, False, False, True, False]
+    channel.recv.side_effect = ['a\r\nprompt# b\r\npartial', '^C\r\nprompt# ', '\r\nprompt# ']
+    results = pss.execute_many(['a', 'b', 'c'])
+    assert results[0].error is None
+    assert results[1] == ('b', 'b\r\npartial', 'Timed out waiting for the prompt')
+    assert results[2] == ('c', '', 'Timed out waiting for the prompt')
+    # resynced, so the next command does not read what was left
+    assert channel.sendall.call_args_list[1][0][0] == '\x03\n'
+    assert pss.prompt == 'prompt#'
+
+class Stream(object):
+    """Channel with a whole output ready to be read."""
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def recv_ready(self):
+        return bool(self.payload)
+
+    def recv(self, nbytes):
+        data, self.payload = self.payload[:nbytes], self.payload[nbytes:]
+        return data
+
+    def sendall(self, data):
+        pass
+
+def test_read_size_adapts_to_consumer(connected):
+    pss, _ = connected
+    pss.prompt = 'prompt#'
+    pss.min_read_size, pss.max_buffered = 512, 8192
+    pss._read_size = 1024
+    pss.channel = Stream(b'x' * 100000 + b'\r\nprompt# ')
+    chunks = [len(chunk) for chunk in pss.execute_raw('cat big')]
+    assert chunks[:5] == [1024, 2048, 4096, 8192, 8192]
+    assert max(chunks) == pss.max_buffered
+    pss.stall_time = -1 # every chunk stalls
+    pss.channel = Stream(b'x' * 100000 + b'\r\nprompt# ')
+    chunks = [len(chunk) for chunk in pss.execute_raw('cat big')]
+    assert chunks[:5] == [8192, 4096, 2048, 1024, 512]
+    assert set(chunks[4:-1]) == set([512])
+
+class StreamInto(Stream):
+
+    def recv_into(self, buf):
+        data = self.recv(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+def test_recv_raw_reuses_buffer(connected):
+    pss, _ = connected
+    pss._read_size = 4
+    pss.channel = StreamInto(b'abcdefgh')
+    first = pss._recv_raw()
+    assert first.tobytes() == b'abcd'
+    assert pss._recv_raw().obj is first.obj
+    pss._read_size = 8
+    pss.channel = Stream(b'0123456789')
+    assert pss._recv_raw().tobytes() == b'01234567'
+
+def test_window_size(notconnected):
+    pss, client, _ = notconnected
+    pss.window_size = 262144
+    pss.open()
+    assert client.get_transport.return_value.default_window_size == 262144
+
+class Endless(Stream):
+    """Channel printing until interrupted with CTRL+C."""
+
+    def __init__(self):
+        super(Endless, self).__init__(b'')
+        self.interrupted = False
+
+    def recv_ready(self):
+        return not self.interrupted or bool(self.payload)
+
+    def recv(self, nbytes):
+        if self.interrupted:
+            return Stream.recv(self, nbytes)
+        return b'x' * min(nbytes, 1024)
+
+    def sendall(self, data):
+        if data.startswith('\x03'):
+            self.interrupted = True
+            self.payload = b'^C\r\nprompt# '
+        elif self.interrupted:
+            self.payload += b'\r\nprompt# '
+
+def test_timeout_while_receiving(connected):
+    pss, _ = connected
+    pss.prompt = 'prompt#'
+    pss.channel = Endless()
+    start = time.time()
+    with pytest.raises(pss1830.CommandTimeout) as err:
+        for _ in pss.execute_raw('cat /dev/zero', timeout=0.3):
+            pass
+    assert time.time() - start < 2
+    assert err.value.resynced
+
+def test_execute_many_cancel(connected):
+    pss, channel = connected
+    pss.prompt = 'prompt#'
+    responses = ['a\r\npartial', '^C\r\nprompt# ', '\r\nprompt# ']
+    def recv(nbytes):
+        pss.cancel() # as if from another thread, while receiving
+        return responses.pop(0)
+    channel.recv_ready.side_effect = [True, False, True, False, False, True, False]
+    channel.recv.side_effect = recv
+    results = pss.execute_many(['a', 'b'])
+    assert [r.error for r in results] == ['Cancelled', 'Cancelled']
+    assert results[0].output == 'a\r\npartial'
+
@@ -0,0 +1,181 @@
+import asyncio
+import pytest
+
+asyncssh = pytest.importorskip('asyncssh')
+
+from pss1830ssh.pss1830aio import AsyncPSS1830Cli
+from pss1830ssh.pss1830aio import AsyncPSS1830Root
+from pss1830ssh.pss1830root import Target
+from pss1830ssh.pss1830 import PSSException
+from pss1830ssh.pss1830fake import FakeNE
+
+
+class StandInServer(asyncssh.SSHServer):
+
+    def begin_auth(self, username):
+        return True
+
+    def password_auth_supported(self):
+        return True
+
+    def validate_password(self, username, password):
+        return True
+
+
+async def cli_shell(process):
+    """A minimal 1830-PSS CLI: login dialog, then a prompt loop."""
+    for question, answer in [('Username:', 'admin'),
+                             ('Password:', 'admin'),
+                             ('Do you acknowledge (Y/N)?', 'Y')]:
+        process.stdout.write('\r\n' + question)
+        if (await process.stdin.readline()).strip() != answer:
+            # stay silent, as the NE does after a bad login
+            while await process.stdin.readline():
+                pass
+            return
+    while True:
+        process.stdout.write('\r\nNE1# ')
+        command = (await process.stdin.readline()).strip()
+        if command == 'logout':
+            process.exit(0)
+            return
+        if command == 'show version':
+            process.stdout.write('\r\nSoftware: 1830PSS 10.0' * 100)
+
+
+async def root_shell(process):
+    """A minimal root shell with telnet to a standby EC."""
+    prompts = ['root@EC1830-81-18-ACT:/root# ']
+    while True:
+        process.stdout.write('\r\n' + prompts[-1])
+        command = (await process.stdin.readline()).strip()
+        if command == 'exit':
+            prompts.pop()
+            if not prompts:
+                process.exit(0)
+                return
+        elif command.startswith('telnet '):
+            process.stdout.write('\r\nEC1830-81-1 login: ')
+            await process.stdin.readline()
+            process.stdout.write('Password: ')
+            await process.stdin.readline()
+            prompts.append('root@EC1830-81-1-STDBY:/root\r\n# ')
+
+
+def run(coro):
+    # asyncio.run() is 3.7+
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        loop.close()
+
+
+def run_with_server(shell, test):
+    async def runner():
+        key = asyncssh.generate_private_key('ssh-ed25519')
+        server = await asyncssh.create_server(
+            StandInServer, '127.0.0.1', 0, server_host_keys=[key],
+            process_factory=shell)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            await test(port)
+        finally:
+            server.close()
+    run(runner())
+
+
+def test_cli_open_execute_close():
+    async def test(port):
+        cli = AsyncPSS1830Cli('127.0.0.1', port, 'admin', 'admin')
+        cli.TIMEOUT = 5
+        await cli.open()
+        assert cli.prompt == 'NE1#'
+        output = ''
+        async for data in cli.execute('show version'):
+            output += data
+        assert output.startswith('show version\r\n')
+        assert output.count('Software: 1830PSS 10.0') == 100
+        assert output.endswith('NE1# ')
+        await cli.close()
+        assert cli.connected is False
+    run_with_server(cli_shell, test)
+
+
+def test_cli_open_fail():
+    async def test(port):
+        cli = AsyncPSS1830Cli('127.0.0.1', port, 'wrong', 'admin')
+        cli.TIMEOUT = 1
+        with pytest.raises(PSSException, match=r'Failed to login'):
+            await cli.open()
+    run_with_server(cli_shell, test)
+
+
+def test_many_sessions_on_one_loop():
+    async def session(port):
+        cli = AsyncPSS1830Cli('127.0.0.1', port, 'admin', 'admin')
+        cli.TIMEOUT = 5
+        await cli.open()
+        chunks = [data async for data in cli.execute('show version')]
+        await cli.close()
+        return ''.join(chunks)
+
+    async def test(port):
+        outputs = await asyncio.gather(*[session(port) for _ in range(20)])
+        assert all(out.startswith('show version\r\n') for out in outputs)
+        assert all(out.count('Software: 1830PSS 10.0') == 100 for out in outputs)
+    run_with_server(cli_shell, test)
+
+
+def test_root_login_to_stdby():
+    async def test(port):
+        root = AsyncPSS1830Root('127.0.0.1', port, 'root', 'root')
+        root.TIMEOUT = 5
+        await root.open()
+        assert root.is_on_active()
+        await root.login_to_stdby()
+        assert root.is_on_active() is False
+        await root.logout_from_stdby()
+        assert root.is_on_active()
+        await root.close()
+    run_with_server(root_shell, test)
+
+
+async def collect(session, command):
+    return ''.join([data async for data in session.execute(command)])
+
+
+def test_cli_with_latency():
+    async def test(port):
+        cli = AsyncPSS1830Cli('127.0.0.1', port, 'admin', 'admin')
+        await cli.open()
+        for command in ['show version', 'show card inv *', 'show version']:
+            output = await collect(cli, command)
+            assert output.startswith(command + '\r\n')
+            assert output.rstrip().endswith(cli.prompt)
+        await cli.close()
+    with FakeNE(latency=0.05) as ne:
+        run(test(ne.port))
+
+
+def test_root_navigation_with_latency():
+    async def test(port):
+        root = AsyncPSS1830Root('127.0.0.1', port, 'root', 'root')
+        await root.open()
+        await root.login_to_shelf(2)
+        assert 'uptime output on root@EC1830-2-1-ACT' in await collect(root, 'uptime')
+        await root.logout_from_shelf()
+        assert root.is_on_master() and root.position == []
+        await root.logout_from_shelf() # already on the master shelf
+        await root.goto(3)
+        await root.goto(3, slot=5)
+        assert root.position == [Target(3, None, 1, True), Target(3, 5)]
+        output = await collect(root, 'uptime')
+        assert output.startswith('uptime\r\n') and 'root@slot-3-5' in output
+        await root.goto(81)
+        assert root.position == []
+        output = await collect(root, 'uptime')
+        assert output.startswith('uptime\r\n') and 'root@EC1830-81-18-ACT' in output
+        await root.close()
+    with FakeNE(latency=0.05) as ne:
+        run(test(ne.port))
@@ -0,0 +1,82 @@
+import pytest
+
+from pss1830ssh.pss1830 import PSS1830, CommandTimeout
+from pss1830ssh.pss1830cache import ResultCache
+
+KEY = ('ne1', None, 'show version')
+
+def test_get_put():
+    cache = ResultCache()
+    assert cache.get(KEY) is None
+    cache.put(KEY, 'output')
+    assert cache.get(KEY) == 'output'
+    assert (cache.hits, cache.misses) == (1, 1)
+
+def test_ttl(mocker):
+    cache = ResultCache(ttl=10, ttls=[(r'^show version', 100)])
+    now = mocker.patch('time.time', return_value=1000)
+    cache.put(KEY, 'output')
+    cache.put(('ne1', None, 'show card inv *'), 'cards')
+    now.return_value = 1050
+    assert cache.get(KEY) == 'output'
+    assert cache.get(('ne1', None, 'show card inv *')) is None
+    assert len(cache) == 1
+
+def test_lru():
+    cache = ResultCache(max_entries=2)
+    cache.put(('ne1', None, 'a'), 'a')
+    cache.put(('ne1', None, 'b'), 'b')
+    cache.get(('ne1', None, 'a'))
+    cache.put(('ne1', None, 'c'), 'c')
+    assert cache.get(('ne1', None, 'b')) is None
+    assert cache.get(('ne1', None, 'a')) == 'a'
+
+def test_invalidate():
+    cache = ResultCache()
+    cache.put(('ne1', None, 'show version'), 'v1')
+    cache.put(('ne1', None, 'show card inv *'), 'c1')
+    cache.put(('ne2', None, 'show version'), 'v2')
+    cache.invalidate(host='ne1', command=r'^show version')
+    assert len(cache) == 2
+    cache.invalidate(host='ne1')
+    assert len(cache) == 1
+    cache.invalidate()
+    assert len(cache) == 0
+
+@pytest.fixture(name="cached")
+def create_cached_pss(mocker):
+    mocker.patch('select.select', return_value=([], [], []))
+    pss = PSS1830('ne1', 22, 'admin', 'admin')
+    mocker.patch.object(pss, 'client')
+    pss.open()
+    channel = mocker.patch.object(pss, 'channel')
+    pss.prompt = 'prompt#'
+    pss.cache = ResultCache(invalidating=r'^config')
+    return pss, channel
+
+def test_execute_cached(cached):
+    pss, channel = cached
+    channel.recv_ready.side_effect = [True, False]
+    channel.recv.side_effect = ['1830PSS\r\nprompt# ']
+    assert ''.join(pss.execute('show version')) == '1830PSS\r\nprompt# '
+    assert ''.join(pss.execute('show version')) == '1830PSS\r\nprompt# '
+    channel.sendall.assert_called_once_with('show version\n')
+    assert (pss.cache.hits, pss.cache.misses) == (1, 1)
+
+def test_execute_not_cached_when_incomplete(cached):
+    pss, channel = cached
+    channel.recv_ready.side_effect = [True] + [False] * 10
+    channel.recv.side_effect = ['partial']
+    with pytest.raises(CommandTimeout) as err:
+        ''.join(pss.execute('show version'))
+    assert err.value.output == 'partial'
+    assert len(pss.cache) == 0
+
+def test_execute_not_cacheable(cached):
+    pss, channel = cached
+    channel.recv_ready.side_effect = [True, False]
+    channel.recv.side_effect = ['prompt# ']
+    pss.cache.put(('ne1', None, 'show version'), 'old')
+    list(pss.execute('config admin'))
+    assert len(pss.cache) == 0
+    assert pss.cache.misses == 0
@@ -3,6 +3,11 @@ import pytest
 import pss1830ssh.pss1830cli as psscli
 from pss1830ssh.pss1830 import PSSException
 
+@pytest.fixture(autouse=True)
+def no_wait(mocker):
+    # the mocked channel never becomes readable while waiting
+    mocker.patch('select.select', return_value=([], [], []))
+
 @pytest.fixture(name="notconnected")
 def create_mocked_psscli(mocker):
     pss = psscli.PSS1830Cli('localhost', 22, 'test', 'test123')
@@ -28,9 +33,10 @@ def test_open_success(notconnected):
         '\r\nDo you acknowledge (Y/N)?',
         'Some information',
         '\r\nprompt# ',
-        '\r\nprompt# '
+        '\r\nprompt# ',
+        'paging status disable\r\nprompt# '
     ]
-    channel.recv_ready.side_effect = [True, True, False, True, False, True, False, True, True, False, True, False]
+    channel.recv_ready.side_effect = [True, True, False, True, False, True, False, True, True, False, True, False, True, False]
     channel.recv.side_effect = responses
     pss.open()
     assert pss.connected
@@ -61,3 +67,22 @@ def test_close(connected):
     pss.close()
     channel.sendall.assert_called_once_with('logout\n')
 
+
+def test_execute_many_reports_errors(connected):
+    pss, channel = connected
+    channel.recv_ready.side_effect = [True, False]
+    channel.recv.side_effect = ['show version\r\n1830PSS\r\nprompt# '
+                                'show foo\r\nError: Invalid command\r\nprompt# ']
+    results = pss.execute_many(['show version', 'show foo'])
+    assert results[0].error is None
+    assert results[1].command == 'show foo'
+    assert results[1].error == 'Error: Invalid command'
+
+def test_open_auth_failure_closes_client(notconnected):
+    pss, _ = notconnected
+    pss.client.connect.side_effect = Exception('Authentication failed')
+    with pytest.raises(Exception, match=r'Authentication failed'):
+        pss.open()
+    pss.client.close.assert_called_once()
+    pss.close() # nothing to log out from
+    pss.channel.sendall.assert_not_called()
@@ -0,0 +1,125 @@
+import os
+import threading
+import time
+
+import pytest
+
+from pss1830ssh.pss1830 import CommandCancelled, CommandTimeout
+from pss1830ssh.pss1830cli import PSS1830Cli
+from pss1830ssh.pss1830root import PSS1830Root
+from pss1830ssh.pss1830fake import FakeNE
+
+
+@pytest.fixture(name="ne", scope="module")
+def start_fake_ne():
+    with FakeNE(output_size=100000) as ne:
+        yield ne
+
+def test_cli_session(ne):
+    cli = PSS1830Cli('127.0.0.1', ne.port, 'admin', 'admin')
+    cli.open()
+    assert cli.prompt == 'NE1#'
+    assert 'Version : 1830PSS' in ''.join(cli.execute('show version'))
+    output = ''.join(cli.execute('show big'))
+    assert output.endswith('NE1# ')
+    assert len(output) > 100000 - 100
+    results = cli.execute_many(['show version', 'bad command'])
+    assert results[0].error is None
+    assert results[1].error == 'Error: Invalid command'
+    cli.close()
+
+def test_cli_wrong_login(ne):
+    cli = PSS1830Cli('127.0.0.1', ne.port, 'admin', 'wrong')
+    cli.TIMEOUT = 1
+    with pytest.raises(Exception):
+        cli.open()
+
+def test_root_telnet_hops(ne):
+    root = PSS1830Root('127.0.0.1', ne.port, 'root', 'root')
+    root.TIMEOUT = 5
+    root.open()
+    assert root.is_on_master() and root.is_on_active()
+    output = root.run_on((2, 5), ['uptime'])[0][1]
+    assert 'uptime output on root@slot-2-5' in output
+    output = root.run_on((3,), ['hostname'])[0][1]
+    assert 'hostname output on root@EC1830-3-1-ACT' in output
+    root.goto(81)
+    assert root.position == []
+    root.close()
+
+def test_sftp(ne, tmpdir):
+    with open(os.path.join(ne.sftp_root, 'db.tgz'), 'wb') as f:
+        f.write(b'x' * 100000)
+    root = PSS1830Root('127.0.0.1', ne.port, 'root', 'root')
+    root.open()
+    local = str(tmpdir.join('db.tgz'))
+    root.get_file('/db.tgz', local)
+    assert os.path.getsize(local) == 100000
+    root.put_file(local, '/copy.tgz')
+    assert os.path.getsize(os.path.join(ne.sftp_root, 'copy.tgz')) == 100000
+    root.close()
+
+def test_cli_with_latency():
+    with FakeNE(latency=0.02) as ne:
+        cli = PSS1830Cli('127.0.0.1', ne.port, 'admin', 'admin')
+        cli.open()
+        assert ''.join(cli.execute('show version')).startswith('show version')
+        cli.close()
+
+def test_latency_overlaps_pipelined_commands():
+    with FakeNE(latency=0.1) as ne:
+        cli = PSS1830Cli('127.0.0.1', ne.port, 'admin', 'admin')
+        cli.open()
+        start = time.time()
+        results = cli.execute_many(['show version'] * 10)
+        assert time.time() - start < 0.5
+        assert all(result.output.startswith('show version') for result in results)
+        cli.close()
+
+def test_root_timeout_resyncs(ne):
+    root = PSS1830Root('127.0.0.1', ne.port, 'root', 'root')
+    root.open()
+    with pytest.raises(CommandTimeout) as err:
+        list(root.execute('sleep 10', timeout=0.5))
+    assert err.value.resynced
+    assert err.value.output.startswith('sleep 10')
+    output = ''.join(root.execute('uptime'))
+    assert output.startswith('uptime\r\nuptime output on')
+    root.close()
+
+def test_root_cancel_from_another_thread(ne):
+    root = PSS1830Root('127.0.0.1', ne.port, 'root', 'root')
+    root.open()
+    timer = threading.Timer(0.3, root.cancel)
+    timer.start()
+    start = time.time()
+    with pytest.raises(CommandCancelled) as err:
+        list(root.execute('sleep 10'))
+    assert time.time() - start < 5
+    assert err.value.resynced
+    assert ''.join(root.execute('uptime')).startswith('uptime\r\n')
+    root.close()
+
+def test_sweep_slots_in_parallel():
+    with FakeNE(login_delay=0.2) as ne:
+        root = PSS1830Root('127.0.0.1', ne.port, 'root', 'root')
+        root.open()
+        start = time.time()
+        results = list(root.sweep_slots(2, range(2, 18), ['uptime']))
+        assert time.time() - start < 16 * 0.2
+        assert all(r.error is None for r in results)
+        assert len(results) == 16
+        root.close()
+
+def test_run_on_all_ecs(ne):
+    root = PSS1830Root('127.0.0.1', ne.port, 'root', 'root')
+    root.open()
+    assert root.discover_shelves() == [81, 2, 3]
+    results = root.run_on_all_ecs(['hostname', 'df'])
+    assert len(results) == 6
+    for target, result in results.items():
+        state = 'ACT' if target.act else 'STDBY'
+        assert result.error is None
+        assert 'df output on root@EC1830-%s-%s-%s' % (target.shelf, target.ec, state) in result.outputs[1][1]
+    root.close()
+
@@ -0,0 +1,147 @@
+import threading
+import time
+import pytest
+
+from pss1830ssh import pss1830fleet
+from pss1830ssh.pss1830 import PSSException
+from pss1830ssh.pss1830fleet import FleetRunner, NE
+
+
+class FakeSession(object):
+    TIMEOUT = 30
+    delay = 0.1
+    failures = {}
+    active = 0
+    max_active = 0
+    lock = threading.Lock()
+
+    def __init__(self, host, port, username, password):
+        self.host = host
+
+    timeouts = []
+    connect_timeouts = []
+    connect_timeout = None
+    opened = 0
+
+    def open(self):
+        FakeSession.connect_timeouts.append(self.connect_timeout)
+        FakeSession.opened += 1
+        with self.lock:
+            # connected, as the login fails after it
+            FakeSession.active += 1
+            FakeSession.max_active = max(FakeSession.max_active, FakeSession.active)
+            if self.failures.get(self.host):
+                self.failures[self.host] -= 1
+                raise PSSException('Failed to login')
+
+    def execute(self, command, timeout=None):
+        FakeSession.timeouts.append(timeout)
+        time.sleep(self.delay)
+        return iter(['%s on %s' % (command, self.host)])
+
+    def close(self):
+        with self.lock:
+            FakeSession.active -= 1
+
+
+@pytest.fixture(autouse=True)
+def reset_fake_session():
+    FakeSession.failures = {}
+    FakeSession.active = 0
+    FakeSession.max_active = 0
+    FakeSession.timeouts = []
+    FakeSession.connect_timeouts = []
+    FakeSession.opened = 0
+
+def make_nes(count):
+    return [NE('10.0.0.%s' % i, 22, 'admin', 'admin') for i in range(count)]
+
+def test_run_all():
+    runner = FleetRunner(FakeSession, workers=4)
+    results = list(runner.run(make_nes(8), ['show version']))
+    assert len(results) == 8
+    assert all(r.ok for r in results)
+    assert results[0].outputs == [('show version', 'show version on %s' % results[0].host)]
+    assert FakeSession.max_active == 4
+
+def test_throughput_scales_with_workers():
+    start = time.time()
+    list(FleetRunner(FakeSession, workers=1).run(make_nes(8), ['a']))
+    serial = time.time() - start
+    start = time.time()
+    list(FleetRunner(FakeSession, workers=8).run(make_nes(8), ['a']))
+    parallel = time.time() - start
+    assert parallel < serial / 3
+
+def test_per_host_limit():
+    nes = [NE('10.0.0.1', 22, 'admin', 'admin')] * 4
+    list(FleetRunner(FakeSession, workers=4, per_host=1).run(nes, ['a']))
+    assert FakeSession.max_active == 1
+
+def test_retry_on_pss_exception():
+    FakeSession.failures = {'10.0.0.0': 2, '10.0.0.1': 5}
+    runner = FleetRunner(FakeSession, workers=2, retries=2, backoff=0.01)
+    results = {r.host: r for r in runner.run(make_nes(2), ['a'])}
+    assert results['10.0.0.0'].ok
+    assert results['10.0.0.0'].attempts == 3
+    assert not results['10.0.0.1'].ok
+    assert results['10.0.0.1'].attempts == 3
+    assert FakeSession.active == 0 # closed after each failed open
+
+def test_no_backoff_past_timeout():
+    FakeSession.failures = {'10.0.0.1': 5}
+    runner = FleetRunner(FakeSession, timeout=1, retries=2, backoff=5)
+    start = time.time()
+    result = runner.run_one(NE('10.0.0.1', 22, 'admin', 'admin'), ['a'])
+    assert time.time() - start < 0.5
+    assert result.attempts == 1 and not result.ok
+
+def test_timeout():
+    runner = FleetRunner(FakeSession, timeout=0.15, retries=0)
+    result = runner.run_one(NE('10.0.0.1', 22, 'admin', 'admin'), ['a', 'b', 'c'])
+    assert 'Timed out' in str(result.error)
+    # each command is bounded by what is left of the NE's timeout
+    assert 0 < FakeSession.timeouts[0] <= 0.15
+    assert FakeSession.timeouts[1] < FakeSession.timeouts[0] - 0.05
+
+def test_results_streamed_as_they_finish(mocker):
+    mocker.patch.object(FakeSession, 'delay', 0.3)
+    runner = FleetRunner(FakeSession, workers=2)
+    start = time.time()
+    results = runner.run(make_nes(4), ['a'])
+    next(results)
+    assert time.time() - start < 0.5
+    results.close()
+
+def test_per_host_waits_before_dispatch():
+    # the second NE of the busy host must not hold the only other worker
+    nes = [NE('10.0.0.1', 22, 'admin', 'admin')] * 2 + [NE('10.0.0.2', 22, 'admin', 'admin')]
+    runner = FleetRunner(FakeSession, workers=2, per_host=1)
+    start = time.time()
+    finished = {}
+    for result in runner.run(nes, ['a']):
+        finished.setdefault(result.host, time.time() - start)
+    assert finished['10.0.0.2'] < 0.15
+
+def test_stopped_early_skips_waiting_nes():
+    runner = FleetRunner(FakeSession, workers=1)
+    results = runner.run(make_nes(4), ['a'])
+    next(results)
+    results.close()
+    assert FakeSession.opened <= 2
+
+def test_connect_bounded_by_timeout():
+    runner = FleetRunner(FakeSession, timeout=20)
+    runner.run_one(NE('10.0.0.1', 22, 'admin', 'admin'), ['a'])
+    assert 19 < FakeSession.connect_timeouts[0] <= 20
+
+def test_main(tmpdir, mocker, capsys):
+    mocker.patch.object(pss1830fleet, 'PSS1830Cli', FakeSession)
+    inventory = tmpdir.join('inventory.txt')
+    inventory.write('# NEs\n10.0.0.1\n10.0.0.2 2222 cli cli\n')
+    commands = tmpdir.join('commands.txt')
+    commands.write('show version\n\nshow card inv *\n')
+    assert pss1830fleet.main([str(inventory), str(commands), '--workers', '2']) == 0
+    out = capsys.readouterr().out
+    assert '=== 10.0.0.2: show card inv * ===' in out
+    assert out.count('===') == 8
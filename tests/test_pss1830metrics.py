@@ -0,0 +1,101 @@
+import json
+import pytest
+
+from pss1830ssh.pss1830 import PSS1830, CommandTimeout
+from pss1830ssh.pss1830metrics import Histogram, Metrics, Registry, command_verb
+
+def test_histogram():
+    histogram = Histogram(buckets=(1, 5))
+    for value in (0.5, 2, 10):
+        histogram.observe(value)
+    assert histogram.counts == [1, 2]
+    assert (histogram.count, histogram.sum) == (3, 12.5)
+
+def test_prometheus_text():
+    registry = Registry()
+    registry.histogram('latency_seconds', buckets=(1,), host='ne1').observe(0.5)
+    registry.counter('retries_total', host='ne1').inc(2)
+    text = registry.to_prometheus()
+    assert '# TYPE latency_seconds histogram' in text
+    assert 'latency_seconds_bucket{host="ne1",le="1"} 1' in text
+    assert 'latency_seconds_bucket{host="ne1",le="+Inf"} 1' in text
+    assert 'latency_seconds_count{host="ne1"} 1' in text
+    assert 'retries_total{host="ne1"} 2' in text
+
+def test_json():
+    registry = Registry()
+    registry.counter('retries_total', host='ne1').inc()
+    assert json.loads(registry.to_json()) == {
+        'retries_total': [{'labels': {'host': 'ne1'}, 'value': 1}]}
+
+@pytest.fixture(name="instrumented")
+def create_instrumented_pss(mocker):
+    mocker.patch('select.select', return_value=([], [], []))
+    pss = PSS1830('ne1', 22, 'admin', 'admin')
+    pss.metrics = Metrics()
+    mocker.patch.object(pss, 'client')
+    pss.open()
+    channel = mocker.patch.object(pss, 'channel')
+    pss.prompt = 'prompt#'
+    return pss, channel
+
+def test_session_phases(instrumented):
+    pss, channel = instrumented
+    channel.recv_ready.side_effect = [True, False]
+    channel.recv.side_effect = ['\r\nprompt# ']
+    pss._get_prompt(r'\n\w+# $')
+    registry = pss.metrics.registry
+    assert registry.histogram('pss1830_phase_seconds', phase='connect', host='ne1').count == 1
+    assert registry.histogram('pss1830_phase_seconds', phase='prompt', host='ne1').count == 1
+
+def test_command_timings(instrumented):
+    pss, channel = instrumented
+    channel.recv_ready.side_effect = [True, False]
+    channel.recv.side_effect = ['1830PSS\r\nprompt# ']
+    list(pss.execute('show version'))
+    registry = pss.metrics.registry
+    labels = dict(host='ne1', command='show version')
+    assert registry.histogram('pss1830_command_ttfb_seconds', **labels).count == 1
+    assert registry.histogram('pss1830_command_seconds', **labels).count == 1
+    assert registry.histogram('pss1830_command_bytes', **labels).sum == 17
+
+def test_command_incomplete(instrumented):
+    pss, channel = instrumented
+    channel.recv_ready.side_effect = [True] + [False] * 10
+    channel.recv.side_effect = ['partial']
+    with pytest.raises(CommandTimeout):
+        list(pss.execute('show version'))
+    registry = pss.metrics.registry
+    assert registry.counter('pss1830_command_incomplete_total',
+                            host='ne1', command='show version').value == 1
+
+def test_command_flow(instrumented):
+    pss, channel = instrumented
+    pss.stall_time = -1 # every chunk stalls
+    channel.recv_ready.side_effect = [True, False, True, False]
+    channel.recv.side_effect = ['output\r\n', 'prompt# ']
+    list(pss.execute('cat big'))
+    registry = pss.metrics.registry
+    labels = dict(host='ne1', command='cat big')
+    assert registry.histogram('pss1830_command_buffered_bytes', **labels).sum == 8
+    assert registry.counter('pss1830_command_stalls_total', **labels).value == 2
+
+def test_command_labelled_by_verb():
+    assert command_verb('show card inv 1/2') == 'show card inv'
+    assert command_verb('cat /proc/net/arp') == 'cat'
+    assert command_verb('ps -ef') == 'ps'
+    assert command_verb('./run.sh') == 'other'
+    metrics = Metrics()
+    metrics.command('ne1', 'show card inv 1/2', 0.1, 0.2, 10, 0)
+    metrics.command('ne1', 'show card inv 1/3', 0.1, 0.2, 10, 0)
+    assert metrics.registry.histogram(
+        'pss1830_command_seconds', host='ne1', command='show card inv').count == 2
+    metrics = Metrics(full_commands=True)
+    metrics.command('ne1', 'show card inv 1/2', 0.1, 0.2, 10, 0)
+    assert metrics.registry.histogram(
+        'pss1830_command_seconds', host='ne1', command='show card inv 1/2').count == 1
+
+def test_label_values_escaped():
+    registry = Registry()
+    registry.counter('events_total', host='a\\b"c\nd').inc()
+    assert 'events_total{host="a\\\\b\\"c\\nd"} 1' in registry.to_prometheus()
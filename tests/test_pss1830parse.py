@@ -0,0 +1,61 @@
+import pytest
+
+from pss1830ssh import pss1830parse
+from pss1830ssh.pss1830parse import Field, Row, TableParser, parse
+
+CARD_INV = (
+    'show card inv *\r\n'
+    'Location  Card Type  Part Number    Serial Number\r\n'
+    '--------  ---------  -------------  -------------\r\n'
+    '1/1       EC         3KC12345AAAA   ZZ1234567890\r\n'
+    '1/2       11STAR1    3KC12345BBBB   ZZ0987654321\r\n'
+    '1/3       Empty\r\n'
+    '\r\n'
+    'NE1# ')
+
+VERSION = (
+    'show version\r\n'
+    'Software\r\n'
+    '  Version : 10.0.2\r\n'
+    '  Built   : Mon Jan 1 12:30:00 2018\r\n'
+    'Hardware\r\n'
+    '  Shelf Type : PSS-32\r\n'
+    'NE1# ')
+
+def chunked(text, size):
+    return (text[i:i + size] for i in range(0, len(text), size))
+
+@pytest.mark.parametrize('size', [1, 7, 4096])
+def test_table(size):
+    rows = list(parse('show card inv *', chunked(CARD_INV, size)))
+    assert len(rows) == 3
+    assert rows[0] == Row('card inventory', {
+        'Location': '1/1', 'Card Type': 'EC',
+        'Part Number': '3KC12345AAAA', 'Serial Number': 'ZZ1234567890'})
+    assert rows[2].values['Card Type'] == 'Empty'
+    assert rows[2].values['Serial Number'] == ''
+
+@pytest.mark.parametrize('size', [1, 4096])
+def test_key_value(size):
+    fields = list(parse('show version', chunked(VERSION, size)))
+    assert fields == [
+        Field('Software', 'Version', '10.0.2'),
+        Field('Software', 'Built', 'Mon Jan 1 12:30:00 2018'),
+        Field('Hardware', 'Shelf Type', 'PSS-32')]
+
+def test_records_emitted_as_rows_complete():
+    def chunks():
+        yield CARD_INV[:CARD_INV.index('1/2')]
+        raise AssertionError('read past the first row')
+    rows = parse('show card inv *', chunks())
+    assert next(rows).values['Location'] == '1/1'
+
+def test_register(mocker):
+    mocker.patch.object(pss1830parse, 'PARSERS', list(pss1830parse.PARSERS))
+    pss1830parse.register(r'^show\s+xc', TableParser('xc', r'^\s*Id\b'))
+    rows = list(parse('show xc', ['show xc\r\nId  A    Z\r\n--  ---  ---\r\n1   1/2  1/3\r\n']))
+    assert rows == [Row('xc', {'Id': '1', 'A': '1/2', 'Z': '1/3'})]
+
+def test_no_parser():
+    with pytest.raises(ValueError):
+        parse('show foo', [])
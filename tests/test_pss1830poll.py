@@ -0,0 +1,120 @@
+import threading
+import time
+
+from pss1830ssh.pss1830 import PSSException
+from pss1830ssh.pss1830fleet import NE
+from pss1830ssh.pss1830parse import Row
+from pss1830ssh.pss1830poll import Poller, diff
+
+CARD_INV = (
+    'show card inv *\r\n'
+    'Location  Card Type  Part Number    Serial Number\r\n'
+    '--------  ---------  -------------  -------------\r\n'
+    '1/1       EC         3KC12345AAAA   ZZ1234567890\r\n'
+    '1/2       %-10s 3KC12345BBBB   ZZ0987654321\r\n'
+    '\r\n'
+    'NE1# ')
+
+
+class FakeSession(object):
+    outputs = {}
+    opened = []
+    started = []
+
+    def __init__(self, host, port, username, password):
+        self.host = host
+        self.connected = False
+
+    def open(self):
+        if self.host == 'bad':
+            raise PSSException('Failed to login')
+        FakeSession.opened.append(self.host)
+        self.connected = True
+
+    def execute(self, command):
+        FakeSession.started.append(time.time())
+        outputs = FakeSession.outputs[(self.host, command)]
+        return iter([outputs.pop(0) if len(outputs) > 1 else outputs[0]])
+
+    def close(self):
+        self.connected = False
+
+    def is_alive(self):
+        return self.connected
+
+
+def setup_function():
+    FakeSession.outputs = {}
+    FakeSession.opened = []
+    FakeSession.started = []
+
+def make_nes(*hosts):
+    return [NE(host, 22, 'admin', 'admin') for host in hosts]
+
+def test_diff_counts_repeats():
+    assert diff(['a', 'b', 'b'], ['b', 'c', 'b', 'b']) == (['c', 'b'], ['a'])
+    assert diff(['a'], ['a']) == ([], [])
+
+def test_only_changes_reported():
+    FakeSession.outputs = {
+        ('ne1', 'show alarms'): ['a1\r\na2\r\nNE1# ', 'a1\r\na2\r\nNE1# ', 'a2\r\na3\r\nNE1# '],
+        ('ne2', 'show alarms'): ['b1\r\nNE2# ']}
+    poller = Poller(make_nes('ne1', 'ne2'), ['show alarms'], interval=0.01, spread=0,
+                    session_class=FakeSession)
+    changes = list(poller.run(cycles=3))
+    ne1 = [(c.added, c.removed) for c in changes if c.host == 'ne1']
+    assert ne1 == [(['a1', 'a2', 'NE1# '], []), (['a3'], ['a1'])]
+    assert [c.added for c in changes if c.host == 'ne2'] == [['b1', 'NE2# ']]
+    assert sorted(FakeSession.opened) == ['ne1', 'ne2']
+
+def test_records_diffed():
+    FakeSession.outputs = {('ne1', 'show card inv *'): [CARD_INV % '11STAR1', CARD_INV % '11QPA4']}
+    poller = Poller(make_nes('ne1'), ['show card inv *'], interval=0.01, spread=0,
+                    session_class=FakeSession, initial=False)
+    changes = list(poller.run(cycles=2))
+    assert len(changes) == 1
+    assert changes[0].added[0] == Row('card inventory', {
+        'Location': '1/2', 'Card Type': '11QPA4',
+        'Part Number': '3KC12345BBBB', 'Serial Number': 'ZZ0987654321'})
+    assert changes[0].removed[0].values['Card Type'] == '11STAR1'
+
+def test_rate_limited():
+    hosts = ['ne%s' % i for i in range(5)]
+    for host in hosts:
+        FakeSession.outputs[(host, 'show version')] = ['v1']
+    poller = Poller(make_nes(*hosts), ['show version'], interval=10, spread=0, rate=20,
+                    session_class=FakeSession)
+    list(poller.run(cycles=1))
+    started = sorted(FakeSession.started)
+    assert all(b - a > 0.04 for a, b in zip(started, started[1:]))
+
+class FixedRandom(object):
+
+    def __init__(self, values):
+        self.values = list(values)
+
+    def uniform(self, low, high):
+        return self.values.pop(0)
+
+def test_rate_limited_after_idle():
+    FakeSession.outputs = {('ne1', 'show version'): ['v1'], ('ne2', 'show version'): ['v1']}
+    poller = Poller(make_nes('ne1', 'ne2'), ['show version'], interval=10, rate=10,
+                    session_class=FakeSession)
+    # both come due together, well after the rate would allow the first
+    poller._random = FixedRandom([0.3, 0.31])
+    list(poller.run(cycles=1))
+    first, second = sorted(FakeSession.started)
+    assert second - first > 0.09
+
+def test_failures_reported_and_stop():
+    FakeSession.outputs = {('ne1', 'show version'): ['v1']}
+    poller = Poller(make_nes('bad', 'ne1'), ['show version'], interval=0.01, spread=0,
+                    session_class=FakeSession)
+    errors = []
+    for change in poller.run():
+        if change.error is not None:
+            errors.append(change.error)
+        if len(errors) == 2:
+            threading.Thread(target=poller.stop).start()
+    assert all(isinstance(error, PSSException) for error in errors)
+    assert FakeSession.opened == ['ne1']
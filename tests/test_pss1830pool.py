@@ -0,0 +1,106 @@
+import pytest
+
+from pss1830ssh.pss1830pool import SessionPool
+
+
+class FakeSession(object):
+
+    def __init__(self, host, port, username, password):
+        self.host = host
+        self.password = password
+        self.connected = False
+        self.alive = True
+        self.opened = 0
+
+    def open(self):
+        self.opened += 1
+        if self.password == 'wrong':
+            self.connected = True # as if the transport was up
+            raise Exception('Authentication failed')
+        self.connected = True
+
+    def close(self):
+        self.connected = False
+
+    def is_alive(self):
+        return self.alive
+
+
+@pytest.fixture(name="pool")
+def create_pool():
+    pool = SessionPool(FakeSession, max_idle=2, ttl=60, idle_timeout=30, check_after=5)
+    yield pool
+    pool.close()
+
+def test_session_reused(pool):
+    with pool.session('ne1', 22, 'admin', 'admin') as first:
+        assert first.connected
+    with pool.session('ne1', 22, 'admin', 'admin') as second:
+        assert second is first
+    assert first.opened == 1
+    assert (pool.hits, pool.misses) == (1, 1)
+
+def test_different_hosts_not_shared(pool):
+    with pool.session('ne1', 22, 'admin', 'admin') as first:
+        with pool.session('ne2', 22, 'admin', 'admin') as second:
+            assert second is not first
+
+def test_broken_session_discarded(pool):
+    with pytest.raises(RuntimeError):
+        with pool.session('ne1', 22, 'admin', 'admin') as first:
+            raise RuntimeError('broken')
+    assert not first.connected
+    with pool.session('ne1', 22, 'admin', 'admin') as second:
+        assert second is not first
+
+def test_health_check_after_idle(pool, mocker):
+    with pool.session('ne1', 22, 'admin', 'admin') as first:
+        pass
+    first.alive = False
+    now = pool._idle[id(first)].last_used
+    mocker.patch('time.time', return_value=now + 10)
+    with pool.session('ne1', 22, 'admin', 'admin') as second:
+        assert second is not first
+    assert not first.connected
+
+def test_ttl_and_idle_timeout(pool, mocker):
+    with pool.session('ne1', 22, 'admin', 'admin') as first:
+        pass
+    now = pool._idle[id(first)].last_used
+    mocker.patch('time.time', return_value=now + 31)
+    pool.evict_expired()
+    assert not first.connected
+    assert not pool._idle
+
+def test_lru_eviction(pool):
+    sessions = []
+    for host in ['ne1', 'ne2', 'ne3']:
+        with pool.session(host, 22, 'admin', 'admin') as session:
+            sessions.append(session)
+    assert not sessions[0].connected
+    assert sessions[1].connected and sessions[2].connected
+
+def test_different_passwords_not_shared(pool):
+    with pool.session('ne1', 22, 'admin', 'admin') as first:
+        pass
+    with pool.session('ne1', 22, 'admin', 'other') as second:
+        assert second is not first
+    assert pool.hits == 0
+
+def test_failed_open_closed(pool, mocker):
+    opened = []
+    mocker.patch.object(FakeSession, 'close', lambda self: opened.append(self.connected))
+    with pytest.raises(Exception, match=r'Authentication failed'):
+        pool.acquire('ne1', 22, 'admin', 'wrong')
+    assert opened == [True]
+    assert not pool._in_use
+
+def test_session_discarded_when_abandoned(pool):
+    def use():
+        with pool.session('ne1', 22, 'admin', 'admin'):
+            yield
+    user = use()
+    next(user)
+    user.close() # GeneratorExit in the block
+    assert not pool._in_use
+    assert not pool._idle
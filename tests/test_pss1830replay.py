@@ -0,0 +1,72 @@
+import select
+import time
+
+import pytest
+
+from pss1830ssh.pss1830 import PSSException
+from pss1830ssh.pss1830cli import PSS1830Cli
+from pss1830ssh.pss1830fake import FakeNE
+from pss1830ssh.pss1830root import PSS1830Root
+from pss1830ssh.pss1830replay import Capture, ReplayChannel, ReplayClient, load
+
+
+def test_record_round_trip(tmp_path):
+    path = str(tmp_path / 'ne.cap')
+    data = b'a b\r\n\x03\xff\\n'
+    with Capture(path) as capture:
+        first = capture.opened('10.0.0.1')
+        second = capture.opened('10.0.0.2')
+        capture.record(first, 'r', data)
+        capture.record(second, 's', 'show version\n')
+    assert [[event[1:] for event in channel] for channel in load(path)] == [
+        [('o', b'10.0.0.1'), ('r', data)], [('o', b'10.0.0.2'), ('s', b'show version\n')]]
+    assert [len(channel) for channel in load(path, host='10.0.0.2')] == [2]
+
+def test_capture_and_replay(tmp_path):
+    path = str(tmp_path / 'ne.cap.gz')
+    with FakeNE() as ne, Capture(path) as capture:
+        cli = PSS1830Cli('127.0.0.1', ne.port, 'admin', 'admin')
+        cli.capture = capture
+        cli.open()
+        outputs = [''.join(cli.execute(command)) for command in ['show version', 'show card inv *']]
+        cli.close()
+    cli = PSS1830Cli('127.0.0.1', ne.port, 'admin', 'admin')
+    cli.client = ReplayClient(path, speed=None)
+    cli.open()
+    assert [''.join(cli.execute(command)) for command in ['show version', 'show card inv *']] == outputs
+    assert all(outputs)
+    cli.close()
+    with pytest.raises(PSSException):
+        cli.client.invoke_shell()
+
+@pytest.mark.parametrize('speed, low, high', [(1, 0.3, 1), (10, 0.03, 0.2), (None, 0, 0.05)])
+def test_replay_speed(speed, low, high):
+    channel = ReplayChannel([(0.0, 'o', b'ne'), (1.0, 's', b'x\n'), (1.3, 'r', b'out')], speed)
+    assert not channel.recv_ready()
+    start = time.time()
+    channel.sendall(b'x\n')
+    readable, _, _ = select.select([channel], [], [], 2)
+    assert readable and low <= time.time() - start < high
+    assert channel.recv(10) == b'out'
+    assert not channel.recv_ready()
+    assert not select.select([channel], [], [], 0)[0]
+    channel.close()
+
+def test_capture_redacts_credentials(tmp_path):
+    path = str(tmp_path / 'ne.cap')
+    with FakeNE(cli_users={'admin': 'Cli-s3cret'}, users={'cli': 'cli', 'root': 'R00t-pw'}) as ne, \
+            Capture(path) as capture:
+        cli = PSS1830Cli('127.0.0.1', ne.port, 'admin', 'Cli-s3cret')
+        cli.capture = capture
+        cli.open()
+        cli.close()
+        root = PSS1830Root('127.0.0.1', ne.port, 'root', 'R00t-pw')
+        root.capture = capture
+        root.open()
+        root.goto(2) # telnet login with a password
+        root.close()
+    with open(path, 'rb') as saved:
+        content = saved.read()
+    assert b'Cli-s3cret' not in content and b'R00t-pw' not in content
+    assert content.count(b'<redacted>') >= 2
+    assert b'admin' in content # the username is kept
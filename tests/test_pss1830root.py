@@ -1,8 +1,11 @@
 import logging
+import socket
+import time
 import pytest
 
-from pss1830ssh.pss1830root import PSS1830Root
+from pss1830ssh.pss1830root import PSS1830Root, Target
 from pss1830ssh.pss1830 import PSSException
+from pss1830ssh.pss1830metrics import Metrics
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -27,7 +30,7 @@ class Response(object):
 def create_mocked_pssroot(mocker):
     pss = PSS1830Root('localhost', 1234, 'root', 'testpass')
     pss.TIMEOUT = 1
-    pss.sleep_interval = 1
+    mocker.patch('select.select', return_value=([], [], []))
     mock_client = mocker.patch.object(pss, 'client')
     mock_channel = mocker.patch.object(pss, 'channel')
     mock_client.invoke_shell.return_value = mock_channel
@@ -60,7 +63,9 @@ def test_login_to_standby(mocked_pssroot):
         'Password:', None,
         'Welcome to MontaVista(R) Linux(R) Carrier Grade Edition 4.0 (0600995).\r\n'
         'root@EC1830-81-18-STDBY:/root\r\n# ', None,
-        'root@EC1830-81-1-ACT:/root# ',
+        '\r\nroot@EC1830-81-18-STDBY:/root\r\n# ', None,
+        'exit\r\nroot@EC1830-81-1-ACT:/root# ', None,
+        '\r\nroot@EC1830-81-1-ACT:/root# ',
     ])
 
     channel.recv_ready.side_effect = response.recv_ready
@@ -78,7 +83,9 @@ def test_login_to_slave_shelf(mocked_pssroot):
         'Password:', None,
         'Welcome to MontaVista(R) Linux(R) Carrier Grade Edition 4.0 (0600995).\r\n'
         'root@EC1830-2-1-ACT:/root\r\n# ', None,
-        'root@EC1830-81-1-ACT:/root# ',
+        '\r\nroot@EC1830-2-1-ACT:/root\r\n# ', None,
+        'exit\r\nroot@EC1830-81-1-ACT:/root# ', None,
+        '\r\nroot@EC1830-81-1-ACT:/root# ',
     ])
 
     channel.recv_ready.side_effect = response.recv_ready
@@ -95,7 +102,8 @@ def test_login_to_slave_shelf_no_ec_provided(mocked_pssroot):
             'Password:', None,
             'Welcome to MontaVista(R) Linux(R) Carrier Grade Edition 4.0 (0600995).\r\n'
             'root@EC1830-2-1-STDBY:/root\r\n# ', None,
-            'root@EC1830-81-1-ACT:/root# ', None,
+            'exit\r\nroot@EC1830-81-1-ACT:/root# ', None,
+            '\r\nroot@EC1830-81-1-ACT:/root# ', None,
             'EC1830-2-1 login:', None,
             'Password:', None,
             'Welcome to MontaVista(R) Linux(R) Carrier Grade Edition 4.0 (0600995).\r\n'
@@ -144,3 +152,267 @@ def test_login_to_slot_no_password_required(mocked_pssroot):
     pss.login_to_slot(shelf=2, slot=3)
     assert pss.is_on_active() is False
     assert pss.is_on_master()
+
+
+class FakeShell(object):
+    """A root shell channel answering telnet hops and commands."""
+
+    def __init__(self):
+        self.prompts = ['root@EC1830-81-18-ACT:/root# ']
+        self.out = 'Welcome\r\n' + self.prompts[-1]
+        self.login = None
+        self.closed = False
+
+    def sendall(self, data):
+        line = data.rstrip('\n')
+        if self.login and line == 'root':
+            self.out += 'Password: '
+        elif self.login:
+            self.prompts.append(self.login)
+            self.login = None
+            self.out += '\r\n' + self.prompts[-1]
+        elif line.startswith('telnet '):
+            shelf, card = [int(x) for x in line.split('.')[2:]]
+            if shelf == 9:
+                self.out += '\r\ntelnet: Unable to connect'
+            elif card in (1, 18):
+                state = 'ACT' if card == 1 else 'STDBY'
+                self.login = 'root@EC1830-%s-%s-%s:/root\r\n# ' % (shelf, card, state)
+            else:
+                self.login = 'root@slot-%s-%s:~# ' % (shelf, card)
+            self.out += '\r\nlogin: ' if self.login else ''
+        elif line == 'exit':
+            self.prompts.pop()
+            self.out += '\r\n' + (self.prompts[-1] if self.prompts else '')
+        elif line == '\x03':
+            self.out += '^C\r\n' + self.prompts[-1]
+        else:
+            where = self.prompts[-1].split(':')[0]
+            self.out += line + ('\r\n%s on %s' % (line, where) if line else '')
+            self.out += '\r\n' + self.prompts[-1]
+
+    def recv_ready(self):
+        return bool(self.out)
+
+    def recv(self, nbytes):
+        data, self.out = self.out[:nbytes], self.out[nbytes:]
+        return data
+
+    def settimeout(self, timeout):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture(name="fake_pssroot")
+def create_fake_pssroot(mocker):
+    pss = PSS1830Root('localhost', 1234, 'root', 'testpass')
+    pss.TIMEOUT = 1
+    mocker.patch('select.select', return_value=([], [], []))
+    mock_client = mocker.patch.object(pss, 'client')
+    mock_client.invoke_shell.side_effect = lambda: FakeShell()
+    pss.open()
+    return pss, mock_client
+
+def test_spawn_shares_transport(fake_pssroot):
+    pss, client = fake_pssroot
+    shell = pss.spawn()
+    assert shell.prompt == pss.prompt
+    assert shell.channel is not pss.channel
+    shell.close()
+    assert shell.channel.closed
+    client.close.assert_not_called()
+    assert pss.connected
+
+def test_spawn_copies_settings(fake_pssroot):
+    pss, _ = fake_pssroot
+    pss.metrics = Metrics()
+    pss.max_buffered = 8192
+    shell = pss.spawn()
+    assert shell.TIMEOUT == 1
+    assert shell.metrics is pss.metrics
+    assert shell._read_size == 8192
+    assert shell._wake is not None # cancel() can interrupt it
+    shell.close()
+    assert shell._wake is None
+
+class DyingShell(FakeShell):
+    """A root shell whose channel drops when telnetting to shelf 3."""
+
+    def sendall(self, data):
+        if self.closed:
+            raise socket.error('Socket is closed')
+        if data.startswith('telnet 100.0.3.'):
+            self.closed = True
+            raise socket.error('Socket is closed')
+        FakeShell.sendall(self, data)
+
+def test_close_spawned_dead_channel(fake_pssroot):
+    pss, client = fake_pssroot
+    client.invoke_shell.side_effect = lambda: DyingShell()
+    shell = pss.spawn()
+    shell.channel.closed = True
+    with pytest.raises(socket.error):
+        shell.close()
+    assert shell.connected is False
+    assert shell._wake is None
+    assert pss.connected
+
+def test_run_parallel_stopped_early(fake_pssroot, mocker):
+    pss, _ = fake_pssroot
+    run = []
+    def run_on(self, target, commands):
+        run.append(target)
+        time.sleep(0.05)
+        return []
+    mocker.patch.object(PSS1830Root, 'run_on', run_on)
+    results = pss.run_parallel([Target(2, slot) for slot in range(2, 20)], ['uptime'], max_shells=2)
+    next(results)
+    results.close() # the workers are stopped and joined
+    count = len(run)
+    assert count <= 4
+    time.sleep(0.2)
+    assert len(run) == count
+
+def test_run_parallel_dead_channel(fake_pssroot):
+    pss, client = fake_pssroot
+    client.invoke_shell.side_effect = lambda: DyingShell()
+    targets = [Target(shelf=3), Target(shelf=2)]
+    results = {r.target: r for r in pss.run_parallel(targets, ['uptime'], max_shells=1)}
+    assert isinstance(results[Target(shelf=3)].error, socket.error)
+    assert results[Target(shelf=2)].error is None
+
+def test_run_parallel_workers_died(fake_pssroot, mocker):
+    pss, _ = fake_pssroot
+    mocker.patch.object(pss, '_shell_worker')
+    results = list(pss.run_parallel([Target(shelf=2), Target(shelf=3)], ['uptime']))
+    assert sorted(r.target.shelf for r in results) == [2, 3]
+    assert all(isinstance(r.error, PSSException) for r in results)
+
+def test_run_parallel(fake_pssroot):
+    pss, client = fake_pssroot
+    targets = [Target(shelf=2), Target(shelf=3), dict(shelf=2, slot=5), Target(shelf=9)]
+    start = time.time()
+    results = {r.target: r for r in pss.run_parallel(targets, ['uptime'])}
+    assert time.time() - start < 2.5
+    assert results[Target(shelf=2)].outputs[0][1].startswith('uptime\r\nuptime on root@EC1830-2-1-ACT')
+    assert 'uptime on root@slot-2-5' in results[Target(shelf=2, slot=5)].outputs[0][1]
+    assert results[Target(shelf=3)].error is None
+    assert isinstance(results[Target(shelf=9)].error, PSSException)
+    assert pss.is_on_active() and pss.is_on_master()
+
+def test_goto_minimal_hops(fake_pssroot):
+    pss, _ = fake_pssroot
+    pss.goto(2)
+    assert pss.prompt.startswith('root@EC1830-2-1-ACT')
+    assert pss.is_on_master() is False
+    pss.goto(2, slot=5)
+    assert pss.position == [Target(2, None, 1, True), Target(2, 5)]
+    assert pss.telnets == 2
+    pss.goto(2, slot=5)
+    pss.goto(2, slot=6)
+    assert pss.position == [Target(2, None, 1, True), Target(2, 6)]
+    assert pss.telnets == 3
+    pss.goto(3)
+    assert pss.position == [Target(3, None, 1, True)]
+    assert pss.telnets == 4
+    pss.goto(81)
+    assert pss.position == []
+    assert pss.is_on_active() and pss.is_on_master()
+
+def test_active_ec_cache(fake_pssroot):
+    pss, _ = fake_pssroot
+    assert pss.active_ec == {81: 18}
+    pss.goto(2, act=False) # tries EC 1 first and learns it is active
+    assert pss.telnets == 2
+    assert pss.active_ec[2] == 1
+    pss.goto(3)
+    pss.goto(2, act=False) # goes straight to EC 18
+    assert pss.telnets == 4
+    assert pss.prompt.startswith('root@EC1830-2-18-STDBY')
+
+def test_active_ec_cache_invalidated(fake_pssroot):
+    pss, _ = fake_pssroot
+    pss.active_ec[9] = 1
+    with pytest.raises(PSSException):
+        pss.goto(9)
+    assert 9 not in pss.active_ec
+
+def test_sweep_telnets(fake_pssroot):
+    pss, _ = fake_pssroot
+    targets = []
+    for shelf in range(2, 6):
+        targets.append(Target(shelf, act=False))
+        targets.extend(Target(shelf, slot) for slot in range(2, 7))
+        targets.append(Target(shelf, act=False))
+    for target in targets:
+        pss.goto(*target)
+    # login_to_*/logout_from_* per target would need 4 * (2 + 5 + 2) telnets
+    assert pss.telnets == 4 * (2 + 5)
+
+def test_sweep_slots(fake_pssroot):
+    pss, _ = fake_pssroot
+    results = list(pss.sweep_slots(2, range(2, 10), ['uptime']))
+    assert sorted(r.target.slot for r in results) == list(range(2, 10))
+    for result in results:
+        assert 'uptime on root@slot-2-%s' % result.target.slot in result.outputs[0][1]
+    assert pss.position == []
+
+def test_sweep_slots_session_limit(fake_pssroot):
+    pss, client = fake_pssroot
+    shells = []
+    calls = []
+    def invoke_shell():
+        calls.append(time.sleep(0.05)) # every worker gets a target first
+        if len(shells) == 3:
+            raise Exception('Administratively prohibited')
+        shells.append(FakeShell())
+        return shells[-1]
+    client.invoke_shell.side_effect = invoke_shell
+    results = list(pss.sweep_slots(2, range(2, 12), ['uptime'], max_shells=10))
+    assert sorted(r.target.slot for r in results) == list(range(2, 12))
+    assert all(r.error is None for r in results)
+    assert len(shells) == 3 and len(calls) > 3
+
+def test_sweep_slots_no_shell(fake_pssroot):
+    pss, client = fake_pssroot
+    client.invoke_shell.side_effect = Exception('Administratively prohibited')
+    results = list(pss.sweep_slots(2, [2, 3], ['uptime']))
+    assert sorted(r.target.slot for r in results) == [2, 3]
+    assert all('prohibited' in str(r.error) for r in results)
+
+def test_sweep_slots_isolates_errors(fake_pssroot):
+    pss, _ = fake_pssroot
+    results = list(pss.sweep_slots(9, [2, 3], ['uptime']))
+    assert all(isinstance(r.error, PSSException) for r in results)
+    assert ''.join(pss.execute('uptime')).startswith('uptime\r\nuptime on root@EC1830-81-18-ACT')
+
+def test_run_on_all_ecs(fake_pssroot):
+    pss, _ = fake_pssroot
+    results = pss.run_on_all_ecs(['uptime'], shelves=[2, 9])
+    assert list(results) == [Target(2, None, 1, True), Target(2, None, 18, False),
+                             Target(9, None, None, True), Target(9, None, None, False)]
+    assert 'uptime on root@EC1830-2-18-STDBY' in results[Target(2, None, 18, False)].outputs[0][1]
+    assert all(isinstance(r.error, PSSException) for r in list(results.values())[2:])
+    results = pss.run_on_all_ecs(['uptime'], include_standby=False, shelves=[2])
+    assert list(results) == [Target(2, None, 1, True)]
+
+
+def test_telnet_steps_without_io():
+    pss = PSS1830Root('localhost', 1234, 'root', 'testpass')
+    steps = pss._telnet_steps('100.0.81.2')
+    assert next(steps) == ('send', 'telnet 100.0.81.2')
+    assert steps.send(None)[0] == 'expect'
+    assert steps.send(pss.LOGIN_RE.search('login:')) == ('send', 'root')
+    assert steps.send(None) == ('expect', pss.TELNET_AUTH_RE)
+    assert steps.send(pss.TELNET_AUTH_RE.search('Password:')) == ('send', 'testpass')
+    steps.send(None)
+    assert steps.send(pss.telnet_prompt_re.search('root@CARD# ')) == ('give', True)
+    assert pss.telnets == 1
+
+    steps = pss._telnet_steps('100.0.81.3')
+    next(steps)
+    steps.send(None)
+    assert steps.send(None) == ('cancel',)
+    assert steps.send(None) == ('give', False)
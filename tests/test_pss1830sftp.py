@@ -0,0 +1,170 @@
+import io
+import os
+import pytest
+import paramiko
+
+from pss1830ssh.pss1830 import PSSException
+from pss1830ssh.pss1830sftp import Transfer
+
+
+class FakeFile(io.FileIO):
+
+    fail_after = None
+    prefetched = []
+
+    def prefetch(self, size):
+        FakeFile.prefetched.append(size)
+
+    def set_pipelined(self, pipelined):
+        pass
+
+    def read(self, size=-1):
+        if FakeFile.fail_after is not None:
+            if FakeFile.fail_after <= 0:
+                raise IOError('Connection lost')
+            FakeFile.fail_after -= 1
+        return super(FakeFile, self).read(size)
+
+
+class LocalSFTP(object):
+    """SFTP client working on a local directory standing in for the NE."""
+
+    def __init__(self, opened):
+        self.opened = opened
+
+    def stat(self, path):
+        return paramiko.SFTPAttributes.from_stat(os.stat(path))
+
+    def listdir_attr(self, path):
+        return [paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(path, f)), f)
+                for f in sorted(os.listdir(path))]
+
+    def open(self, path, mode):
+        return FakeFile(path, mode.replace('b', ''))
+
+    def listdir(self, path):
+        return os.listdir(path)
+
+    def mkdir(self, path):
+        os.mkdir(path)
+
+    def remove(self, path):
+        os.remove(path)
+
+    def utime(self, path, times):
+        os.utime(path, times)
+
+    def posix_rename(self, old, new):
+        os.rename(old, new)
+
+    def close(self):
+        self.opened.remove(self)
+
+
+class FakeClient(object):
+
+    def __init__(self):
+        self.opened = []
+        self.channels = 0
+
+    def open_sftp(self):
+        self.channels += 1
+        sftp = LocalSFTP(self.opened)
+        self.opened.append(sftp)
+        return sftp
+
+
+@pytest.fixture(autouse=True)
+def reset_failures():
+    FakeFile.fail_after = None
+    FakeFile.prefetched = []
+
+@pytest.fixture(name="remote")
+def create_remote_tree(tmpdir):
+    remote = tmpdir.mkdir('remote')
+    remote.join('a.log').write(b'a' * 100000, 'wb')
+    remote.join('b.log').write(b'b' * 5000, 'wb')
+    remote.mkdir('sub').join('c.log').write(b'c' * 7000, 'wb')
+    return remote
+
+def test_get_recursive(remote, tmpdir):
+    client = FakeClient()
+    progress = []
+    local = tmpdir.join('local')
+    files = Transfer(client, workers=2, callback=lambda d, t: progress.append((d, t))).get(
+        str(remote), str(local))
+    assert len(files) == 3
+    assert local.join('sub', 'c.log').read() == 'c' * 7000
+    assert local.join('a.log').size() == 100000
+    assert progress[-1] == (112000, 112000)
+    assert client.channels <= 3 # one to walk and at most one per worker
+    assert not client.opened
+
+def test_get_not_recursive(remote, tmpdir):
+    local = tmpdir.join('local')
+    files = Transfer(FakeClient()).get(str(remote), str(local), recursive=False)
+    assert sorted(os.path.basename(f.dest) for f in files) == ['a.log', 'b.log']
+
+def test_get_single_file(remote, tmpdir):
+    local = tmpdir.join('b.log')
+    Transfer(FakeClient()).get(str(remote.join('b.log')), str(local))
+    assert local.read() == 'b' * 5000
+
+def test_get_skips_unchanged(remote, tmpdir):
+    local = tmpdir.join('local')
+    Transfer(FakeClient()).get(str(remote), str(local))
+    remote.join('b.log').write(b'B' * 5000, 'wb')
+    os.utime(str(remote.join('b.log')), (1, 1))
+    files = Transfer(FakeClient()).get(str(remote), str(local))
+    assert [f.skipped for f in files] == [True, False, True]
+    assert local.join('b.log').read() == 'B' * 5000
+
+def test_get_resumes_partial(remote, tmpdir):
+    local = tmpdir.join('local')
+    FakeFile.fail_after = 1
+    with pytest.raises(PSSException, match=r'Failed to transfer'):
+        Transfer(FakeClient(), workers=1, block_size=32768).get(
+            str(remote.join('a.log')), str(local))
+    [part] = tmpdir.listdir('local.*.part')
+    assert part.size() == 32768
+    FakeFile.fail_after = None
+    FakeFile.prefetched = []
+    progress = []
+    Transfer(FakeClient(), callback=lambda d, t: progress.append(d)).get(
+        str(remote.join('a.log')), str(local))
+    assert progress[0] == 32768
+    assert FakeFile.prefetched == [100000] # up to the end, not the length left
+    assert local.read() == 'a' * 100000
+    assert not tmpdir.listdir('local.*.part')
+
+def test_get_discards_partial_of_changed_file(remote, tmpdir):
+    local = tmpdir.join('local')
+    FakeFile.fail_after = 1
+    with pytest.raises(PSSException, match=r'Failed to transfer'):
+        Transfer(FakeClient(), workers=1, block_size=32768).get(
+            str(remote.join('a.log')), str(local))
+    FakeFile.fail_after = None
+    remote.join('a.log').write(b'A' * 90000, 'wb')
+    progress = []
+    Transfer(FakeClient(), callback=lambda d, t: progress.append(d)).get(
+        str(remote.join('a.log')), str(local))
+    assert progress[0] == 0
+    assert local.read() == 'A' * 90000
+    assert not tmpdir.listdir('local.*.part')
+
+def test_put_recursive(remote, tmpdir):
+    target = tmpdir.join('target')
+    files = Transfer(FakeClient(), workers=3).put(str(remote), str(target))
+    assert len(files) == 3
+    assert target.join('sub', 'c.log').read() == 'c' * 7000
+    files = Transfer(FakeClient()).put(str(remote), str(target))
+    assert all(f.skipped for f in files)
+
+def test_put_discards_partial_of_changed_file(remote, tmpdir):
+    # left by interrupted transfers of an older a.log
+    tmpdir.join('target.log.100000-1.part').write(b'x' * 32768, 'wb')
+    tmpdir.join('target.log.part').write(b'x' * 32768, 'wb')
+    tmpdir.join('target.log.1.100000-1.part').write(b'x' * 32768, 'wb')
+    Transfer(FakeClient()).put(str(remote.join('a.log')), str(tmpdir.join('target.log')))
+    assert tmpdir.join('target.log').read() == 'a' * 100000
+    assert [p.basename for p in tmpdir.listdir('target.log.*part')] == ['target.log.1.100000-1.part']
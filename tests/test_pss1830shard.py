@@ -0,0 +1,62 @@
+import os
+
+from pss1830ssh.pss1830 import PSSException
+from pss1830ssh.pss1830fleet import NE
+from pss1830ssh.pss1830shard import ShardedRunner
+
+
+class FakeSession(object):
+    TIMEOUT = 30
+
+    def __init__(self, host, port, username, password):
+        self.host = host
+
+    def open(self):
+        if self.host == 'crash':
+            os._exit(3)
+        if self.host == 'bad':
+            raise PSSException('Failed to login')
+
+    def execute(self, command, timeout=None):
+        return iter(['%s on %s in %s' % (command, self.host, os.getpid())])
+
+    def close(self):
+        pass
+
+
+def make_nes(count):
+    return [NE('10.0.0.%s' % i, 22, 'admin', 'admin') for i in range(count)]
+
+def test_shard_by_host():
+    runner = ShardedRunner(processes=3)
+    nes = make_nes(30) + make_nes(30)
+    shards = runner.shard(nes)
+    assert sorted(sum(shards, [])) == sorted(nes)
+    for shard in shards:
+        for other in shards:
+            if other is not shard:
+                assert not set(shard) & set(other)
+
+def test_run_across_processes():
+    runner = ShardedRunner(processes=3, session_class=FakeSession, workers=2)
+    nes = make_nes(12)
+    results = list(runner.run(nes, ['show version']))
+    assert len(results) == 12
+    assert all(r.ok for r in results)
+    pids = set(r.outputs[0][1].split()[-1] for r in results)
+    assert len(pids) == len([shard for shard in runner.shard(nes) if shard]) > 1
+    assert str(os.getpid()) not in pids
+
+def test_failures_reported():
+    runner = ShardedRunner(processes=2, session_class=FakeSession, retries=0)
+    nes = [NE('bad', 22, 'admin', 'admin')] + make_nes(3)
+    results = dict((r.host, r) for r in runner.run(nes, ['show version']))
+    assert isinstance(results['bad'].error, PSSException)
+    assert sum(1 for r in results.values() if r.ok) == 3
+
+def test_crashed_process_fails_its_nes():
+    runner = ShardedRunner(processes=1, session_class=FakeSession, workers=1)
+    nes = [NE('crash', 22, 'admin', 'admin')] + make_nes(2)
+    results = list(runner.run(nes, ['show version']))
+    assert len(results) == 3
+    assert all('exited with code 3' in str(r.error) for r in results)
@@ -0,0 +1,81 @@
+import bz2
+import gzip
+import io
+import os
+
+import pytest
+
+from pss1830ssh.pss1830 import PSS1830, PSSException
+from pss1830ssh.pss1830sink import SinkLayout, open_file
+
+OUTPUT = ['show card inv *\r\n', '1/1  11STAR1\r\n' * 100, 'NE1# ']
+
+
+@pytest.fixture(autouse=True)
+def no_wait(mocker):
+    mocker.patch('select.select', return_value=([], [], []))
+
+@pytest.fixture(name="pss")
+def create_connected_pss(mocker):
+    pss = PSS1830('localhost', 22, 'test', 'test')
+    mocker.patch.object(pss, 'client')
+    pss.open()
+    pss.channel = mocker.Mock()
+    pss.prompt = 'NE1#'
+    pss.channel.recv_ready.side_effect = [True] * len(OUTPUT) + [False]
+    pss.channel.recv.side_effect = [data.encode() for data in OUTPUT]
+    return pss
+
+def test_sink_path(pss, tmpdir):
+    path = str(tmpdir.join('inv.txt'))
+    assert pss.execute('show card inv *', sink=path) == len(''.join(OUTPUT))
+    with open(path, 'rb') as f:
+        assert f.read().decode() == ''.join(OUTPUT)
+
+def test_sink_file_object(pss):
+    output = io.BytesIO()
+    pss.execute('show card inv *', sink=output)
+    assert output.getvalue().decode() == ''.join(OUTPUT)
+    assert not output.closed
+
+def test_sink_callback(pss):
+    chunks = []
+    pss.execute('show card inv *', sink=chunks.append)
+    assert [chunk.decode() for chunk in chunks] == [''.join(OUTPUT)]
+
+def test_sink_layout(pss, tmpdir):
+    layout = SinkLayout(str(tmpdir), compression='gz')
+    pss.execute('show card inv *', sink=layout)
+    directory = tmpdir.join('localhost', 'show_card_inv')
+    files = directory.listdir()
+    assert len(files) == 1 and files[0].basename.endswith('.txt.gz')
+    with gzip.open(str(files[0])) as f:
+        assert f.read().decode() == ''.join(OUTPUT)
+
+def test_layout_keeps_latest(tmpdir):
+    layout = SinkLayout(str(tmpdir), compression=None, keep=2)
+    paths = []
+    for index in range(4):
+        output = layout.open('ne1', 'show version')
+        output.write(str(index).encode())
+        output.close()
+        paths.append(output.name)
+    directory = os.path.dirname(paths[0])
+    assert sorted(os.listdir(directory)) == [os.path.basename(p) for p in paths[2:]]
+
+@pytest.mark.parametrize('name, read', [
+    ('out.gz', lambda path: gzip.open(path).read()),
+    ('out.bz2', lambda path: bz2.BZ2File(path).read()),
+    ('out.xz', lambda path: __import__('lzma').open(path).read()),
+])
+def test_compression_by_extension(tmpdir, name, read):
+    path = str(tmpdir.join(name))
+    output = open_file(path)
+    output.write(b'data' * 1000)
+    output.close()
+    assert read(path) == b'data' * 1000
+    assert os.path.getsize(path) < 4000
+
+def test_unknown_compression(tmpdir):
+    with pytest.raises(PSSException, match='Unknown compression'):
+        open_file(str(tmpdir.join('out')), 'rar')
@@ -0,0 +1,64 @@
+import paramiko
+import pytest
+
+from pss1830ssh.pss1830cli import PSS1830Cli
+from pss1830ssh.pss1830fake import FakeNE
+from pss1830ssh.pss1830transport import TransportConfig, _preferred
+
+
+@pytest.fixture(name="ne", scope="module")
+def start_fake_ne():
+    with FakeNE() as ne:
+        yield ne
+
+def open_cli(ne, config):
+    cli = PSS1830Cli('127.0.0.1', ne.port, 'admin', 'admin')
+    cli.transport_config = config
+    cli.open()
+    return cli
+
+def test_preferred():
+    assert _preferred(('c', 'x', 'b'), ('a', 'b', 'c')) == ('c', 'b', 'a')
+
+def test_known_hosts_saved_and_reused(ne, tmpdir):
+    path = str(tmpdir.join('known_hosts'))
+    cli = open_cli(ne, TransportConfig(known_hosts=path))
+    cli.close()
+    name = '[127.0.0.1]:%s' % ne.port
+    assert paramiko.HostKeys(path).lookup(name)
+    # a new config trusts the saved key, even when strict
+    cli = open_cli(ne, TransportConfig(known_hosts=path, strict=True))
+    assert ''.join(cli.execute('show version'))
+    cli.close()
+
+def test_strict_rejects_unknown_host(ne, tmpdir):
+    with pytest.raises(paramiko.SSHException, match='Unknown host key'):
+        open_cli(ne, TransportConfig(known_hosts=str(tmpdir.join('known_hosts')), strict=True))
+
+def test_changed_host_key_rejected(ne):
+    config = TransportConfig()
+    config.add_host_key('[127.0.0.1]:%s' % ne.port, paramiko.ECDSAKey.generate())
+    with pytest.raises(paramiko.BadHostKeyException):
+        open_cli(ne, config)
+
+def test_transport_settings(ne):
+    config = TransportConfig(ciphers=('aes256-ctr',), compress=True, keepalive=5)
+    cli = open_cli(ne, config)
+    transport = cli.client.get_transport()
+    assert transport.local_cipher == 'aes256-ctr'
+    assert cli.is_alive(probe=False)
+    transport.close()
+    assert not cli.is_alive(probe=False)
+
+def test_preferences_renegotiated_without_transport_factory(ne, mocker):
+    connect = paramiko.SSHClient.connect
+
+    def old_connect(self, hostname, port, username, password, **kwargs):
+        # SSHClient.connect before paramiko 3.2
+        return connect(self, hostname, port, username, password, **kwargs)
+
+    mocker.patch.object(paramiko.SSHClient, 'connect', old_connect)
+    cli = open_cli(ne, TransportConfig(ciphers=('aes256-ctr',)))
+    assert cli.client.get_transport().local_cipher == 'aes256-ctr'
+    assert ''.join(cli.execute('show version'))
+    cli.close()